@@ -0,0 +1,54 @@
+"""
+Consumer throughput of NotificationService reading from the in-process event bus
+"""
+import asyncio
+import json
+import time
+from shared.event_bus import EventBus, LocalConsumer, LocalProducer
+
+TOPICS = ("user.created", "task.created")
+
+
+def publish_events(bus, count):
+    producer = LocalProducer(bus)
+    for i in range(count):
+        if i % 2:
+            topic, event = "user.created", {"id": i, "username": f"user{i}", "email": f"user{i}@example.com", "event_type": "user.created"}
+        else:
+            topic, event = "task.created", {"id": i, "title": f"task {i}", "description": None, "user_id": i % 100, "event_type": "task.created"}
+        producer.produce(topic, key=str(i), value=json.dumps(event).encode("utf-8"))
+
+
+async def consume_until_caught_up(service, bus, topics=TOPICS):
+    """Run the service until its group has committed everything on ``topics``."""
+    async def stop_when_caught_up():
+        while bus.lag(service.group_id, topics):
+            await asyncio.sleep(0.005)
+        service.stop()
+
+    await asyncio.gather(service.consume_events(), stop_when_caught_up())
+
+
+async def run_consumer_bench(events=20000, batch_size=500, workers=8, partitions=6):
+    from services.notification_service.app.main import NotificationService
+
+    bus = EventBus(partitions)
+    publish_events(bus, events)
+    service = NotificationService(
+        consumer=LocalConsumer(bus, NotificationService.group_id),
+        batch_size=batch_size,
+        workers=workers,
+        poll_timeout=0.05,
+    )
+
+    start = time.perf_counter()
+    await consume_until_caught_up(service, bus)
+    elapsed = time.perf_counter() - start
+    return {
+        "name": "notification.consume",
+        "events": events,
+        "batch_size": batch_size,
+        "workers": workers,
+        "elapsed_seconds": round(elapsed, 4),
+        "throughput_per_second": round(events / elapsed, 2),
+    }
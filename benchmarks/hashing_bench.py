@@ -0,0 +1,41 @@
+"""
+Password hashing throughput, for sizing user-service pods
+"""
+import os
+import time
+
+
+async def run_hashing_bench(hashes=200, workers=None, kind="thread"):
+    from services.user_service.app.passwords import PasswordHasherPool
+
+    results = []
+    cores = os.cpu_count() or 1
+    counts = sorted({1, workers or cores})
+    for count in counts:
+        pool = PasswordHasherPool(workers=count, kind=kind)
+        try:
+            # Start the workers so the pool spin-up is not timed
+            await pool.hash_many(["warm-up"] * count)
+            start = time.perf_counter()
+            hashed = await pool.hash_many([f"password-{i}" for i in range(hashes)])
+            hash_elapsed = time.perf_counter() - start
+
+            start = time.perf_counter()
+            for password_hash in hashed[:count * 4]:
+                await pool.verify(password_hash, "wrong-password")
+            verify_elapsed = time.perf_counter() - start
+        finally:
+            pool.shutdown()
+
+        throughput = hashes / hash_elapsed
+        results.append({
+            "name": f"passwords.hash.{kind}.{count}",
+            "workers": count,
+            "time_cost": pool.params[0],
+            "memory_cost_kib": pool.params[1],
+            "throughput_per_second": round(throughput, 2),
+            "hashes_per_second_per_core": round(throughput / min(count, cores), 2),
+            "hash_ms": round(hash_elapsed / hashes * 1000, 3),
+            "verify_ms": round(verify_elapsed / (count * 4) * 1000, 3),
+        })
+    return results
@@ -0,0 +1,108 @@
+"""
+HTTP workloads against the user and task services
+
+Runs the FastAPI apps in-process through httpx's ASGI transport, or against
+already running services when base URLs are given.
+"""
+import asyncio
+import itertools
+import time
+import uuid
+import httpx
+from shared.event_bus import EventBus, LocalProducer
+from shared.kafka_producer import KafkaProducer
+from shared.migrations import upgrade
+from .report import summarize
+
+
+def create_user(client, i, state):
+    name = f"bench_{state['run_id']}_{i}"
+    return client.post("/users/", json={"username": name, "email": f"{name}@example.com", "password": "benchpass"})
+
+
+def list_users(client, i, state):
+    return client.get("/users/", params={"limit": 100})
+
+
+def get_user(client, i, state):
+    return client.get(f"/users/{state['user_ids'][i % len(state['user_ids'])]}")
+
+
+def create_task(client, i, state):
+    return client.post("/tasks/", json={"title": f"bench task {i}", "user_id": i % state["users"]})
+
+
+def list_tasks(client, i, state):
+    return client.get("/tasks/", params={"limit": 100})
+
+
+def get_tasks_by_user(client, i, state):
+    return client.get(f"/tasks/user/{i % state['users']}")
+
+
+WORKLOADS = {
+    "user": [("users.create", create_user), ("users.list", list_users), ("users.get", get_user)],
+    "task": [("tasks.create", create_task), ("tasks.list", list_tasks), ("tasks.by_user", get_tasks_by_user)],
+}
+
+
+async def run_workload(client, name, request, total, concurrency, state):
+    """Issue ``total`` requests from ``concurrency`` concurrent clients and summarize them."""
+    latencies = []
+    errors = 0
+    counter = itertools.count()
+
+    async def worker():
+        nonlocal errors
+        while (i := next(counter)) < total:
+            start = time.perf_counter()
+            response = await request(client, i, state)
+            latencies.append(time.perf_counter() - start)
+            if response.status_code >= 400:
+                errors += 1
+            elif name == "users.create":
+                state["user_ids"].append(response.json()["id"])
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return summarize(name, latencies, time.perf_counter() - start, errors)
+
+
+def in_process_app(service, bus=None):
+    """Import a migrated service app with its outbox relay publishing to an in-process bus."""
+    if service == "user":
+        from services.user_service.app.db import Base, engine
+        from services.user_service.app.main import app, outbox_relay
+    else:
+        from services.task_service.app.db import Base, engine
+        from services.task_service.app.main import app, outbox_relay
+    upgrade(engine, Base.metadata)
+    outbox_relay.producer = KafkaProducer("in-process", f"{service}-bench", producer=LocalProducer(bus or EventBus()))
+    return app, outbox_relay
+
+
+async def run_http_suite(requests=1000, concurrency=16, users=100, base_urls=None, workloads=None):
+    base_urls = base_urls or {}
+    state = {"run_id": uuid.uuid4().hex[:8], "user_ids": [], "users": users}
+    results = []
+    for service, service_workloads in WORKLOADS.items():
+        relay = None
+        if service in base_urls:
+            client = httpx.AsyncClient(base_url=base_urls[service], timeout=30)
+        else:
+            app, relay = in_process_app(service)
+            relay.start()
+            client = httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://bench")
+        try:
+            async with client:
+                for name, request in service_workloads:
+                    if workloads and name not in workloads:
+                        continue
+                    if name == "users.get" and not state["user_ids"]:
+                        continue
+                    results.append(await run_workload(client, name, request, requests, concurrency, state))
+        finally:
+            if relay is not None:
+                relay.stop()
+                relay.producer.close()
+    return results
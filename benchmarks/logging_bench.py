@@ -0,0 +1,43 @@
+"""
+Consumer throughput with synchronous logging and with the shared logging setup
+
+``sync`` is the setup the services had before shared/logs.py: basicConfig() at
+INFO, every record formatted and written by the thread that logs it. ``queued``
+is setup_logging() with the LOG_* defaults: JSON records handed to a background
+writer, high-volume categories sampled. Both write to os.devnull, so the
+numbers compare the cost in the logging thread rather than the terminal.
+"""
+import logging
+import os
+from shared.logs import setup_logging, shutdown_logging
+from .consumer_bench import run_consumer_bench
+
+
+def _configure(mode, stream):
+    if mode == "sync":
+        logging.basicConfig(level=logging.INFO, stream=stream, force=True)
+    else:
+        setup_logging("benchmark", level="INFO", stream=stream, force=True)
+
+
+async def run_logging_bench(events=20000, batch_size=500, workers=8):
+    root = logging.getLogger()
+    saved_handlers, saved_level = root.handlers[:], root.level
+    results = []
+    with open(os.devnull, "w") as devnull:
+        try:
+            for mode in ("sync", "queued"):
+                for handler in root.handlers[:]:
+                    root.removeHandler(handler)
+                _configure(mode, devnull)
+                result = await run_consumer_bench(events, batch_size, workers)
+                shutdown_logging()
+                results.append({**result, "name": f"logging.consume.{mode}"})
+        finally:
+            shutdown_logging()
+            for handler in root.handlers[:]:
+                root.removeHandler(handler)
+            for handler in saved_handlers:
+                root.addHandler(handler)
+            root.setLevel(saved_level)
+    return results
@@ -0,0 +1,63 @@
+"""
+End-to-end create-to-notify latency on one machine
+
+Tasks are created through the in-process task service; its outbox relay
+publishes task.created to an in-process event bus, where NotificationService
+consumes them. Latency is measured from sending the create request until the
+notification handler runs for that task.
+"""
+import asyncio
+import itertools
+import time
+import httpx
+from shared.event_bus import EventBus, LocalConsumer
+from .http_bench import in_process_app
+from .report import summarize
+
+
+async def run_pipeline_bench(requests=1000, concurrency=16, users=100, relay_interval=0.01):
+    from services.notification_service.app.main import NotificationService
+
+    bus = EventBus()
+    app, relay = in_process_app("task", bus)
+    relay.poll_interval = relay_interval
+    service = NotificationService(
+        consumer=LocalConsumer(bus, NotificationService.group_id), topics=("task.created",), poll_timeout=0.05
+    )
+    sent = {}
+    notified = {}
+    errors = 0
+
+    def record_notification(event_data):
+        # May run before the create response has reached the client
+        notified[event_data["id"]] = time.perf_counter()
+
+    service.handlers["task.created"] = record_notification
+    counter = itertools.count()
+
+    async def worker(client):
+        nonlocal errors
+        while (i := next(counter)) < requests:
+            start = time.perf_counter()
+            response = await client.post("/tasks/", json={"title": f"pipeline task {i}", "user_id": i % users})
+            if response.status_code >= 400:
+                errors += 1
+            else:
+                sent[response.json()["id"]] = start
+
+    consuming = asyncio.create_task(service.consume_events())
+    relay.start()
+    start = time.perf_counter()
+    try:
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://bench") as client:
+            await asyncio.gather(*(worker(client) for _ in range(concurrency)))
+        while not notified.keys() >= sent.keys():
+            await asyncio.sleep(0.005)
+        elapsed = time.perf_counter() - start
+    finally:
+        relay.stop()
+        relay.producer.close()
+        service.stop()
+        await consuming
+    latencies = [notified[task_id] - started for task_id, started in sent.items()]
+    return [summarize("pipeline.task_created_to_notified", latencies, elapsed, errors)]
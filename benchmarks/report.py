@@ -0,0 +1,77 @@
+"""
+Latency summaries, JSON result files and regression checks for benchmark runs
+"""
+import json
+import math
+import os
+import platform
+import subprocess
+import time
+
+
+def percentile(ordered, q):
+    """Nearest-rank percentile of an already sorted list."""
+    if not ordered:
+        return 0.0
+    return ordered[max(0, math.ceil(q * len(ordered)) - 1)]
+
+
+def summarize(name, latencies, elapsed, errors=0):
+    """Throughput and latency percentiles (in ms) for one workload."""
+    ordered = sorted(latencies)
+    return {
+        "name": name,
+        "requests": len(ordered),
+        "errors": errors,
+        "elapsed_seconds": round(elapsed, 4),
+        "throughput_per_second": round(len(ordered) / elapsed, 2) if elapsed else 0.0,
+        "latency_ms": {
+            "mean": round(sum(ordered) / len(ordered) * 1000, 3) if ordered else 0.0,
+            "p50": round(percentile(ordered, 0.50) * 1000, 3),
+            "p95": round(percentile(ordered, 0.95) * 1000, 3),
+            "p99": round(percentile(ordered, 0.99) * 1000, 3),
+            "max": round(ordered[-1] * 1000, 3) if ordered else 0.0,
+        },
+    }
+
+
+def environment():
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+        "git_commit": commit,
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+    }
+
+
+def save(path, params, results):
+    document = {"environment": environment(), "params": params, "results": results}
+    with open(path, "w") as f:
+        json.dump(document, f, indent=2)
+    return document
+
+
+def compare(current, baseline, max_regression=0.10):
+    """List workloads whose throughput dropped or p99 grew by more than max_regression."""
+    previous = {result["name"]: result for result in baseline["results"]}
+    regressions = []
+    for result in current["results"]:
+        before = previous.get(result["name"])
+        if before is None:
+            continue
+        if result["throughput_per_second"] < before["throughput_per_second"] * (1 - max_regression):
+            regressions.append(
+                f"{result['name']}: throughput {before['throughput_per_second']} -> {result['throughput_per_second']}/s"
+            )
+        if "latency_ms" in result and result["latency_ms"]["p99"] > before["latency_ms"]["p99"] * (1 + max_regression):
+            regressions.append(
+                f"{result['name']}: p99 {before['latency_ms']['p99']} -> {result['latency_ms']['p99']} ms"
+            )
+    return regressions
@@ -0,0 +1,66 @@
+"""
+List response encoding: ORM entities + response_model validation vs. column rows + orjson
+"""
+import time
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+from pydantic import TypeAdapter
+from sqlalchemy import create_engine, insert, select
+from sqlalchemy.orm import Session
+from sqlalchemy.pool import StaticPool
+from shared.common_schemas import TaskRead
+from shared.fast_json import json_response, row_dicts, schema_columns
+
+
+def _response_model_path(db, Task, adapter):
+    tasks = db.scalars(select(Task).order_by(Task.id)).all()
+    # What FastAPI does with response_model: validate, dump, jsonable_encoder, json.dumps
+    validated = adapter.validate_python(tasks, from_attributes=True)
+    body = JSONResponse(jsonable_encoder(adapter.dump_python(validated))).body
+    db.expunge_all()
+    return body
+
+
+def _fast_path(db, Task):
+    rows = db.execute(select(*schema_columns(Task, TaskRead)).order_by(Task.id)).all()
+    return json_response(row_dicts(rows, TaskRead)).body
+
+
+def run_response_bench(rows=10000, repeat=5):
+    from services.task_service.app.db import Base
+    from services.task_service.app.models import Task
+
+    engine = create_engine("sqlite://", poolclass=StaticPool, connect_args={"check_same_thread": False})
+    Base.metadata.create_all(engine)
+    with Session(engine) as db:
+        db.execute(insert(Task), [
+            {"title": f"task {i} – ünïcode", "description": None if i % 3 else f"details {i}", "user_id": i % 100}
+            for i in range(rows)
+        ])
+        db.commit()
+
+        adapter = TypeAdapter(list[TaskRead])
+        if _response_model_path(db, Task, adapter) != _fast_path(db, Task):
+            raise AssertionError("fast path JSON differs from the response_model output")
+
+        results = []
+        for name, encode in (
+            ("responses.tasks.response_model", lambda: _response_model_path(db, Task, adapter)),
+            ("responses.tasks.orjson_columns", lambda: _fast_path(db, Task)),
+        ):
+            latencies = []
+            for _ in range(repeat):
+                start = time.perf_counter()
+                encode()
+                latencies.append(time.perf_counter() - start)
+            best = min(latencies)
+            results.append({
+                "name": name,
+                "rows": rows,
+                "best_ms": round(best * 1000, 3),
+                "mean_ms": round(sum(latencies) / repeat * 1000, 3),
+                "throughput_per_second": round(rows / best, 2),
+            })
+    engine.dispose()
+    results[1]["speedup"] = round(results[0]["best_ms"] / results[1]["best_ms"], 2)
+    return results
@@ -0,0 +1,90 @@
+"""
+Run the benchmark suite and save the results as JSON
+
+    python -m benchmarks.run --suite all --requests 2000 --concurrency 32
+    python -m benchmarks.run --baseline bench_results_main.json --max-regression 0.1
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import sys
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Service benchmarks")
+    parser.add_argument("--suite", choices=["http", "consumer", "pipeline", "logging", "serialization", "hashing", "responses", "all"], default="all")
+    parser.add_argument("--requests", type=int, default=1000, help="requests per HTTP workload")
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--users", type=int, default=100, help="distinct user ids used by task workloads")
+    parser.add_argument("--workload", action="append", help="only run these workloads, e.g. tasks.list")
+    parser.add_argument("--database-url", default="sqlite:///./bench.db",
+                        help="database for the in-process apps (ignored when DATABASE_URL is set)")
+    parser.add_argument("--user-url", help="benchmark a running user service instead of in-process")
+    parser.add_argument("--task-url", help="benchmark a running task service instead of in-process")
+    parser.add_argument("--events", type=int, default=20000, help="events for the consumer and serialization benchmarks")
+    parser.add_argument("--batch-size", type=int, default=500)
+    parser.add_argument("--workers", type=int, default=8)
+    parser.add_argument("--rows", type=int, default=10000, help="rows per response in the responses benchmark")
+    parser.add_argument("--hashes", type=int, default=200, help="passwords hashed by the hashing benchmark")
+    parser.add_argument("--hash-workers", type=int, help="hashing pool size (default: one per core)")
+    parser.add_argument("--hash-pool", choices=["thread", "process"], default="thread")
+    parser.add_argument("--output", default="bench_results.json")
+    parser.add_argument("--baseline", help="previous results file to compare against")
+    parser.add_argument("--max-regression", type=float, default=0.10)
+    parser.add_argument("--log-level", default="WARNING")
+    return parser.parse_args(argv)
+
+
+async def run(args):
+    # Service config is read at import time, so the database must be chosen first
+    os.environ.setdefault("DATABASE_URL", args.database_url)
+    from .consumer_bench import run_consumer_bench
+    from .hashing_bench import run_hashing_bench
+    from .http_bench import run_http_suite
+    from .logging_bench import run_logging_bench
+    from .pipeline_bench import run_pipeline_bench
+    from .response_bench import run_response_bench
+    from .serialization_bench import run_serialization_bench
+
+    results = []
+    if args.suite in ("http", "all"):
+        base_urls = {name: url for name, url in (("user", args.user_url), ("task", args.task_url)) if url}
+        results += await run_http_suite(args.requests, args.concurrency, args.users, base_urls, args.workload)
+    if args.suite in ("consumer", "all"):
+        results.append(await run_consumer_bench(args.events, args.batch_size, args.workers))
+    if args.suite in ("pipeline", "all"):
+        results += await run_pipeline_bench(args.requests, args.concurrency, args.users)
+    if args.suite in ("logging", "all"):
+        results += await run_logging_bench(args.events, args.batch_size, args.workers)
+    if args.suite in ("serialization", "all"):
+        results += run_serialization_bench(args.events)
+    if args.suite in ("responses", "all"):
+        results += run_response_bench(args.rows)
+    if args.suite in ("hashing", "all"):
+        results += await run_hashing_bench(args.hashes, args.hash_workers, args.hash_pool)
+    return results
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    # Configure logging before the services do, so their basicConfig() calls become no-ops
+    logging.basicConfig(level=args.log_level)
+    from .report import compare, save
+
+    results = asyncio.run(run(args))
+    document = save(args.output, {k: v for k, v in vars(args).items() if k != "baseline"}, results)
+    print(json.dumps(results, indent=2))
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(document, json.load(f), args.max_regression)
+        for regression in regressions:
+            print(f"REGRESSION {regression}", file=sys.stderr)
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
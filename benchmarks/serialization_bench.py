@@ -0,0 +1,43 @@
+"""
+Encode/decode cost and payload size of the event encodings
+"""
+import time
+from shared.serialization import EventSerializer
+
+SAMPLE_EVENTS = {
+    "user.created": lambda i: {
+        "id": i, "username": f"user{i}", "email": f"user{i}@example.com", "event_type": "user.created",
+    },
+    "task.created": lambda i: {
+        "id": i, "title": f"task {i}", "description": "write the quarterly report", "user_id": i % 100,
+        "event_type": "task.created",
+    },
+}
+
+
+def run_serialization_bench(events=20000, encodings=("json", "msgpack")):
+    results = []
+    for encoding in encodings:
+        serializer = EventSerializer(encoding)
+        for topic, make_event in SAMPLE_EVENTS.items():
+            batch = [make_event(i) for i in range(events)]
+
+            start = time.perf_counter()
+            payloads = [serializer.encode(topic, event) for event in batch]
+            encode_elapsed = time.perf_counter() - start
+
+            start = time.perf_counter()
+            for payload in payloads:
+                serializer.decode(payload)
+            decode_elapsed = time.perf_counter() - start
+
+            size = sum(len(payload) for payload in payloads)
+            results.append({
+                "name": f"serialization.{encoding}.{topic}",
+                "events": events,
+                "bytes_per_event": round(size / events, 1),
+                "encode_us": round(encode_elapsed / events * 1e6, 3),
+                "decode_us": round(decode_elapsed / events * 1e6, 3),
+                "throughput_per_second": round(events / (encode_elapsed + decode_elapsed), 2),
+            })
+    return results
@@ -61,6 +61,7 @@ $manifests = @(
     'deployment/k8s/base/namespace.yaml',
     'deployment/k8s/base/postgresql.yaml',
     'deployment/k8s/base/kafka.yaml',
+    'deployment/k8s/base/migrations.yaml',
     'deployment/k8s/base/user-service.yaml',
     'deployment/k8s/base/task-service.yaml',
     'deployment/k8s/base/notification-service.yaml'
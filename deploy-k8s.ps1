@@ -29,6 +29,8 @@ Write-Host '`n🚀 Applying Kubernetes manifests...' -ForegroundColor Yellow
 kubectl apply -f deployment/k8s/base/namespace.yaml
 kubectl apply -f deployment/k8s/base/postgresql.yaml
 kubectl apply -f deployment/k8s/base/kafka.yaml
+kubectl apply -f deployment/k8s/base/migrations.yaml
+kubectl wait --for=condition=complete job/schema-migrations -n fastapi-app --timeout=300s
 kubectl apply -f deployment/k8s/base/user-service.yaml
 kubectl apply -f deployment/k8s/base/task-service.yaml
 kubectl apply -f deployment/k8s/base/notification-service.yaml
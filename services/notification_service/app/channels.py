@@ -0,0 +1,147 @@
+"""
+Delivery channels for notifications
+
+A channel sends a batch of notifications to one provider and reports a result
+per notification: None when it was accepted, or a DeliveryError saying whether
+sending it again might succeed.
+"""
+from email.message import EmailMessage
+import aiosmtplib
+import httpx
+from pydantic import BaseModel
+from .config import (
+    DELIVERY_TIMEOUT,
+    EMAIL_RATE_LIMIT,
+    PUSH_RATE_LIMIT,
+    PUSH_WEBHOOK_URL,
+    SMTP_HOST,
+    SMTP_PASSWORD,
+    SMTP_PORT,
+    SMTP_SENDER,
+    SMTP_USE_TLS,
+    SMTP_USERNAME,
+)
+
+
+class Notification(BaseModel):
+    channel: str
+    recipient: str
+    subject: str
+    body: str
+    attempt: int = 0
+    # Epoch seconds before which a retry must not be sent
+    not_before: float = 0.0
+    last_error: str | None = None
+    # Write stamp and trace context of the event that caused it, sent along with retries
+    headers: dict[str, str] = {}
+
+
+class DeliveryError(Exception):
+    def __init__(self, message, retryable=True):
+        super().__init__(message)
+        self.retryable = retryable
+
+
+class EmailChannel:
+    """Sends each batch over a single SMTP session."""
+
+    name = "email"
+
+    def __init__(
+        self,
+        host=SMTP_HOST,
+        port=SMTP_PORT,
+        sender=SMTP_SENDER,
+        username=SMTP_USERNAME,
+        password=SMTP_PASSWORD,
+        use_tls=SMTP_USE_TLS,
+        timeout=DELIVERY_TIMEOUT,
+        rate_limit=EMAIL_RATE_LIMIT,
+    ):
+        self.host = host
+        self.port = port
+        self.sender = sender
+        self.username = username
+        self.password = password
+        self.use_tls = use_tls
+        self.timeout = timeout
+        self.rate_limit = rate_limit
+
+    def _message(self, notification):
+        message = EmailMessage()
+        message["From"] = self.sender
+        message["To"] = notification.recipient
+        message["Subject"] = notification.subject
+        message.set_content(notification.body)
+        return message
+
+    async def send_batch(self, notifications):
+        smtp = aiosmtplib.SMTP(hostname=self.host, port=self.port, use_tls=self.use_tls, timeout=self.timeout)
+        try:
+            await smtp.connect()
+            if self.username:
+                await smtp.login(self.username, self.password)
+        except (aiosmtplib.SMTPException, OSError) as e:
+            return [DeliveryError(f"SMTP connection failed: {e}")] * len(notifications)
+
+        results = []
+        try:
+            for notification in notifications:
+                try:
+                    await smtp.send_message(self._message(notification))
+                    results.append(None)
+                except aiosmtplib.SMTPRecipientsRefused as e:
+                    results.append(DeliveryError(f"Recipient refused: {e}", retryable=False))
+                except aiosmtplib.SMTPResponseException as e:
+                    # 4xx replies are transient, 5xx are permanent
+                    results.append(DeliveryError(f"SMTP error: {e}", retryable=e.code < 500))
+                except (aiosmtplib.SMTPException, OSError) as e:
+                    results.append(DeliveryError(f"SMTP error: {e}"))
+        finally:
+            try:
+                await smtp.quit()
+            except (aiosmtplib.SMTPException, OSError):
+                pass
+        return results
+
+    async def close(self):
+        pass
+
+
+class PushChannel:
+    """Posts each batch as one JSON request to a push provider webhook."""
+
+    name = "push"
+
+    def __init__(self, url=PUSH_WEBHOOK_URL, timeout=DELIVERY_TIMEOUT, rate_limit=PUSH_RATE_LIMIT):
+        self.url = url
+        self.rate_limit = rate_limit
+        self.client = httpx.AsyncClient(timeout=timeout)
+
+    async def send_batch(self, notifications):
+        payload = {
+            "notifications": [
+                notification.model_dump(include={"recipient", "subject", "body"}) for notification in notifications
+            ]
+        }
+        try:
+            response = await self.client.post(self.url, json=payload)
+        except httpx.HTTPError as e:
+            return [DeliveryError(f"Push request failed: {e}")] * len(notifications)
+        if response.is_success:
+            return [None] * len(notifications)
+        retryable = response.status_code == 429 or response.status_code >= 500
+        return [DeliveryError(f"Push provider returned {response.status_code}", retryable)] * len(notifications)
+
+    async def close(self):
+        await self.client.aclose()
+
+
+def build_channels():
+    """Channels whose endpoint is configured."""
+    channels = []
+    if SMTP_HOST:
+        channels.append(EmailChannel())
+    if PUSH_WEBHOOK_URL:
+        channels.append(PushChannel())
+    return channels
@@ -1,3 +1,44 @@
 import os
 
-KAFKA_BROKER = os.environ.get("KAFKA_BROKER", "kafka:9092")
\ No newline at end of file
+KAFKA_BROKER = os.environ.get("KAFKA_BROKER", "kafka:9092")
+
+# Batched consumer pipeline
+CONSUMER_BATCH_SIZE = int(os.environ.get("CONSUMER_BATCH_SIZE", "500"))
+CONSUMER_POLL_TIMEOUT = float(os.environ.get("CONSUMER_POLL_TIMEOUT", "1.0"))
+CONSUMER_WORKERS = int(os.environ.get("CONSUMER_WORKERS", "8"))
+CONSUMER_MAX_IN_FLIGHT = int(os.environ.get("CONSUMER_MAX_IN_FLIGHT", "2000"))
+# Seconds a partition waits before reading a failed event again
+CONSUMER_RETRY_BACKOFF = float(os.environ.get("CONSUMER_RETRY_BACKOFF", "1.0"))
+
+# Consumer processes in the same group; 0 runs a single consumer thread inside the API process
+CONSUMER_PROCESSES = int(os.environ.get("CONSUMER_PROCESSES", "0"))
+CONSUMER_REPORT_INTERVAL = float(os.environ.get("CONSUMER_REPORT_INTERVAL", "1.0"))
+CONSUMER_SHUTDOWN_TIMEOUT = float(os.environ.get("CONSUMER_SHUTDOWN_TIMEOUT", "30"))
+
+# Idempotency: skip events already handled after a redelivery (memory | redis | none)
+DEDUP_BACKEND = os.environ.get("DEDUP_BACKEND", "memory")
+DEDUP_MAX_ENTRIES = int(os.environ.get("DEDUP_MAX_ENTRIES", "100000"))
+DEDUP_TTL_SECONDS = float(os.environ.get("DEDUP_TTL_SECONDS", "86400"))
+# How long a claim blocks redeliveries while its handler runs; keep it above the slowest handler
+DEDUP_LEASE_SECONDS = float(os.environ.get("DEDUP_LEASE_SECONDS", "60"))
+REDIS_URL = os.environ.get("REDIS_URL", "redis://redis:6379/0")
+
+# Delivery channels; a channel is enabled by setting its endpoint
+SMTP_HOST = os.environ.get("SMTP_HOST", "")
+SMTP_PORT = int(os.environ.get("SMTP_PORT", "25"))
+SMTP_SENDER = os.environ.get("SMTP_SENDER", "notifications@example.com")
+SMTP_USERNAME = os.environ.get("SMTP_USERNAME", "")
+SMTP_PASSWORD = os.environ.get("SMTP_PASSWORD", "")
+SMTP_USE_TLS = os.environ.get("SMTP_USE_TLS", "false").lower() == "true"
+EMAIL_RATE_LIMIT = float(os.environ.get("EMAIL_RATE_LIMIT", "50"))
+PUSH_WEBHOOK_URL = os.environ.get("PUSH_WEBHOOK_URL", "")
+PUSH_RATE_LIMIT = float(os.environ.get("PUSH_RATE_LIMIT", "500"))
+
+# Delivery engine: per-channel batches, concurrent batches per channel, retry tiers in seconds
+DELIVERY_BATCH_SIZE = int(os.environ.get("DELIVERY_BATCH_SIZE", "50"))
+DELIVERY_BATCH_WAIT = float(os.environ.get("DELIVERY_BATCH_WAIT", "0.05"))
+DELIVERY_CONCURRENCY = int(os.environ.get("DELIVERY_CONCURRENCY", "4"))
+DELIVERY_TIMEOUT = float(os.environ.get("DELIVERY_TIMEOUT", "10"))
+DELIVERY_RETRY_DELAYS = [float(delay) for delay in os.environ.get("DELIVERY_RETRY_DELAYS", "5,30,300").split(",") if delay]
+DELIVERY_RETRY_TOPIC_PREFIX = os.environ.get("DELIVERY_RETRY_TOPIC_PREFIX", "notifications.retry")
+DELIVERY_DLQ_TOPIC = os.environ.get("DELIVERY_DLQ_TOPIC", "notifications.dlq")
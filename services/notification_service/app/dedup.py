@@ -0,0 +1,169 @@
+"""
+Idempotency layer for consumed events
+
+Kafka delivers at least once: after a restart or rebalance the uncommitted tail
+of a partition is consumed again. Each event is claimed by its type and id
+before its handler runs, so redelivered events are skipped. A claim starts as a
+lease of DEDUP_LEASE_SECONDS and only becomes a DEDUP_TTL_SECONDS "done" mark
+once the handler succeeds: a consumer that dies mid-handler holds the event
+back until its lease runs out, never for good. A failed handler releases its
+claim, and the consumer reads the event again instead of committing past it.
+
+The default backend is a bounded in-process LRU, which covers redeliveries to
+the same process. DEDUP_BACKEND=redis shares claims across processes and
+restarts.
+"""
+import threading
+import time
+from collections import OrderedDict
+from .config import DEDUP_BACKEND, DEDUP_LEASE_SECONDS, DEDUP_MAX_ENTRIES, DEDUP_TTL_SECONDS, REDIS_URL
+
+# Results of a claim: handle the event, skip it, or try it again once the other claim settles
+CLAIMED = "claimed"
+DUPLICATE = "duplicate"
+IN_PROGRESS = "in_progress"
+
+
+class LRUDedup:
+    """Bounded set of recently claimed keys; the oldest claims are forgotten first."""
+
+    name = "memory"
+
+    def __init__(self, max_entries=DEDUP_MAX_ENTRIES, ttl=DEDUP_TTL_SECONDS, lease=DEDUP_LEASE_SECONDS):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.lease = lease
+        # key -> (expires, done)
+        self._claimed = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _set(self, key, expires, done):
+        self._claimed[key] = (expires, done)
+        self._claimed.move_to_end(key)
+        while len(self._claimed) > self.max_entries:
+            self._claimed.popitem(last=False)
+
+    async def claim(self, key):
+        now = time.monotonic()
+        with self._lock:
+            entry = self._claimed.get(key)
+            if entry is not None and entry[0] >= now:
+                return DUPLICATE if entry[1] else IN_PROGRESS
+            self._set(key, now + self.lease, False)
+            return CLAIMED
+
+    async def complete(self, key):
+        with self._lock:
+            self._set(key, time.monotonic() + self.ttl, True)
+
+    async def release(self, key):
+        with self._lock:
+            self._claimed.pop(key, None)
+
+    def size(self):
+        return len(self._claimed)
+
+
+class RedisDedup:
+    """Claims stored in Redis with SET NX, shared by every consumer process."""
+
+    name = "redis"
+
+    def __init__(self, url=REDIS_URL, ttl=DEDUP_TTL_SECONDS, lease=DEDUP_LEASE_SECONDS, prefix="notification-service:dedup:"):
+        try:
+            import redis.asyncio as redis
+        except ImportError as e:
+            raise RuntimeError("DEDUP_BACKEND=redis requires the 'redis' package") from e
+        self.client = redis.from_url(url)
+        self.ttl = ttl
+        self.lease = lease
+        self.prefix = prefix
+
+    async def claim(self, key):
+        if await self.client.set(self.prefix + key, "pending", nx=True, px=int(self.lease * 1000)):
+            return CLAIMED
+        # A lease that expired between the two calls reads as None: retried later like a live one
+        return DUPLICATE if await self.client.get(self.prefix + key) == b"done" else IN_PROGRESS
+
+    async def complete(self, key):
+        await self.client.set(self.prefix + key, "done", px=int(self.ttl * 1000))
+
+    async def release(self, key):
+        await self.client.delete(self.prefix + key)
+
+    def size(self):
+        return None
+
+
+class NullDedup:
+    name = "none"
+
+    async def claim(self, key):
+        return CLAIMED
+
+    async def complete(self, key):
+        pass
+
+    async def release(self, key):
+        pass
+
+    def size(self):
+        return 0
+
+
+class EventDeduplicator:
+    def __init__(self, backend):
+        self.backend = backend
+        self.checks = 0
+        self.duplicates = 0
+        self.in_progress = 0
+
+    @staticmethod
+    def key(topic, event_data):
+        event_id = event_data.get("id")
+        if event_id is None:
+            return None
+        return f"{event_data.get('event_type', topic)}:{event_id}"
+
+    async def claim(self, topic, event_data):
+        """CLAIMED if the event should be handled now, DUPLICATE if it was, IN_PROGRESS if another claim is live."""
+        key = self.key(topic, event_data)
+        if key is None:
+            return CLAIMED
+        self.checks += 1
+        result = await self.backend.claim(key)
+        if result == DUPLICATE:
+            self.duplicates += 1
+        elif result == IN_PROGRESS:
+            self.in_progress += 1
+        return result
+
+    async def complete(self, topic, event_data):
+        """Mark a claimed event as handled, for DEDUP_TTL_SECONDS."""
+        key = self.key(topic, event_data)
+        if key is not None:
+            await self.backend.complete(key)
+
+    async def release(self, topic, event_data):
+        key = self.key(topic, event_data)
+        if key is not None:
+            await self.backend.release(key)
+
+    def stats(self):
+        return {
+            "backend": self.backend.name,
+            "size": self.backend.size(),
+            "checks": self.checks,
+            "duplicates": self.duplicates,
+            "in_progress": self.in_progress,
+            "duplicate_ratio": round(self.duplicates / self.checks, 4) if self.checks else 0.0,
+        }
+
+
+def build_dedup():
+    """Build the deduplicator configured by DEDUP_BACKEND."""
+    if DEDUP_BACKEND == "redis":
+        return EventDeduplicator(RedisDedup())
+    if DEDUP_BACKEND == "none":
+        return EventDeduplicator(NullDedup())
+    return EventDeduplicator(LRUDedup())
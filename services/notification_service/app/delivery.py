@@ -0,0 +1,223 @@
+"""
+Notification delivery engine
+
+Each channel has its own dispatcher: notifications are queued, grouped into
+batches (up to DELIVERY_BATCH_SIZE, waiting at most DELIVERY_BATCH_WAIT for a
+batch to fill), paced by a token bucket and sent with at most
+DELIVERY_CONCURRENCY batches in flight. Failures that may succeed later are
+published to tiered retry topics (notifications.retry.1, .2, ...) with a
+growing delay; permanent failures and exhausted retries go to the dead-letter
+topic. Both carry the original event's write stamp and trace context as Kafka
+headers, so a retry's latency is still measured from the write. A separate
+consumer group reads the retry topics, so waiting retries never hold up new
+events. A retry that is not due yet raises NotDue, and that consumer pauses the
+partition at it until then instead of holding a worker.
+
+deliver() resolves once its notification's batch was sent, so each handler holds
+a consumer worker until then; the consumers run ``capacity`` workers, enough to
+fill every batch a channel can have in flight plus the one being formed.
+"""
+import asyncio
+import logging
+import time
+from shared.metrics import NOTIFICATION_BATCH_DURATION, NOTIFICATIONS_DELIVERED
+from shared.tracing import current_event_headers, kafka_headers
+from .channels import DeliveryError, Notification, build_channels
+from .config import (
+    DELIVERY_BATCH_SIZE,
+    DELIVERY_BATCH_WAIT,
+    DELIVERY_CONCURRENCY,
+    DELIVERY_DLQ_TOPIC,
+    DELIVERY_RETRY_DELAYS,
+    DELIVERY_RETRY_TOPIC_PREFIX,
+)
+
+logger = logging.getLogger(__name__)
+
+
+class NotDue(Exception):
+    """A retry read before its not_before time; the consumer reads it again then."""
+
+    def __init__(self, not_before):
+        super().__init__(f"retry not due before {not_before}")
+        self.not_before = not_before
+
+
+class TokenBucket:
+    """Allows ``rate`` tokens per second with bursts of up to ``burst``; a rate of 0 disables it."""
+
+    def __init__(self, rate, burst=None):
+        self.rate = rate
+        self.capacity = burst or max(rate, 1)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self, tokens=1):
+        if not self.rate:
+            return
+        # Callers queue on the lock, so tokens are handed out in arrival order
+        async with self._lock:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            self.tokens -= tokens
+            if self.tokens < 0:
+                await asyncio.sleep(-self.tokens / self.rate)
+
+
+class ChannelDispatcher:
+    def __init__(self, channel, settle, batch_size, batch_wait, concurrency):
+        self.channel = channel
+        self.settle = settle
+        self.batch_size = batch_size
+        self.batch_wait = batch_wait
+        self.bucket = TokenBucket(getattr(channel, "rate_limit", 0))
+        self.slots = asyncio.Semaphore(concurrency)
+        self.queue = asyncio.Queue()
+        self._sending = set()
+        self._runner = None
+
+    def start(self):
+        self._runner = asyncio.create_task(self._run())
+
+    async def submit(self, notification):
+        """Queue a notification; resolves once it was sent or handed off for retry."""
+        future = asyncio.get_running_loop().create_future()
+        self.queue.put_nowait((notification, future))
+        return await future
+
+    async def _run(self):
+        while True:
+            batch = [await self.queue.get()]
+            if self.queue.qsize() < self.batch_size - 1:
+                # Linger briefly so concurrent events share one provider call
+                await asyncio.sleep(self.batch_wait)
+            while len(batch) < self.batch_size and not self.queue.empty():
+                batch.append(self.queue.get_nowait())
+
+            await self.bucket.acquire(len(batch))
+            await self.slots.acquire()
+            task = asyncio.create_task(self._send(batch))
+            self._sending.add(task)
+            task.add_done_callback(self._sending.discard)
+
+    async def _send(self, batch):
+        try:
+            notifications = [notification for notification, _ in batch]
+            start = time.perf_counter()
+            try:
+                results = await self.channel.send_batch(notifications)
+            except Exception as e:
+                results = [DeliveryError(f"{self.channel.name} channel failed: {e}")] * len(batch)
+            NOTIFICATION_BATCH_DURATION.labels(channel=self.channel.name).observe(time.perf_counter() - start)
+
+            for (notification, future), error in zip(batch, results):
+                try:
+                    await self.settle(notification, error)
+                    future.set_result(error is None)
+                except Exception as e:
+                    future.set_exception(e)
+        finally:
+            self.slots.release()
+
+    async def stop(self):
+        if self._runner is not None:
+            self._runner.cancel()
+            await asyncio.gather(self._runner, return_exceptions=True)
+            self._runner = None
+        await asyncio.gather(*self._sending, return_exceptions=True)
+        await self.channel.close()
+
+
+class DeliveryEngine:
+    def __init__(
+        self,
+        channels,
+        producer,
+        batch_size=DELIVERY_BATCH_SIZE,
+        batch_wait=DELIVERY_BATCH_WAIT,
+        concurrency=DELIVERY_CONCURRENCY,
+        retry_delays=DELIVERY_RETRY_DELAYS,
+        retry_topic_prefix=DELIVERY_RETRY_TOPIC_PREFIX,
+        dlq_topic=DELIVERY_DLQ_TOPIC,
+    ):
+        self.channels = {channel.name: channel for channel in channels}
+        self.producer = producer
+        self.batch_size = batch_size
+        self.batch_wait = batch_wait
+        self.concurrency = concurrency
+        self.retry_delays = list(retry_delays)
+        self.retry_topics = [f"{retry_topic_prefix}.{tier}" for tier in range(1, len(self.retry_delays) + 1)]
+        self.dlq_topic = dlq_topic
+        self.dispatchers = {}
+
+    @property
+    def capacity(self):
+        """Notifications that can be waiting on a send at once, over all channels."""
+        return self.batch_size * (self.concurrency + 1) * len(self.channels)
+
+    async def start(self):
+        for name, channel in self.channels.items():
+            dispatcher = ChannelDispatcher(channel, self._settle, self.batch_size, self.batch_wait, self.concurrency)
+            dispatcher.start()
+            self.dispatchers[name] = dispatcher
+
+    async def stop(self):
+        for dispatcher in self.dispatchers.values():
+            await dispatcher.stop()
+        self.dispatchers = {}
+
+    async def deliver(self, notification):
+        """Send a notification; True if sent now, False if it was rerouted or has no channel."""
+        dispatcher = self.dispatchers.get(notification.channel)
+        if dispatcher is None:
+            logger.debug(f"No {notification.channel} channel configured, dropping notification")
+            return False
+        if not notification.headers:
+            # The dispatcher settles it from its own task, outside the event's context
+            notification = notification.model_copy(update={"headers": current_event_headers()})
+        return await dispatcher.submit(notification)
+
+    async def redeliver(self, event_data):
+        """Handler for retry topics: send the notification again, or raise NotDue if it must still wait."""
+        notification = Notification.model_validate(event_data)
+        if notification.not_before > time.time():
+            raise NotDue(notification.not_before)
+        return await self.deliver(notification)
+
+    async def _publish(self, topic, notification):
+        await asyncio.wrap_future(
+            self.producer.produce(
+                topic, notification.recipient, notification.model_dump_json(), headers=kafka_headers(notification.headers)
+            )
+        )
+
+    async def _settle(self, notification, error):
+        channel = notification.channel
+        if error is None:
+            NOTIFICATIONS_DELIVERED.labels(channel=channel, outcome="sent").inc()
+            return
+
+        attempt = notification.attempt
+        if error.retryable and attempt < len(self.retry_delays):
+            retry = notification.model_copy(update={
+                "attempt": attempt + 1,
+                "not_before": time.time() + self.retry_delays[attempt],
+                "last_error": str(error),
+            })
+            await self._publish(self.retry_topics[attempt], retry)
+            NOTIFICATIONS_DELIVERED.labels(channel=channel, outcome="retry").inc()
+            logger.warning(f"{channel} notification to {notification.recipient} failed ({error}), retry {attempt + 1} scheduled")
+        else:
+            await self._publish(self.dlq_topic, notification.model_copy(update={"last_error": str(error)}))
+            NOTIFICATIONS_DELIVERED.labels(channel=channel, outcome="dead_letter").inc()
+            logger.error(f"{channel} notification to {notification.recipient} dead-lettered: {error}")
+
+
+def build_delivery_engine(producer_factory):
+    """Engine for the configured channels, or None when no channel is configured."""
+    channels = build_channels()
+    if not channels:
+        return None
+    return DeliveryEngine(channels, producer_factory())
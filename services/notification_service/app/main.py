@@ -1,110 +1,454 @@
 import asyncio
-import json
+import inspect
 import logging
+import os
+import threading
+import time
+from collections import deque
 from fastapi import FastAPI
-from confluent_kafka import Consumer, KafkaError
-from .config import KAFKA_BROKER
+from confluent_kafka import KafkaError, TopicPartition
+from shared.event_bus import consumer_client
+from shared.logs import setup_logging
+from shared.metrics import (
+    EVENT_PROCESSING_DURATION,
+    EVENTS_PROCESSED,
+    KAFKA_CONSUMER_LAG,
+    setup_metrics,
+)
+from shared.serialization import EventDecodeError, event_serializer
+from shared.tracing import consumer_span, decode_headers, record_event_latency, setup_tracing
+from .config import (
+    CONSUMER_BATCH_SIZE,
+    CONSUMER_MAX_IN_FLIGHT,
+    CONSUMER_POLL_TIMEOUT,
+    CONSUMER_PROCESSES,
+    CONSUMER_RETRY_BACKOFF,
+    CONSUMER_WORKERS,
+    KAFKA_BROKER,
+)
+from .channels import Notification
+from .dedup import DUPLICATE, IN_PROGRESS, build_dedup
+from .delivery import NotDue, build_delivery_engine
 import uvicorn
 from threading import Thread
 
-logging.basicConfig(level=logging.INFO)
+setup_logging("notification-service")
 logger = logging.getLogger(__name__)
 
 # FastAPI app for health checks and status
 app = FastAPI(title="Notification Service")
+setup_metrics(app, "notification-service")
+setup_tracing(app, "notification-service")
+
+# Outcomes that must not be committed past: the partition is read again from the event
+RETRY_OUTCOMES = ("error", "in_progress", "not_due")
+
+class _Batch:
+    """Offsets of one consumed batch, how many of its messages are still in flight, and its first failure per partition."""
 
-class NotificationService:
     def __init__(self):
-        self.consumer = Consumer({
-            'bootstrap.servers': KAFKA_BROKER,
-            'group.id': 'notification-service',
-            'auto.offset.reset': 'earliest'
-        })
-        self.consumer.subscribe(['user.created', 'task.created'])
+        self.offsets = {}
+        self.failed = {}
+        # Partitions rewound after this batch was consumed; their messages here are read again
+        self.stale = set()
+        self.pending = 0
+
+    def track(self, msg):
+        self.offsets[(msg.topic(), msg.partition())] = msg.offset() + 1
+        self.pending += 1
+
+    def fail(self, msg):
+        key = (msg.topic(), msg.partition())
+        self.failed[key] = min(self.failed.get(key, msg.offset()), msg.offset())
+
+class NotificationService:
+    group_id = 'notification-service'
+
+    def __init__(
+        self,
+        consumer=None,
+        batch_size=CONSUMER_BATCH_SIZE,
+        workers=CONSUMER_WORKERS,
+        max_in_flight=CONSUMER_MAX_IN_FLIGHT,
+        poll_timeout=CONSUMER_POLL_TIMEOUT,
+        retry_backoff=CONSUMER_RETRY_BACKOFF,
+        dedup=None,
+        delivery=None,
+        topics=('user.created', 'task.created'),
+        group_id=None,
+    ):
+        if group_id is not None:
+            self.group_id = group_id
+        if consumer is None:
+            consumer = consumer_client({
+                'bootstrap.servers': KAFKA_BROKER,
+                'group.id': self.group_id,
+                'auto.offset.reset': 'earliest',
+                'enable.auto.commit': False
+            })
+        self.consumer = consumer
+        # No topics: the caller feeds handle_message itself, as the replay tool does
+        if topics:
+            self.consumer.subscribe(list(topics), on_assign=self._on_assign, on_revoke=self._on_revoke)
+        self.handlers = {
+            'user.created': self.process_user_created,
+            'task.created': self.process_task_created,
+        }
+        self.batch_size = batch_size
+        self.workers = workers
+        self.max_in_flight = max_in_flight
+        self.poll_timeout = poll_timeout
+        self.retry_backoff = retry_backoff
+        self.dedup = dedup if dedup is not None else build_dedup()
+        self.delivery = delivery
+        # Off for replays: their write-to-handled latency is the age of the backlog, not the pipeline's
+        self.record_latency = True
+        self.in_flight = 0
+        self.paused = False
+        self.running = False
+        self.status = "starting"
+        self.assigned = set()
+        # The pool's status reporter reads the assignment while rebalance callbacks change it
+        self._assigned_lock = threading.Lock()
+        # Rewound partitions -> when they resume
+        self._backoff = {}
+        # (topic, partition, offset) of retries read early -> when they are due
+        self._not_before = {}
+        self._batches = deque()
+        self._queue = None
+        self._loop = None
+        self._loop_thread = None
     
-    def process_user_created(self, event_data):
+    async def process_user_created(self, event_data):
         """Process user created event."""
         global service_status
-        logger.info(f"🎉 New user registered: {event_data.get('username')} ({event_data.get('email')})")
+        logger.info("🎉 New user registered: %s", event_data.get('username'), extra={"category": "event.handled"})
         service_status["processed_events"] += 1
-        # Here you could send welcome email, push notification, etc.
-        # For now, we'll just log the event
+        if self.delivery is not None and event_data.get('email'):
+            await self.delivery.deliver(Notification(
+                channel="email",
+                recipient=event_data['email'],
+                subject="Welcome!",
+                body=f"Hi {event_data.get('username')}, your account is ready.",
+            ))
     
-    def process_task_created(self, event_data):
+    async def process_task_created(self, event_data):
         """Process task created event."""
         global service_status
-        logger.info(f"📝 New task created: '{event_data.get('title')}' by user {event_data.get('user_id')}")
+        logger.info(
+            "📝 New task created: %r by user %s", event_data.get('title'), event_data.get('user_id'),
+            extra={"category": "event.handled"},
+        )
         service_status["processed_events"] += 1
-        # Here you could send task notification, update dashboards, etc.
-        # For now, we'll just log the event
+        if self.delivery is not None and event_data.get('user_id') is not None:
+            await self.delivery.deliver(Notification(
+                channel="push",
+                recipient=str(event_data['user_id']),
+                subject="New task",
+                body=event_data.get('title', ''),
+            ))
+
+    async def handle_message(self, msg):
+        """Decode one message and dispatch it to the handler for its topic, in the event's trace; returns the outcome."""
+        headers = decode_headers(msg.headers())
+        with consumer_span(msg.topic(), headers):
+            return await self._handle_message(msg, headers)
+
+    async def _handle_message(self, msg, headers):
+        topic = msg.topic()
+        consumed_at = time.time()
+        start = time.perf_counter()
+        outcome = "ok"
+        try:
+            event_data = event_serializer.decode(msg.value())
+
+            logger.info("Received event from %s: %s", topic, event_data.get('id'), extra={"category": "event.received"})
+
+            claim = await self.dedup.claim(topic, event_data)
+            if claim == DUPLICATE:
+                outcome = "duplicate"
+                logger.info(
+                    "Skipping duplicate event from %s: %s", topic, event_data.get('id'), extra={"category": "event.duplicate"}
+                )
+            elif claim == IN_PROGRESS:
+                # Another consumer holds a live claim; read it again once that one settles
+                outcome = "in_progress"
+                logger.info(
+                    "Event from %s already in progress: %s", topic, event_data.get('id'), extra={"category": "event.duplicate"}
+                )
+            else:
+                handler = self.handlers.get(topic)
+                if handler is not None:
+                    try:
+                        result = handler(event_data)
+                        if inspect.isawaitable(result):
+                            await result
+                    except NotDue as e:
+                        # Not a failure: the partition waits at this retry until it is due (see _rewind)
+                        await self.dedup.release(topic, event_data)
+                        self._not_before[(topic, msg.partition(), msg.offset())] = e.not_before
+                        outcome = "not_due"
+                    except Exception:
+                        # The partition is rewound to this event, which must be claimable again
+                        await self.dedup.release(topic, event_data)
+                        raise
+                if outcome == "ok":
+                    await self.dedup.complete(topic, event_data)
+            
+        except EventDecodeError as e:
+            outcome = "decode_error"
+            logger.error("Failed to decode message: %s", e, extra={"category": "event.failed"})
+        except Exception as e:
+            outcome = "error"
+            logger.error("Error processing message: %s", e, extra={"category": "event.failed"})
+        EVENT_PROCESSING_DURATION.labels(topic=topic).observe(time.perf_counter() - start)
+        EVENTS_PROCESSED.labels(topic=topic, outcome=outcome).inc()
+        if outcome == "ok" and self.record_latency:
+            record_event_latency(topic, headers, consumed_at, time.time())
+        return outcome
+
+    async def _worker(self, queue):
+        while True:
+            msg, batch = await queue.get()
+            try:
+                if await self.handle_message(msg) in RETRY_OUTCOMES:
+                    batch.fail(msg)
+            finally:
+                batch.pending -= 1
+                self.in_flight -= 1
+                queue.task_done()
+
+    def _apply_backpressure(self):
+        """Pause fetching while too many messages are in flight, resume once half drained."""
+        if not self.paused and self.in_flight >= self.max_in_flight:
+            self.consumer.pause(self.consumer.assignment())
+            self.paused = True
+            logger.warning(f"Pausing partitions with {self.in_flight} messages in flight")
+        elif self.paused and self.in_flight <= self.max_in_flight // 2:
+            self.consumer.resume([
+                tp for tp in self.consumer.assignment() if (tp.topic, tp.partition) not in self._backoff
+            ])
+            self.paused = False
+            logger.info("Resuming partitions")
+
+    def _resume_due(self):
+        """Resume rewound partitions whose backoff has passed (backpressure resumes them otherwise)."""
+        now = time.monotonic()
+        due = [key for key, resume_at in self._backoff.items() if resume_at <= now]
+        for key in due:
+            del self._backoff[key]
+        if due and not self.paused:
+            self.consumer.resume([TopicPartition(topic, partition) for topic, partition in due])
+
+    def _rewind(self, key, offset, batches):
+        """Read a partition again from a failed or early event after a pause; none of its later offsets are committed meanwhile."""
+        for batch in batches:
+            batch.offsets.pop(key, None)
+            batch.stale.add(key)
+        not_before = self._not_before.pop((*key, offset), None)
+        for early in [early for early in self._not_before if early[:2] == key]:
+            del self._not_before[early]
+        if not self.running or key not in self.assigned:
+            # Its next owner starts from the committed offset, which is the failed event
+            return
+        partition = TopicPartition(key[0], key[1], offset)
+        self.consumer.pause([partition])
+        self.consumer.seek(partition)
+        if not_before is None:
+            delay = self.retry_backoff
+            logger.warning(f"Rewinding {key[0]} [{key[1]}] to offset {offset} after a failed event")
+        else:
+            delay = max(not_before - time.time(), 0)
+            logger.info(f"Pausing {key[0]} [{key[1]}] at offset {offset} for {delay:.1f}s until its retry is due")
+        self._backoff[key] = time.monotonic() + delay
+
+    def _record_lag(self, batch):
+        """Update consumer lag from the locally cached high watermarks; no broker round trip."""
+        for (topic, partition), next_offset in batch.offsets.items():
+            _, high = self.consumer.get_watermark_offsets(TopicPartition(topic, partition), cached=True)
+            if high >= 0:
+                KAFKA_CONSUMER_LAG.labels(
+                    group=self.group_id, topic=topic, partition=partition
+                ).set(max(high - next_offset, 0))
+
+    def _commit_finished(self, batches, asynchronous=True):
+        """Commit offsets for the leading run of fully processed batches, up to the first failed event per partition."""
+        offsets = {}
+        while batches and batches[0].pending == 0:
+            batch = batches.popleft()
+            offsets.update(batch.offsets)
+            for key, offset in batch.failed.items():
+                if key not in batch.stale:
+                    offsets[key] = offset
+                    self._rewind(key, offset, batches)
+        if offsets:
+            self.consumer.commit(
+                offsets=[TopicPartition(topic, partition, offset) for (topic, partition), offset in offsets.items()],
+                asynchronous=asynchronous
+            )
+
+    def _on_assign(self, consumer, partitions):
+        with self._assigned_lock:
+            self.assigned.update((tp.topic, tp.partition) for tp in partitions)
+            assigned = tuple(self.assigned)
+        logger.info(f"Assigned partitions: {sorted(assigned)}")
+
+    def _on_revoke(self, consumer, partitions):
+        """Finish and commit in-flight work before the partitions move to another consumer."""
+        with self._assigned_lock:
+            self.assigned.difference_update((tp.topic, tp.partition) for tp in partitions)
+        for tp in partitions:
+            self._backoff.pop((tp.topic, tp.partition), None)
+        # Rebalance callbacks run inside consume() on the executor thread while the
+        # workers keep going on the loop; on close() they run on the loop thread itself
+        loop = self._loop
+        if self._queue is not None and loop is not None and threading.get_ident() != self._loop_thread:
+            asyncio.run_coroutine_threadsafe(self._queue.join(), loop).result()
+        self._commit_finished(self._batches, asynchronous=False)
+        logger.info(f"Revoked partitions: {sorted((tp.topic, tp.partition) for tp in partitions)}")
+
+    def snapshot(self):
+        """Point-in-time status of this consumer, reported to the process pool."""
+        with self._assigned_lock:
+            assigned = tuple(self.assigned)
+        return {
+            "pid": os.getpid(),
+            "status": self.status,
+            "processed_events": service_status["processed_events"],
+            "in_flight": self.in_flight,
+            "paused": self.paused,
+            "partitions": [f"{topic}[{partition}]" for topic, partition in sorted(assigned)],
+            "dedup": self.dedup.stats(),
+        }
+
+    def stop(self):
+        self.running = False
     
     async def consume_events(self):
-        """Consume events from Kafka topics."""
+        """Consume events from Kafka topics in batches."""
         logger.info("Starting notification service consumer...")
+        loop = asyncio.get_running_loop()
+        queue = asyncio.Queue()
+        batches = self._batches
+        workers = [asyncio.create_task(self._worker(queue)) for _ in range(self.workers)]
+        self._loop, self._loop_thread, self._queue = loop, threading.get_ident(), queue
+        self.running = True
+        self.status = "running"
         
         try:
-            while True:
-                msg = self.consumer.poll(timeout=1.0)
+            while self.running:
+                self._resume_due()
+                self._apply_backpressure()
+                # consume() blocks, so keep it off the event loop the workers run on
+                messages = await loop.run_in_executor(
+                    None, self.consumer.consume, self.batch_size, self.poll_timeout
+                )
                 
-                if msg is None:
-                    continue
-                
-                if msg.error():
-                    if msg.error().code() == KafkaError._PARTITION_EOF:
-                        logger.info(f"End of partition reached {msg.topic()} [{msg.partition()}] at offset {msg.offset()}")
-                    else:
-                        logger.error(f"Consumer error: {msg.error()}")
-                    continue
-                
-                try:
-                    event_data = json.loads(msg.value().decode('utf-8'))
-                    topic = msg.topic()
-                    
-                    logger.info(f"Received event from {topic}: {event_data}")
-                    
-                    if topic == 'user.created':
-                        self.process_user_created(event_data)
-                    elif topic == 'task.created':
-                        self.process_task_created(event_data)
+                batch = _Batch()
+                for msg in messages:
+                    if msg.error():
+                        if msg.error().code() == KafkaError._PARTITION_EOF:
+                            logger.info(f"End of partition reached {msg.topic()} [{msg.partition()}] at offset {msg.offset()}")
+                        else:
+                            logger.error(f"Consumer error: {msg.error()}")
+                        continue
                     
-                except json.JSONDecodeError as e:
-                    logger.error(f"Failed to decode message: {e}")
-                except Exception as e:
-                    logger.error(f"Error processing message: {e}")
+                    batch.track(msg)
+                    self.in_flight += 1
+                    queue.put_nowait((msg, batch))
                 
-                await asyncio.sleep(0.1)  # Small delay to prevent tight loop
+                if batch.offsets:
+                    batches.append(batch)
+                    self._record_lag(batch)
+                self._commit_finished(batches)
                 
         except KeyboardInterrupt:
             logger.info("Shutting down notification service...")
         finally:
+            await queue.join()
+            self._commit_finished(batches, asynchronous=False)
+            for worker in workers:
+                worker.cancel()
+            self._queue = None
             self.consumer.close()
+            self.status = "stopped"
 
 # Global variable to track service status
 service_status = {"status": "starting", "processed_events": 0}
 
+# Set when CONSUMER_PROCESSES > 0; /health and /stats then report the whole pool
+consumer_pool = None
+# The in-process consumer when CONSUMER_PROCESSES = 0
+consumer_service = None
+
 @app.get("/")
 async def root():
     return {"service": "notification-service", "status": "running"}
 
 @app.get("/health")
 async def health():
+    if consumer_pool is not None:
+        pool_stats = consumer_pool.stats()
+        return {key: pool_stats[key] for key in ("status", "processed_events", "workers_alive", "workers_total")}
     return service_status
 
 @app.get("/stats")
 async def stats():
+    if consumer_pool is not None:
+        return {"service": "notification-service", **consumer_pool.stats()}
     return {
         "service": "notification-service",
         "status": service_status["status"],
-        "processed_events": service_status["processed_events"]
+        "processed_events": service_status["processed_events"],
+        "dedup": consumer_service.dedup.stats() if consumer_service is not None else None,
     }
 
+def _notification_producer():
+    from shared.kafka_producer import KafkaProducer
+
+    return KafkaProducer(KAFKA_BROKER, client_id='notification-service')
+
+def retry_service(delivery, **kwargs):
+    """Consumer for the delivery retry topics, in its own group so waiting retries never block new events."""
+    service = NotificationService(
+        delivery=delivery, topics=delivery.retry_topics, group_id=f"{NotificationService.group_id}-retry", **kwargs
+    )
+    service.handlers = {topic: delivery.redeliver for topic in delivery.retry_topics}
+    return service
+
+def consumer_workers(delivery):
+    """CONSUMER_WORKERS, raised so the handlers waiting on their sends can fill every delivery batch."""
+    if delivery is None:
+        return CONSUMER_WORKERS
+    return max(CONSUMER_WORKERS, delivery.capacity)
+
+async def run_services(on_start=None):
+    """Consume new events, plus the retry topics when a delivery channel is configured."""
+    delivery = build_delivery_engine(_notification_producer)
+    workers = consumer_workers(delivery)
+    services = [NotificationService(delivery=delivery, workers=workers)]
+    if delivery is not None:
+        await delivery.start()
+        services.append(retry_service(delivery, workers=workers))
+    if on_start is not None:
+        on_start(services)
+    try:
+        await asyncio.gather(*(service.consume_events() for service in services))
+    finally:
+        if delivery is not None:
+            await delivery.stop()
+            await asyncio.get_running_loop().run_in_executor(None, delivery.producer.close)
+
 async def run_consumer():
     """Run the Kafka consumer in the background."""
     global service_status
     service_status["status"] = "running"
     
-    service = NotificationService()
-    await service.consume_events()
+    def publish(services):
+        global consumer_service
+        consumer_service = services[0]
+    
+    await run_services(on_start=publish)
 
 def start_consumer():
     """Start the consumer in a separate thread."""
@@ -113,9 +457,18 @@ def start_consumer():
     loop.run_until_complete(run_consumer())
 
 if __name__ == "__main__":
-    # Start consumer in background thread
-    consumer_thread = Thread(target=start_consumer, daemon=True)
-    consumer_thread.start()
+    if CONSUMER_PROCESSES > 0:
+        from .workers import ConsumerProcessPool
+
+        consumer_pool = ConsumerProcessPool(CONSUMER_PROCESSES)
+        consumer_pool.start()
+    else:
+        # Start consumer in background thread
+        consumer_thread = Thread(target=start_consumer, daemon=True)
+        consumer_thread.start()
     
     # Start FastAPI server
-    uvicorn.run(app, host="0.0.0.0", port=8000)
\ No newline at end of file
+    # log_config=None keeps uvicorn on the handlers set up by setup_logging()
+    uvicorn.run(app, host="0.0.0.0", port=8000, log_config=None)
+    if consumer_pool is not None:
+        consumer_pool.stop()
\ No newline at end of file
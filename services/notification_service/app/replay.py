@@ -0,0 +1,324 @@
+"""
+Replay or backfill past events: python -m app.replay --since 2024-05-01T10:00 --until 2024-05-01T14:00
+
+Runs the notification handlers again over a fixed range of each partition of
+the given topics. The range starts at --from-offset or the first event at or
+after --since (default: the oldest retained event) and ends before the first
+event at --until or, without it, at the high watermark seen when the replay
+starts, so a replay always finishes.
+
+Each partition is read by its own consumer, assigned rather than subscribed,
+under a replay group that never commits: the live group's membership and
+offsets are untouched and the live consumer keeps running. Up to --partitions
+partitions are read at once, and up to --concurrency events are handled at
+once across all of them.
+
+Events go through NotificationService.handle_message with the shared dedup
+store, so events the live consumer already handled are skipped. That needs
+DEDUP_BACKEND=redis: an in-process store starts empty here and would send every
+notification again, so the tool refuses to run without it unless --no-dedup
+says to handle every event again. Progress and throughput are logged every
+--progress-interval seconds and a JSON summary is printed at the end.
+
+An event whose handler fails, whose claim is still held elsewhere or whose retry
+is not due yet is tried again up to --retries times, waiting --retry-backoff
+seconds and doubling. Events still unsettled after that are listed under
+"failed" in the summary, and the tool exits with status 1.
+"""
+import argparse
+import asyncio
+import json
+import logging
+import sys
+import time
+from collections import Counter
+from datetime import datetime, timezone
+from confluent_kafka import KafkaError, TopicPartition
+from shared.event_bus import consumer_client
+from shared.logs import setup_logging
+from .config import CONSUMER_BATCH_SIZE, CONSUMER_POLL_TIMEOUT, CONSUMER_RETRY_BACKOFF, DEDUP_BACKEND, KAFKA_BROKER
+from .dedup import EventDeduplicator, NullDedup, build_dedup
+from .delivery import build_delivery_engine
+from .main import RETRY_OUTCOMES, NotificationService, _notification_producer
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_TOPICS = ("user.created", "task.created")
+REPLAY_GROUP_PREFIX = "notification-service-replay"
+METADATA_TIMEOUT = 10
+# Dedup backends that see what the live consumer handled
+SHARED_DEDUP_BACKENDS = ("redis",)
+
+
+class ReplayRange:
+    """Offsets [start, end) of one partition."""
+
+    def __init__(self, topic, partition, start, end):
+        self.topic = topic
+        self.partition = partition
+        self.start = start
+        self.end = end
+        self.position = start
+
+    @property
+    def size(self):
+        return max(self.end - self.start, 0)
+
+    @property
+    def remaining(self):
+        return max(self.end - self.position, 0)
+
+    def as_dict(self):
+        return {"topic": self.topic, "partition": self.partition, "start": self.start, "end": self.end}
+
+
+def replay_consumer(group_id):
+    """A consumer that only reads: it never commits, so its group keeps no offsets."""
+    return consumer_client({
+        'bootstrap.servers': KAFKA_BROKER,
+        'group.id': group_id,
+        'enable.auto.commit': False,
+        'enable.auto.offset.store': False,
+        'auto.offset.reset': 'earliest',
+    })
+
+
+def _millis(moment):
+    return int(moment.timestamp() * 1000)
+
+
+def _offsets_at(consumer, partitions, moment, default):
+    """First offset at or after ``moment`` per partition, or ``default[partition]`` past the last event."""
+    found = consumer.offsets_for_times(
+        [TopicPartition(topic, partition, _millis(moment)) for topic, partition in partitions], timeout=METADATA_TIMEOUT
+    )
+    return {(tp.topic, tp.partition): tp.offset if tp.offset >= 0 else default[(tp.topic, tp.partition)] for tp in found}
+
+
+def plan_ranges(consumer, topics, from_offset=None, since=None, until=None):
+    """The ReplayRange of every partition of ``topics`` that has events in the requested range."""
+    partitions = []
+    for topic in topics:
+        metadata = consumer.list_topics(topic, timeout=METADATA_TIMEOUT).topics[topic]
+        partitions.extend((topic, partition) for partition in sorted(metadata.partitions))
+
+    low, high = {}, {}
+    for key in partitions:
+        low[key], high[key] = consumer.get_watermark_offsets(TopicPartition(*key), timeout=METADATA_TIMEOUT)
+
+    if since is not None:
+        start = _offsets_at(consumer, partitions, since, high)
+    elif from_offset is not None:
+        start = {key: min(max(from_offset, low[key]), high[key]) for key in partitions}
+    else:
+        start = low
+    end = _offsets_at(consumer, partitions, until, high) if until is not None else high
+
+    ranges = [ReplayRange(topic, partition, start[(topic, partition)], end[(topic, partition)]) for topic, partition in partitions]
+    return [replay_range for replay_range in ranges if replay_range.size]
+
+
+class Replayer:
+    """Feeds planned ranges through a NotificationService's handlers, partitions in parallel."""
+
+    def __init__(
+        self,
+        service,
+        ranges,
+        consumer_factory,
+        partitions=8,
+        concurrency=500,
+        batch_size=CONSUMER_BATCH_SIZE,
+        poll_timeout=CONSUMER_POLL_TIMEOUT,
+        progress_interval=10.0,
+        retries=3,
+        retry_backoff=CONSUMER_RETRY_BACKOFF,
+    ):
+        self.service = service
+        self.ranges = ranges
+        self.consumer_factory = consumer_factory
+        self.partitions = max(1, partitions)
+        self.concurrency = max(1, concurrency)
+        self.batch_size = batch_size
+        self.poll_timeout = poll_timeout
+        self.progress_interval = progress_interval
+        self.retries = retries
+        self.retry_backoff = retry_backoff
+        self.total = sum(replay_range.size for replay_range in ranges)
+        self.handled = 0
+        self.outcomes = Counter()
+        # Events the live consumer would have read again but the replay gave up on
+        self.failed = []
+        self.started = None
+
+    async def _handle(self, msg, slots):
+        try:
+            for attempt in range(self.retries + 1):
+                outcome = await self.service.handle_message(msg)
+                if outcome not in RETRY_OUTCOMES or attempt == self.retries:
+                    break
+                await asyncio.sleep(self.retry_backoff * 2 ** attempt)
+            self.outcomes[outcome] += 1
+            if outcome in RETRY_OUTCOMES:
+                self.failed.append({"topic": msg.topic(), "partition": msg.partition(), "offset": msg.offset(), "outcome": outcome})
+            self.handled += 1
+        finally:
+            slots.release()
+
+    async def _replay_range(self, replay_range, slots):
+        loop = asyncio.get_running_loop()
+        consumer = self.consumer_factory()
+        partition = TopicPartition(replay_range.topic, replay_range.partition, replay_range.start)
+        consumer.assign([partition])
+        handling = set()
+        try:
+            while replay_range.remaining:
+                messages = await loop.run_in_executor(None, consumer.consume, self.batch_size, self.poll_timeout)
+                if not messages:
+                    # Offsets taken by transaction markers or compaction never arrive as messages
+                    [position] = consumer.position([partition])
+                    replay_range.position = max(replay_range.position, position.offset)
+                    continue
+                for msg in messages:
+                    if msg.error():
+                        if msg.error().code() != KafkaError._PARTITION_EOF:
+                            logger.error(f"Replay consumer error on {replay_range.topic}[{replay_range.partition}]: {msg.error()}")
+                        continue
+                    if msg.offset() >= replay_range.end:
+                        replay_range.position = replay_range.end
+                        break
+                    replay_range.position = msg.offset() + 1
+                    await slots.acquire()
+                    task = asyncio.create_task(self._handle(msg, slots))
+                    handling.add(task)
+                    task.add_done_callback(handling.discard)
+        finally:
+            if handling:
+                await asyncio.gather(*handling)
+            consumer.close()
+
+    def progress(self):
+        elapsed = time.perf_counter() - self.started if self.started is not None else 0.0
+        return {
+            "events": self.total,
+            "handled": self.handled,
+            "remaining": sum(replay_range.remaining for replay_range in self.ranges),
+            "outcomes": dict(self.outcomes),
+            "failed": sorted(self.failed, key=lambda event: (event["topic"], event["partition"], event["offset"])),
+            "elapsed_seconds": round(elapsed, 3),
+            "throughput_per_second": round(self.handled / elapsed, 2) if elapsed else 0.0,
+        }
+
+    async def _report(self):
+        while True:
+            await asyncio.sleep(self.progress_interval)
+            progress = self.progress()
+            done = progress["handled"] / self.total if self.total else 1.0
+            logger.info(
+                f"Replayed {progress['handled']}/{self.total} events ({done:.0%}), "
+                f"{progress['throughput_per_second']}/s, {progress['remaining']} left"
+            )
+
+    async def run(self):
+        """Replay every range; returns the final progress summary."""
+        self.started = time.perf_counter()
+        slots = asyncio.Semaphore(self.concurrency)
+        readers = asyncio.Semaphore(self.partitions)
+
+        async def read(replay_range):
+            async with readers:
+                await self._replay_range(replay_range, slots)
+
+        reporter = asyncio.create_task(self._report())
+        try:
+            await asyncio.gather(*(read(replay_range) for replay_range in self.ranges))
+        finally:
+            reporter.cancel()
+        return self.progress()
+
+
+def _moment(value):
+    moment = datetime.fromisoformat(value)
+    return moment if moment.tzinfo is not None else moment.replace(tzinfo=timezone.utc)
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Replay past events through the notification handlers")
+    parser.add_argument("--topics", default=",".join(DEFAULT_TOPICS), help="comma-separated topics")
+    start = parser.add_mutually_exclusive_group()
+    start.add_argument("--since", type=_moment, help="ISO 8601 time of the first event to replay (UTC unless given)")
+    start.add_argument("--from-offset", type=int, help="first offset to replay in every partition")
+    parser.add_argument("--until", type=_moment, help="replay events before this time (default: up to now)")
+    parser.add_argument("--partitions", type=int, default=8, help="partitions read at once")
+    parser.add_argument("--concurrency", type=int, default=500, help="events handled at once")
+    parser.add_argument("--batch-size", type=int, default=CONSUMER_BATCH_SIZE)
+    parser.add_argument("--no-dedup", action="store_true", help="handle events even if already handled")
+    parser.add_argument("--retries", type=int, default=3, help="attempts after the first for events that did not settle")
+    parser.add_argument("--retry-backoff", type=float, default=CONSUMER_RETRY_BACKOFF, help="seconds before the first retry, doubling")
+    parser.add_argument("--progress-interval", type=float, default=10.0)
+    parser.add_argument("--dry-run", action="store_true", help="print the planned ranges and exit")
+    args = parser.parse_args(argv)
+    if not (args.no_dedup or args.dry_run) and DEDUP_BACKEND not in SHARED_DEDUP_BACKENDS:
+        parser.error(
+            f"DEDUP_BACKEND={DEDUP_BACKEND} cannot tell which events the live consumer handled; "
+            "set DEDUP_BACKEND=redis, or pass --no-dedup to send every notification again"
+        )
+    return args
+
+
+async def replay(args):
+    # One group per run, so no replay ever resumes from another's position
+    group_id = f"{REPLAY_GROUP_PREFIX}-{int(time.time())}"
+    planner = replay_consumer(group_id)
+    try:
+        ranges = plan_ranges(
+            planner, [topic.strip() for topic in args.topics.split(",") if topic.strip()],
+            from_offset=args.from_offset, since=args.since, until=args.until,
+        )
+        if args.dry_run:
+            return {"ranges": [replay_range.as_dict() for replay_range in ranges]}
+
+        delivery = build_delivery_engine(_notification_producer)
+        dedup = EventDeduplicator(NullDedup()) if args.no_dedup else build_dedup()
+        service = NotificationService(consumer=planner, topics=(), dedup=dedup, delivery=delivery, group_id=group_id)
+        service.record_latency = False
+        replayer = Replayer(
+            service, ranges, lambda: replay_consumer(group_id),
+            partitions=args.partitions, concurrency=args.concurrency,
+            batch_size=args.batch_size, progress_interval=args.progress_interval,
+            retries=args.retries, retry_backoff=args.retry_backoff,
+        )
+        logger.info(f"Replaying {replayer.total} events from {len(ranges)} partitions")
+        if delivery is not None:
+            await delivery.start()
+        try:
+            summary = await replayer.run()
+        finally:
+            if delivery is not None:
+                await delivery.stop()
+                await asyncio.get_running_loop().run_in_executor(None, delivery.producer.close)
+        return {
+            **summary,
+            # False with --no-dedup: every event in the range was handled again
+            "idempotent": not args.no_dedup,
+            "dedup": dedup.stats(),
+            "ranges": [replay_range.as_dict() for replay_range in ranges],
+        }
+    finally:
+        planner.close()
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    # Progress goes to stderr and the summary to stdout
+    setup_logging("notification-replay")
+    summary = asyncio.run(replay(args))
+    print(json.dumps(summary, indent=2))
+    if summary.get("failed"):
+        logger.error(f"{len(summary['failed'])} events were not handled; see \"failed\" in the summary")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,187 @@
+"""
+Process pool of notification consumers
+
+Each worker process runs its own NotificationService in the shared consumer
+group, so Kafka spreads the partitions across processes and cores. Workers
+report a status snapshot over a queue; the API process rolls those up for
+/health and /stats and restarts workers that die unexpectedly.
+
+Workers record their Prometheus metrics in prometheus_client's multiprocess
+mode, under a directory the pool creates before spawning them, and the API
+process serves those metrics on /metrics next to its own.
+"""
+import asyncio
+import logging
+import multiprocessing
+import os
+import queue
+import shutil
+import signal
+import tempfile
+import threading
+import time
+from prometheus_client import multiprocess
+from shared.metrics import expose_worker_metrics
+from .config import CONSUMER_REPORT_INTERVAL, CONSUMER_SHUTDOWN_TIMEOUT
+
+logger = logging.getLogger(__name__)
+
+
+def _worker_main(index, status_queue, report_interval):
+    from .main import run_services
+
+    services = []
+    stopping = threading.Event()
+
+    def stop(signum=None, frame=None):
+        stopping.set()
+        for service in services:
+            service.stop()
+
+    def started(running):
+        services.extend(running)
+        if stopping.is_set():
+            stop()
+
+    # The parent owns shutdown: SIGTERM finishes in-flight work, commits and leaves the group
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+    done = threading.Event()
+
+    def snapshot():
+        return services[0].snapshot() if services else {"status": "starting", "processed_events": 0}
+
+    def report():
+        while not done.is_set():
+            status_queue.put({"worker": index, **snapshot()})
+            done.wait(report_interval)
+
+    reporter = threading.Thread(target=report, name="status-reporter", daemon=True)
+    reporter.start()
+    try:
+        asyncio.run(run_services(on_start=started))
+    finally:
+        done.set()
+        reporter.join()
+        status_queue.put({"worker": index, **snapshot(), "status": "stopped"})
+
+
+class ConsumerProcessPool:
+    """``target(index, status_queue, report_interval)`` is what each worker process runs."""
+
+    def __init__(
+        self,
+        processes,
+        report_interval=CONSUMER_REPORT_INTERVAL,
+        shutdown_timeout=CONSUMER_SHUTDOWN_TIMEOUT,
+        target=_worker_main,
+    ):
+        # spawn, not fork: librdkafka's threads do not survive a fork
+        self._context = multiprocessing.get_context("spawn")
+        self.processes = processes
+        self.report_interval = report_interval
+        self.shutdown_timeout = shutdown_timeout
+        self.target = target
+        self.metrics_dir = None
+        self.status_queue = self._context.Queue()
+        self.workers = {}
+        self.snapshots = {}
+        self.restarts = 0
+        self._stopping = threading.Event()
+        self._collector = None
+
+    def _spawn(self, index):
+        process = self._context.Process(
+            target=self.target,
+            args=(index, self.status_queue, self.report_interval),
+            name=f"notification-consumer-{index}",
+            daemon=True,
+        )
+        process.start()
+        self.workers[index] = process
+        logger.info(f"Started consumer worker {index} (pid {process.pid})")
+
+    def _collect(self):
+        while not self._stopping.is_set():
+            try:
+                snapshot = self.status_queue.get(timeout=self.report_interval)
+                self.snapshots[snapshot["worker"]] = snapshot
+            except queue.Empty:
+                pass
+            for index, process in list(self.workers.items()):
+                if not process.is_alive() and not self._stopping.is_set():
+                    logger.error(f"Consumer worker {index} exited with code {process.exitcode}, restarting")
+                    multiprocess.mark_process_dead(process.pid, self.metrics_dir)
+                    self.restarts += 1
+                    self._spawn(index)
+
+    def start(self):
+        self._stopping.clear()
+        # A fresh directory per run: files left by an earlier run would add to its counters.
+        # Spawned workers inherit the variable, which must be set before they import prometheus_client
+        self.metrics_dir = tempfile.mkdtemp(prefix="notification-metrics-")
+        os.environ["PROMETHEUS_MULTIPROC_DIR"] = self.metrics_dir
+        expose_worker_metrics(self.metrics_dir)
+        for index in range(self.processes):
+            self._spawn(index)
+        self._collector = threading.Thread(target=self._collect, name="consumer-pool-collector", daemon=True)
+        self._collector.start()
+
+    def stop(self):
+        """Ask every worker to drain and commit, then wait for them to leave the group."""
+        self._stopping.set()
+        for process in self.workers.values():
+            if process.is_alive():
+                process.terminate()
+        deadline = time.monotonic() + self.shutdown_timeout
+        for index, process in self.workers.items():
+            process.join(max(deadline - time.monotonic(), 0))
+            if process.is_alive():
+                logger.warning(f"Consumer worker {index} did not stop in time, killing it")
+                process.kill()
+                process.join()
+        if self._collector is not None:
+            self._collector.join()
+            self._collector = None
+        # Keep the final snapshots the workers sent on their way out
+        while True:
+            try:
+                snapshot = self.status_queue.get_nowait()
+            except queue.Empty:
+                break
+            self.snapshots[snapshot["worker"]] = snapshot
+        for process in self.workers.values():
+            multiprocess.mark_process_dead(process.pid, self.metrics_dir)
+        expose_worker_metrics(None)
+        os.environ.pop("PROMETHEUS_MULTIPROC_DIR", None)
+        shutil.rmtree(self.metrics_dir, ignore_errors=True)
+        self.metrics_dir = None
+
+    def stats(self):
+        workers = []
+        for index, process in sorted(self.workers.items()):
+            snapshot = self.snapshots.get(index, {"worker": index, "status": "starting", "processed_events": 0})
+            workers.append({**snapshot, "pid": process.pid, "alive": process.is_alive()})
+        alive = sum(worker["alive"] for worker in workers)
+        if alive == len(workers):
+            status = "running" if all(worker["status"] == "running" for worker in workers) else "starting"
+        elif alive:
+            status = "degraded"
+        else:
+            status = "stopped" if self._stopping.is_set() else "down"
+        checks = sum(worker.get("dedup", {}).get("checks", 0) for worker in workers)
+        duplicates = sum(worker.get("dedup", {}).get("duplicates", 0) for worker in workers)
+        return {
+            "status": status,
+            "processed_events": sum(worker.get("processed_events", 0) for worker in workers),
+            "dedup": {
+                "checks": checks,
+                "duplicates": duplicates,
+                "duplicate_ratio": round(duplicates / checks, 4) if checks else 0.0,
+            },
+            "workers_alive": alive,
+            "workers_total": len(workers),
+            "restarts": self.restarts,
+            "workers": workers,
+        }
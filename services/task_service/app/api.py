@@ -1,22 +1,31 @@
-from fastapi import APIRouter, Depends
-from sqlalchemy.orm import Session
-from .db import SessionLocal
-from .models import Task
-from .kafka_producer import kafka_producer
-from shared.common_schemas import TaskCreate, TaskRead
+from typing import Literal
+from fastapi import APIRouter, Body, Depends, Query, Request
+from fastapi.responses import StreamingResponse
+from sqlalchemy import insert, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from .cache import cache
+from .config import BULK_MAX_ITEMS
+from .db import engine, get_db, get_read_db, stream_ndjson
+from .models import OutboxEvent, Task, TaskUserStats, Version
+from .stats import record_created
+from shared.common_schemas import TaskBulkResult, TaskCreate, TaskRead, TaskUserStatsRead
+from shared.fast_json import json_response, row_dicts, schema_columns
+from shared.http_cache import check_conditional, make_etag
+from shared.outbox import outbox_row
+from shared.pagination import (
+    DEFAULT_PAGE_SIZE,
+    MAX_PAGE_SIZE,
+    NEXT_CURSOR_HEADER,
+    keyset_select,
+    next_cursor,
+)
+from shared.versions import bump_versions, read_table_version, read_version, table_scopes
 import logging
 
 logger = logging.getLogger(__name__)
 
 router = APIRouter()
 
-def get_db():
-    db = SessionLocal()
-    try:
-        yield db
-    finally:
-        db.close()
-
 @router.get("/")
 def root():
     return {"service": "task-service", "status": "running", "version": "1.0.0"}
@@ -25,33 +34,169 @@ def root():
 def health():
     return {"status": "healthy", "service": "task-service"}
 
+@router.get("/cache/stats")
+async def cache_stats():
+    return await cache.stats()
+
+def _task_created_event(task):
+    return {
+        "id": task.id,
+        "title": task.title,
+        "description": task.description,
+        "user_id": task.user_id,
+        "event_type": "task.created"
+    }
+
+def _user_scope(user_id):
+    return f"tasks:user:{user_id}"
+
+async def _bump_versions(db, user_ids):
+    await bump_versions(
+        db, Version, engine.dialect.name, {_user_scope(user_id) for user_id in user_ids} | table_scopes("tasks", user_ids)
+    )
+
+def _like_prefix(prefix):
+    # Escape LIKE's wildcards (and the '/' escape character itself), then match anything after the prefix
+    return prefix.replace("/", "//").replace("%", "/%").replace("_", "/_") + "%"
+
 @router.post("/tasks/", response_model=TaskRead)
-def create_task(task: TaskCreate, db: Session = Depends(get_db)):
+async def create_task(task: TaskCreate, db: AsyncSession = Depends(get_db)):
     db_task = Task(title=task.title, description=task.description, user_id=task.user_id)
     db.add(db_task)
-    db.commit()
-    db.refresh(db_task)
+    await db.flush()
     
-    # Publish task created event to Kafka
-    try:
-        event_data = {
-            "id": db_task.id,
-            "title": db_task.title,
-            "description": db_task.description,
-            "user_id": db_task.user_id,
-            "event_type": "task.created"
-        }
-        kafka_producer.produce_event("task.created", event_data)
-        logger.info(f"Published task.created event for task {db_task.id}")
-    except Exception as e:
-        logger.error(f"Failed to publish task.created event: {e}")
+    # The event, the user's stats and the versions commit atomically with the task;
+    # the outbox relay publishes the event to Kafka
+    db.add(OutboxEvent(**outbox_row("task.created", _task_created_event(db_task))))
+    await record_created(db, engine.dialect.name, [db_task])
+    await _bump_versions(db, [db_task.user_id])
+    await db.commit()
+    await db.refresh(db_task)
+    logger.info("Queued task.created event for task %s", db_task.id, extra={"category": "event.queued"})
     
     return db_task
 
+@router.post("/tasks/bulk", response_model=TaskBulkResult)
+async def create_tasks_bulk(
+    tasks: list[TaskCreate] = Body(..., min_length=1, max_length=BULK_MAX_ITEMS),
+    db: AsyncSession = Depends(get_db),
+):
+    # One multi-row INSERT ... RETURNING for the tasks and one for their events, in one transaction
+    created = (await db.execute(
+        insert(Task).returning(
+            Task.id, Task.title, Task.description, Task.user_id, sort_by_parameter_order=True
+        ),
+        [task.model_dump() for task in tasks],
+    )).all()
+    await db.execute(
+        insert(OutboxEvent),
+        [outbox_row("task.created", _task_created_event(row)) for row in created],
+    )
+    await record_created(db, engine.dialect.name, created)
+    await _bump_versions(db, {row.user_id for row in created})
+    await db.commit()
+    logger.info("Queued %d task.created events", len(created), extra={"category": "event.queued"})
+
+    return {"created": created, "errors": []}
+
 @router.get("/tasks/", response_model=list[TaskRead])
-def list_tasks(db: Session = Depends(get_db)):
-    return db.query(Task).all()
+async def list_tasks(
+    request: Request,
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    after: int | None = Query(None, description="Continue from this task id, in the requested order"),
+    order: Literal["asc", "desc"] = Query("asc", description="Sort by id ascending or descending"),
+    user_id: int | None = Query(None, description="Only tasks owned by this user"),
+    title_prefix: str | None = Query(None, min_length=1, description="Only tasks whose title starts with this"),
+    stream: bool = Query(False, description="Stream every matching task after the cursor as NDJSON"),
+    db: AsyncSession = Depends(get_read_db),
+):
+    # Each filter is served by an index: ix_tasks_user_id_id or ix_tasks_title_prefix
+    filters = []
+    if user_id is not None:
+        filters.append(Task.user_id == user_id)
+    if title_prefix is not None:
+        filters.append(Task.title.like(_like_prefix(title_prefix), escape="/"))
+    descending = order == "desc"
+    # Plain column rows encoded with orjson: no ORM entities and no response_model validation
+    columns = schema_columns(Task, TaskRead)
+
+    if stream:
+        return StreamingResponse(
+            stream_ndjson(
+                keyset_select(Task, after=after, descending=descending, filters=filters, columns=columns),
+                TaskRead,
+                request,
+            ),
+            media_type="application/x-ndjson",
+        )
+
+    # A page changes only when the tasks it is drawn from do: the user's version, or the table's
+    if user_id is not None:
+        version, modified = await read_version(db, Version, _user_scope(user_id))
+    else:
+        version, modified = await read_table_version(db, Version, "tasks")
+    headers, unchanged = check_conditional(
+        request, make_etag("tasks", version, limit, after, order, user_id, title_prefix), modified
+    )
+    if unchanged is not None:
+        return unchanged
+
+    tasks = (await db.execute(
+        keyset_select(Task, after=after, limit=limit, descending=descending, filters=filters, columns=columns)
+    )).all()
+    cursor = next_cursor(tasks, limit)
+    if cursor is not None:
+        headers[NEXT_CURSOR_HEADER] = str(cursor)
+    return json_response(row_dicts(tasks, TaskRead), headers=headers)
 
 @router.get("/tasks/user/{user_id}", response_model=list[TaskRead])
-def get_tasks_by_user(user_id: int, db: Session = Depends(get_db)):
-    return db.query(Task).filter(Task.user_id == user_id).all()
\ No newline at end of file
+async def get_tasks_by_user(request: Request, user_id: int, db: AsyncSession = Depends(get_read_db)):
+    version, modified = await read_version(db, Version, _user_scope(user_id))
+    headers, unchanged = check_conditional(request, make_etag("tasks:user", user_id, version), modified)
+    if unchanged is not None:
+        return unchanged
+
+    async def load_tasks():
+        tasks = (await db.execute(
+            select(*schema_columns(Task, TaskRead)).where(Task.user_id == user_id).order_by(Task.id)
+        )).all()
+        return row_dicts(tasks, TaskRead)
+
+    # Keyed by version: a write moves readers to a new entry on every replica, so none serves a stale list
+    return json_response(await cache.get_or_load(f"tasks:user:{user_id}:v{version}", load_tasks), headers=headers)
+
+@router.get("/tasks/stats", response_model=list[TaskUserStatsRead])
+async def list_task_stats(
+    request: Request,
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    after: int | None = Query(None, description="Continue after this user id"),
+    db: AsyncSession = Depends(get_read_db),
+):
+    version, modified = await read_table_version(db, Version, "tasks")
+    headers, unchanged = check_conditional(request, make_etag("tasks:stats", version, limit, after), modified)
+    if unchanged is not None:
+        return unchanged
+
+    # Keyset pages over the primary key; one row per user, nothing is counted at read time
+    stmt = select(*schema_columns(TaskUserStats, TaskUserStatsRead)).order_by(TaskUserStats.user_id).limit(limit)
+    if after is not None:
+        stmt = stmt.where(TaskUserStats.user_id > after)
+    stats = (await db.execute(stmt)).all()
+    if len(stats) == limit:
+        headers[NEXT_CURSOR_HEADER] = str(stats[-1].user_id)
+    return json_response(row_dicts(stats, TaskUserStatsRead), headers=headers)
+
+@router.get("/tasks/stats/{user_id}", response_model=TaskUserStatsRead)
+async def get_task_stats(request: Request, user_id: int, db: AsyncSession = Depends(get_read_db)):
+    version, modified = await read_version(db, Version, _user_scope(user_id))
+    headers, unchanged = check_conditional(request, make_etag("tasks:stats", user_id, version), modified)
+    if unchanged is not None:
+        return unchanged
+
+    stats = (await db.execute(
+        select(*schema_columns(TaskUserStats, TaskUserStatsRead)).where(TaskUserStats.user_id == user_id)
+    )).first()
+    if stats is None:
+        # No stats row means no tasks yet
+        return json_response({"user_id": user_id, "task_count": 0, "latest_task_id": None, "latest_task_title": None}, headers=headers)
+    return json_response(row_dicts([stats], TaskUserStatsRead)[0], headers=headers)
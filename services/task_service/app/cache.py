@@ -0,0 +1,4 @@
+from shared.cache import build_cache
+
+# Read-through cache for the hottest lookups, keyed by the data's version so writes never leave it stale
+cache = build_cache(prefix="task-service:")
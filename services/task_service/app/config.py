@@ -1,4 +1,21 @@
 import os
 
 DATABASE_URL = os.environ.get("DATABASE_URL", "postgresql://user:password@db:5432/dbname")
-KAFKA_BROKER = os.environ.get("KAFKA_BROKER", "kafka:9092")
\ No newline at end of file
+KAFKA_BROKER = os.environ.get("KAFKA_BROKER", "kafka:9092")
+BULK_MAX_ITEMS = int(os.environ.get("BULK_MAX_ITEMS", "10000"))
+# Run migrations on startup; disable when a separate `python -m app.migrate` step owns them
+AUTO_MIGRATE = os.environ.get("AUTO_MIGRATE", "true").lower() == "true"
+
+# Opt-in asyncpg/aiosqlite stack; the sync driver stays the default
+DB_ASYNC = os.environ.get("DB_ASYNC", "false").lower() == "true"
+DB_POOL_SIZE = int(os.environ.get("DB_POOL_SIZE", "5"))
+DB_MAX_OVERFLOW = int(os.environ.get("DB_MAX_OVERFLOW", "10"))
+# Connections opened during startup, before /ready passes
+DB_POOL_WARMUP = int(os.environ.get("DB_POOL_WARMUP", str(DB_POOL_SIZE)))
+
+# Comma-separated read replica URLs; read-only endpoints are spread over them round-robin
+DATABASE_REPLICA_URLS = [url.strip() for url in os.environ.get("DATABASE_REPLICA_URLS", "").split(",") if url.strip()]
+# An unreachable replica is skipped for this long before it is tried again
+REPLICA_RETRY_SECONDS = float(os.environ.get("REPLICA_RETRY_SECONDS", "10"))
+# After a write, the client's reads go to the primary for this long (0 disables)
+READ_YOUR_WRITES_SECONDS = float(os.environ.get("READ_YOUR_WRITES_SECONDS", "5"))
@@ -1,7 +1,97 @@
-from sqlalchemy import create_engine
+from fastapi import Request, Response
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
 from sqlalchemy.orm import sessionmaker, declarative_base
-from .config import DATABASE_URL
+from shared.async_db import ThreadedSession
+from shared.database import create_service_engine
+from shared.pagination import aiter_ndjson, iter_ndjson
+from shared.replicas import ReplicaSet, mark_write_on_commit, wrote_recently
+from .config import (
+    DATABASE_REPLICA_URLS,
+    DATABASE_URL,
+    DB_ASYNC,
+    DB_MAX_OVERFLOW,
+    DB_POOL_SIZE,
+    READ_YOUR_WRITES_SECONDS,
+    REPLICA_RETRY_SECONDS,
+)
 
-engine = create_engine(DATABASE_URL)
+SERVICE = "task-service"
+
+# With DB_ASYNC each worker holds both engines, and DB_POOL_AUTOSIZE splits the budget between them
+ENGINES_PER_PROCESS = 2 if DB_ASYNC else 1
+engine = create_service_engine(
+    DATABASE_URL, SERVICE, DB_POOL_SIZE, DB_MAX_OVERFLOW, engines_per_process=ENGINES_PER_PROCESS
+)
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
-Base = declarative_base()
\ No newline at end of file
+Base = declarative_base()
+
+async_engine = None
+AsyncSessionLocal = None
+if DB_ASYNC:
+    async_engine = create_service_engine(
+        DATABASE_URL,
+        SERVICE,
+        DB_POOL_SIZE,
+        DB_MAX_OVERFLOW,
+        use_async=True,
+        engines_per_process=ENGINES_PER_PROCESS,
+    )
+    AsyncSessionLocal = async_sessionmaker(async_engine, autoflush=False, expire_on_commit=False)
+
+def _replica_sessionmaker(index, url):
+    # Replicas use the same stack as the primary; each one is its own server and connection budget
+    replica = create_service_engine(
+        url, SERVICE, DB_POOL_SIZE, DB_MAX_OVERFLOW, use_async=DB_ASYNC, name=f"replica{index}"
+    )
+    if DB_ASYNC:
+        return async_sessionmaker(replica, autoflush=False, expire_on_commit=False)
+    return sessionmaker(autocommit=False, autoflush=False, bind=replica)
+
+def _as_async(session):
+    return session if isinstance(session, AsyncSession) else ThreadedSession(session)
+
+replicas = ReplicaSet(
+    SERVICE,
+    [_replica_sessionmaker(index, url) for index, url in enumerate(DATABASE_REPLICA_URLS, 1)],
+    REPLICA_RETRY_SECONDS,
+    wrap=_as_async,
+)
+
+def _primary_sessionmaker():
+    return AsyncSessionLocal if AsyncSessionLocal is not None else SessionLocal
+
+async def get_db(response: Response):
+    """Primary session for endpoints that write; once a write commits, the client's reads stay on the primary for a while."""
+    db = _as_async(_primary_sessionmaker()())
+    mark_write_on_commit(db.sync_session, response, READ_YOUR_WRITES_SECONDS)
+    try:
+        yield db
+    finally:
+        await db.close()
+
+async def get_read_db(request: Request):
+    """Session for read-only endpoints: a replica, unless none is reachable or the client just wrote."""
+    factory, db = _primary_sessionmaker(), None
+    if replicas:
+        if wrote_recently(request):
+            replicas.route("primary_recent_write")
+        elif (replica := await replicas.open()) is not None:
+            factory, db = replica
+        else:
+            replicas.route("primary_fallback")
+    # Streams open their own session, on the same database as the request
+    request.state.read_sessionmaker = factory
+    if db is None:
+        db = _as_async(factory())
+    try:
+        yield db
+    finally:
+        await db.close()
+
+def stream_ndjson(stmt, schema, request=None):
+    """Stream a select as NDJSON from the database get_read_db picked for the request."""
+    factory = getattr(request.state, "read_sessionmaker", None) if request is not None else None
+    factory = factory or _primary_sessionmaker()
+    if isinstance(factory, async_sessionmaker):
+        return aiter_ndjson(factory, stmt, schema)
+    return iter_ndjson(factory, stmt, schema)
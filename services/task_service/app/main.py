@@ -1,8 +1,42 @@
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
-from .db import Base, engine
+from starlette.concurrency import run_in_threadpool
+from shared.migrations import upgrade
+from shared.database import setup_pool_debug
+from shared.http_cache import setup_compression
+from shared.logs import setup_logging
+from shared.metrics import setup_metrics
+from shared.outbox import OutboxRelay
+from shared.startup import setup_readiness, warm_pools
+from shared.tracing import setup_tracing
+from .config import AUTO_MIGRATE, DB_POOL_WARMUP
+from .db import Base, SessionLocal, async_engine, engine
 from .api import router
+from .kafka_producer import kafka_producer
+from .models import OutboxEvent
 
-Base.metadata.create_all(bind=engine)
+outbox_relay = OutboxRelay(SessionLocal, OutboxEvent, kafka_producer)
 
-app = FastAPI(title="Task Service")
-app.include_router(router)
\ No newline at end of file
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    if AUTO_MIGRATE:
+        await run_in_threadpool(upgrade, engine, Base.metadata)
+    await warm_pools(DB_POOL_WARMUP, engine, async_engine)
+    # The Kafka producer connects lazily, on the relay's first publish
+    outbox_relay.start()
+    app.state.ready = True
+    yield
+    app.state.ready = False
+    # Publish what the relay already picked up before the pod goes away
+    outbox_relay.stop()
+    kafka_producer.close()
+
+app = FastAPI(title="Task Service", lifespan=lifespan)
+app.include_router(router)
+setup_readiness(app)
+
+setup_logging("task-service")
+setup_metrics(app, "task-service")
+setup_pool_debug(app, "task-service")
+setup_tracing(app, "task-service")
+setup_compression(app)
@@ -0,0 +1,14 @@
+"""
+Apply task_service schema migrations: python -m app.migrate
+"""
+import logging
+from shared.migrations import upgrade
+from .db import Base, engine
+from . import models  # noqa: F401  registers the tables on Base
+
+def main():
+    logging.basicConfig(level=logging.INFO)
+    upgrade(engine, Base.metadata)
+
+if __name__ == "__main__":
+    main()
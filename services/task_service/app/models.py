@@ -1,9 +1,28 @@
-from sqlalchemy import Column, Integer, String
+from sqlalchemy import Column, Index, Integer, String
+from shared.outbox import outbox_model
+from shared.versions import version_model
 from .db import Base
 
 class Task(Base):
     __tablename__ = "tasks"
+    __table_args__ = (
+        # Per-user lookups and user_id-filtered keyset pages read only that user's rows
+        Index("ix_tasks_user_id_id", "user_id", "id"),
+        # title LIKE 'prefix%'; varchar_pattern_ops keeps it usable under non-C collations
+        Index("ix_tasks_title_prefix", "title", "id", postgresql_ops={"title": "varchar_pattern_ops"}),
+    )
     id = Column(Integer, primary_key=True, index=True)
     title = Column(String, nullable=False)
     description = Column(String, nullable=True)
-    user_id = Column(Integer, nullable=False)  # Remove ForeignKey constraint for now
\ No newline at end of file
+    user_id = Column(Integer, nullable=False)  # Remove ForeignKey constraint for now
+
+class TaskUserStats(Base):
+    """Each user's task count and latest task, kept current by the create endpoints (see stats.py)."""
+    __tablename__ = "task_user_stats"
+    user_id = Column(Integer, primary_key=True, autoincrement=False)
+    task_count = Column(Integer, nullable=False, default=0)
+    latest_task_id = Column(Integer, nullable=True)
+    latest_task_title = Column(String, nullable=True)
+
+OutboxEvent = outbox_model(Base, "task_outbox")
+Version = version_model(Base, "task_versions")
@@ -0,0 +1,16 @@
+"""
+Recompute per-user task statistics from the tasks table: python -m app.rebuild_stats
+"""
+import logging
+from .db import engine
+from .stats import rebuild_stats
+
+logger = logging.getLogger(__name__)
+
+def main():
+    logging.basicConfig(level=logging.INFO)
+    users, tasks = rebuild_stats(engine)
+    logger.info(f"Rebuilt task stats for {users} users from {tasks} tasks")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,97 @@
+"""
+Per-user task statistics
+
+task_user_stats holds one row per user with their task count and latest task.
+The create endpoints upsert it in the same transaction as the tasks, so the
+stats commit or roll back with them and /tasks/stats/{user_id} reads a single
+row instead of counting the user's tasks. Concurrent creates for one user
+queue on that user's stats row until the first one commits.
+
+rebuild_stats() recomputes the table from tasks in one streaming pass ordered
+by (user_id, id), which ix_tasks_user_id_id serves; run it with
+`python -m app.rebuild_stats` after the table is first created and whenever
+tasks were written without going through the API. The rebuild bumps every
+version counter, so clients revalidate whatever they cached.
+"""
+from datetime import datetime, timezone
+from itertools import groupby
+from sqlalchemy import case, delete, select, text, update
+from sqlalchemy.dialects import postgresql, sqlite
+from shared.pagination import STREAM_BATCH_SIZE
+from .models import Task, TaskUserStats, Version
+
+_INSERTS = {"postgresql": postgresql.insert, "sqlite": sqlite.insert}
+
+
+def stats_rows(tasks):
+    """One stats row per user for newly created tasks (anything with id, title and user_id), ordered by user."""
+    rows = []
+    for user_id, owned in groupby(sorted(tasks, key=lambda task: (task.user_id, task.id)), key=lambda task: task.user_id):
+        owned = list(owned)
+        rows.append({
+            "user_id": user_id,
+            "task_count": len(owned),
+            "latest_task_id": owned[-1].id,
+            "latest_task_title": owned[-1].title,
+        })
+    return rows
+
+
+def upsert_stats(dialect_name, rows):
+    """INSERT ... ON CONFLICT that adds ``rows`` to the users' existing stats."""
+    stmt = _INSERTS[dialect_name](TaskUserStats).values(rows)
+    new = stmt.excluded
+    newer = new.latest_task_id > TaskUserStats.latest_task_id
+    return stmt.on_conflict_do_update(
+        index_elements=[TaskUserStats.user_id],
+        set_={
+            "task_count": TaskUserStats.task_count + new.task_count,
+            # Every SET expression sees the row as it was, so both compare against the old latest id
+            "latest_task_id": case((newer, new.latest_task_id), else_=TaskUserStats.latest_task_id),
+            "latest_task_title": case((newer, new.latest_task_title), else_=TaskUserStats.latest_task_title),
+        },
+    )
+
+
+async def record_created(db, dialect_name, tasks):
+    """Count created tasks in their users' stats, inside the caller's transaction."""
+    rows = stats_rows(tasks)
+    if rows:
+        # Rows are ordered by user_id, so concurrent bulk creates lock stats rows in the same order
+        await db.execute(upsert_stats(dialect_name, rows))
+
+
+def rebuild_stats(engine, batch_size=STREAM_BATCH_SIZE):
+    """Replace task_user_stats with counts recomputed from tasks; returns (users, tasks)."""
+    users = tasks = 0
+    with engine.begin() as conn:
+        if engine.dialect.name == "postgresql":
+            # Creates wait on their stats upsert until the rebuild commits, so none is lost or counted twice
+            conn.execute(text(f"LOCK TABLE {TaskUserStats.__tablename__} IN EXCLUSIVE MODE"))
+        conn.execute(delete(TaskUserStats))
+
+        result = conn.execution_options(yield_per=batch_size).execute(
+            select(Task.id, Task.title, Task.user_id).order_by(Task.user_id, Task.id)
+        )
+        pending = []
+        current = None
+        for row in result:
+            tasks += 1
+            if current is not None and current["user_id"] == row.user_id:
+                current["task_count"] += 1
+                current["latest_task_id"], current["latest_task_title"] = row.id, row.title
+                continue
+            if current is not None:
+                pending.append(current)
+                if len(pending) >= batch_size:
+                    conn.execute(TaskUserStats.__table__.insert(), pending)
+                    pending = []
+            users += 1
+            current = {"user_id": row.user_id, "task_count": 1, "latest_task_id": row.id, "latest_task_title": row.title}
+        if current is not None:
+            pending.append(current)
+        if pending:
+            conn.execute(TaskUserStats.__table__.insert(), pending)
+        # Every validator changes too: stats may differ, and so may tasks written around the API
+        conn.execute(update(Version).values(version=Version.version + 1, updated_at=datetime.now(timezone.utc)))
+    return users, tasks
@@ -1,22 +1,31 @@
-from fastapi import APIRouter, Depends, HTTPException
-from sqlalchemy.orm import Session
-from .db import SessionLocal
-from .models import User
-from .kafka_producer import kafka_producer
-from shared.common_schemas import UserCreate, UserRead
+from fastapi import APIRouter, Body, Depends, HTTPException, Query, Request
+from fastapi.responses import StreamingResponse
+from sqlalchemy import insert, or_, select, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+from .cache import cache
+from .config import BULK_MAX_ITEMS
+from .db import engine, get_db, get_read_db, stream_ndjson
+from .models import OutboxEvent, User, Version
+from .passwords import password_hasher
+from shared.common_schemas import BulkItemError, UserBulkResult, UserCreate, UserLogin, UserRead
+from shared.fast_json import json_response, row_dicts, schema_columns
+from shared.http_cache import check_conditional, make_etag
+from shared.outbox import outbox_row
+from shared.pagination import (
+    DEFAULT_PAGE_SIZE,
+    MAX_PAGE_SIZE,
+    NEXT_CURSOR_HEADER,
+    keyset_select,
+    next_cursor,
+)
+from shared.versions import bump_versions, read_table_version, table_scopes
 import logging
 
 logger = logging.getLogger(__name__)
 
 router = APIRouter()
 
-def get_db():
-    db = SessionLocal()
-    try:
-        yield db
-    finally:
-        db.close()
-
 @router.get("/")
 def root():
     return {"service": "user-service", "status": "running", "version": "1.0.0"}
@@ -25,35 +34,163 @@ def root():
 def health():
     return {"status": "healthy", "service": "user-service"}
 
+@router.get("/cache/stats")
+async def cache_stats():
+    return await cache.stats()
+
+def _user_created_event(user):
+    return {
+        "id": user.id,
+        "username": user.username,
+        "email": user.email,
+        "event_type": "user.created"
+    }
+
 @router.post("/users/", response_model=UserRead)
-def create_user(user: UserCreate, db: Session = Depends(get_db)):
-    db_user = User(username=user.username, email=user.email, password=user.password)
+async def create_user(user: UserCreate, db: AsyncSession = Depends(get_db)):
+    hashed = await password_hasher.hash(user.password)
+    db_user = User(username=user.username, email=user.email, password=hashed)
     db.add(db_user)
-    db.commit()
-    db.refresh(db_user)
+    await db.flush()
     
-    # Publish user created event to Kafka
-    try:
-        event_data = {
-            "id": db_user.id,
-            "username": db_user.username,
-            "email": db_user.email,
-            "event_type": "user.created"
-        }
-        kafka_producer.produce_event("user.created", event_data)
-        logger.info(f"Published user.created event for user {db_user.id}")
-    except Exception as e:
-        logger.error(f"Failed to publish user.created event: {e}")
+    # The event and the table version commit atomically with the user; the outbox relay publishes the event to Kafka
+    db.add(OutboxEvent(**outbox_row("user.created", _user_created_event(db_user))))
+    await bump_versions(db, Version, engine.dialect.name, table_scopes("users", [db_user.id]))
+    await db.commit()
+    await db.refresh(db_user)
+    await cache.invalidate(f"user:{db_user.id}")
+    logger.info("Queued user.created event for user %s", db_user.id, extra={"category": "event.queued"})
     
     return db_user
 
+async def _reject_duplicate_users(users: list[UserCreate], db: AsyncSession, errors: list[BulkItemError]):
+    """Split out items whose username or email is repeated in the batch or already taken."""
+    taken = (await db.execute(
+        select(User.username, User.email).where(
+            or_(
+                User.username.in_({user.username for user in users}),
+                User.email.in_({user.email for user in users}),
+            )
+        )
+    )).all()
+    usernames = {row.username for row in taken}
+    emails = {row.email for row in taken}
+
+    accepted = []
+    for index, user in enumerate(users):
+        if user.username in usernames:
+            errors.append(BulkItemError(index=index, detail=f"Username '{user.username}' already exists"))
+        elif user.email in emails:
+            errors.append(BulkItemError(index=index, detail=f"Email '{user.email}' already exists"))
+        else:
+            usernames.add(user.username)
+            emails.add(user.email)
+            accepted.append((index, user))
+    return accepted
+
+async def _insert_users_individually(accepted, rows, db: AsyncSession, errors: list[BulkItemError]):
+    """Fallback used when the batch insert loses a race on the unique indexes."""
+    created = []
+    for (index, user), values in zip(accepted, rows):
+        try:
+            async with db.begin_nested():
+                row = (await db.execute(
+                    insert(User).returning(User.id, User.username, User.email),
+                    values,
+                )).one()
+            created.append(row)
+        except IntegrityError:
+            errors.append(BulkItemError(index=index, detail=f"User '{user.username}' violates a unique constraint"))
+    return created
+
+@router.post("/users/bulk", response_model=UserBulkResult)
+async def create_users_bulk(
+    users: list[UserCreate] = Body(..., min_length=1, max_length=BULK_MAX_ITEMS),
+    db: AsyncSession = Depends(get_db),
+):
+    errors: list[BulkItemError] = []
+    accepted = await _reject_duplicate_users(users, db, errors)
+
+    created = []
+    if accepted:
+        hashes = await password_hasher.hash_many([user.password for _, user in accepted])
+        rows = [{**user.model_dump(), "password": hashed} for (_, user), hashed in zip(accepted, hashes)]
+        try:
+            # One multi-row INSERT ... RETURNING in a single transaction
+            created = (await db.execute(
+                insert(User).returning(User.id, User.username, User.email, sort_by_parameter_order=True),
+                rows,
+            )).all()
+        except IntegrityError:
+            await db.rollback()
+            created = await _insert_users_individually(accepted, rows, db, errors)
+
+    if created:
+        await db.execute(
+            insert(OutboxEvent),
+            [outbox_row("user.created", _user_created_event(row)) for row in created],
+        )
+        await bump_versions(db, Version, engine.dialect.name, table_scopes("users", [row.id for row in created]))
+        await db.commit()
+        await cache.invalidate(*(f"user:{row.id}" for row in created))
+        logger.info("Queued %d user.created events", len(created), extra={"category": "event.queued"})
+
+    return {"created": created, "errors": sorted(errors, key=lambda error: error.index)}
+
+@router.post("/users/login", response_model=UserRead)
+async def login(credentials: UserLogin, db: AsyncSession = Depends(get_db)):
+    user = (await db.scalars(select(User).where(User.username == credentials.username))).first()
+    # Unknown users get the same error, after the same kind of work, as a wrong password
+    if user is None:
+        await password_hasher.hash(credentials.password)
+        raise HTTPException(status_code=401, detail="Invalid username or password")
+    if not await password_hasher.verify(user.password, credentials.password):
+        raise HTTPException(status_code=401, detail="Invalid username or password")
+
+    result = UserRead.model_validate(user, from_attributes=True)
+    if password_hasher.needs_rehash(user.password):
+        await db.execute(
+            update(User).where(User.id == user.id).values(password=await password_hasher.hash(credentials.password))
+        )
+        await db.commit()
+    return result
+
 @router.get("/users/", response_model=list[UserRead])
-def list_users(db: Session = Depends(get_db)):
-    return db.query(User).all()
+async def list_users(
+    request: Request,
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    after: int | None = Query(None, description="Return users with an id greater than this cursor"),
+    stream: bool = Query(False, description="Stream every user after the cursor as NDJSON"),
+    db: AsyncSession = Depends(get_read_db),
+):
+    # Plain column rows encoded with orjson: no ORM entities and no response_model validation
+    columns = schema_columns(User, UserRead)
+    if stream:
+        return StreamingResponse(
+            stream_ndjson(keyset_select(User, after=after, columns=columns), UserRead, request),
+            media_type="application/x-ndjson",
+        )
+
+    version, modified = await read_table_version(db, Version, "users")
+    headers, unchanged = check_conditional(request, make_etag("users", version, limit, after), modified)
+    if unchanged is not None:
+        return unchanged
+
+    users = (await db.execute(keyset_select(User, after=after, limit=limit, columns=columns))).all()
+    cursor = next_cursor(users, limit)
+    if cursor is not None:
+        headers[NEXT_CURSOR_HEADER] = str(cursor)
+    return json_response(row_dicts(users, UserRead), headers=headers)
 
 @router.get("/users/{user_id}", response_model=UserRead)
-def get_user(user_id: int, db: Session = Depends(get_db)):
-    user = db.query(User).filter(User.id == user_id).first()
+async def get_user(request: Request, user_id: int, db: AsyncSession = Depends(get_read_db)):
+    async def load_user():
+        user = await db.get(User, user_id)
+        return UserRead.model_validate(user, from_attributes=True).model_dump() if user else None
+
+    user = await cache.get_or_load(f"user:{user_id}", load_user)
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
-    return user
\ No newline at end of file
+    # Users do not change once created, so the cached fields are the validator: no version lookup needed
+    headers, unchanged = check_conditional(request, make_etag("user", user["id"], user["username"], user["email"]))
+    return unchanged or json_response(user, headers=headers)
\ No newline at end of file
@@ -0,0 +1,4 @@
+from shared.cache import build_cache
+
+# Read-through cache for the hottest lookups, invalidated by this service's writes
+cache = build_cache(prefix="user-service:")
@@ -1,4 +1,6 @@
 from sqlalchemy import Column, Integer, String
+from shared.outbox import outbox_model
+from shared.versions import version_model
 from .db import Base
 
 class User(Base):
@@ -6,4 +8,7 @@ class User(Base):
     id = Column(Integer, primary_key=True, index=True)
     username = Column(String, unique=True, index=True, nullable=False)
     email = Column(String, unique=True, index=True, nullable=False)
-    password = Column(String, nullable=False)
\ No newline at end of file
+    password = Column(String, nullable=False)
+
+OutboxEvent = outbox_model(Base, "user_outbox")
+Version = version_model(Base, "user_versions")
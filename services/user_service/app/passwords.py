@@ -0,0 +1,91 @@
+"""
+Password hashing off the event loop
+
+argon2id hashing is deliberately CPU and memory heavy, so it runs on a
+dedicated, bounded pool instead of the event loop or the AnyIO threadpool that
+serves database calls. argon2-cffi releases the GIL while hashing, so the
+default thread pool uses every core; PASSWORD_HASH_POOL=process isolates the
+work in separate processes instead.
+"""
+import asyncio
+import hmac
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from functools import lru_cache
+from argon2 import PasswordHasher
+from argon2.exceptions import InvalidHashError, VerificationError
+from .config import (
+    PASSWORD_HASH_MEMORY_COST,
+    PASSWORD_HASH_PARALLELISM,
+    PASSWORD_HASH_POOL,
+    PASSWORD_HASH_TIME_COST,
+    PASSWORD_HASH_WORKERS,
+)
+
+HASH_PREFIX = "$argon2"
+
+
+@lru_cache(maxsize=None)
+def _hasher(time_cost, memory_cost, parallelism):
+    return PasswordHasher(time_cost=time_cost, memory_cost=memory_cost, parallelism=parallelism)
+
+
+# Module-level so they can be sent to a process pool
+def _hash(params, password):
+    return _hasher(*params).hash(password)
+
+
+def _verify(params, hashed, password):
+    if not hashed.startswith(HASH_PREFIX):
+        # Rows written before hashing was introduced; rehashed on the next successful login
+        return hmac.compare_digest(hashed.encode("utf-8"), password.encode("utf-8"))
+    try:
+        return _hasher(*params).verify(hashed, password)
+    except (VerificationError, InvalidHashError):
+        return False
+
+
+class PasswordHasherPool:
+    def __init__(
+        self,
+        workers=PASSWORD_HASH_WORKERS,
+        kind=PASSWORD_HASH_POOL,
+        time_cost=PASSWORD_HASH_TIME_COST,
+        memory_cost=PASSWORD_HASH_MEMORY_COST,
+        parallelism=PASSWORD_HASH_PARALLELISM,
+    ):
+        if kind not in ("thread", "process"):
+            raise ValueError(f"Unsupported PASSWORD_HASH_POOL {kind!r}")
+        self.workers = workers
+        self.kind = kind
+        self.params = (time_cost, memory_cost, parallelism)
+        self._executor = None
+
+    @property
+    def executor(self):
+        if self._executor is None:
+            if self.kind == "process":
+                self._executor = ProcessPoolExecutor(max_workers=self.workers)
+            else:
+                self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="password-hash")
+        return self._executor
+
+    async def hash(self, password):
+        return await asyncio.get_running_loop().run_in_executor(self.executor, _hash, self.params, password)
+
+    async def hash_many(self, passwords):
+        return await asyncio.gather(*(self.hash(password) for password in passwords))
+
+    async def verify(self, hashed, password):
+        return await asyncio.get_running_loop().run_in_executor(self.executor, _verify, self.params, hashed, password)
+
+    def needs_rehash(self, hashed):
+        """True for legacy plaintext rows and hashes made with older cost parameters."""
+        return not hashed.startswith(HASH_PREFIX) or _hasher(*self.params).check_needs_rehash(hashed)
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
+            self._executor = None
+
+
+password_hasher = PasswordHasherPool()
@@ -0,0 +1,94 @@
+"""
+Helpers for running the services on either a sync or an async SQLAlchemy stack
+"""
+from contextlib import asynccontextmanager
+
+from sqlalchemy.engine import CursorResult, make_url
+from starlette.concurrency import run_in_threadpool
+
+ASYNC_DRIVERS = {
+    "postgresql": "postgresql+asyncpg",
+    "postgresql+psycopg2": "postgresql+asyncpg",
+    "sqlite": "sqlite+aiosqlite",
+    "sqlite+pysqlite": "sqlite+aiosqlite",
+}
+
+
+def async_url(database_url):
+    """Translate a sync DATABASE_URL into the equivalent async driver URL."""
+    url = make_url(database_url)
+    return url.set(drivername=ASYNC_DRIVERS.get(url.drivername, url.drivername))
+
+
+def _returns_rows(statement, result):
+    if isinstance(result, CursorResult):
+        return result.returns_rows
+    # ORM bulk DML hands back an empty result of its own unless the statement has RETURNING
+    return not (getattr(statement, "is_dml", False) and not statement.exported_columns)
+
+
+class ThreadedSession:
+    """AsyncSession-compatible facade over a sync Session.
+
+    Every call that talks to the database runs in the AnyIO threadpool, so route
+    handlers can be written once as ``async def`` and still run on the sync
+    driver when the async stack is disabled.
+    """
+
+    def __init__(self, sync_session):
+        self.sync_session = sync_session
+
+    def add(self, instance):
+        self.sync_session.add(instance)
+
+    def add_all(self, instances):
+        self.sync_session.add_all(instances)
+
+    def _execute_buffered(self, statement, params=None, **kwargs):
+        # Fetch rows inside the worker thread, like AsyncSession does
+        result = self.sync_session.execute(statement, params, **kwargs)
+        if not _returns_rows(statement, result):
+            # DML without RETURNING: nothing to buffer, rowcount is already known
+            return result
+        return result.freeze()()
+
+    async def execute(self, statement, params=None, **kwargs):
+        return await run_in_threadpool(self._execute_buffered, statement, params, **kwargs)
+
+    async def scalars(self, statement, params=None, **kwargs):
+        return (await self.execute(statement, params, **kwargs)).scalars()
+
+    async def scalar(self, statement, params=None, **kwargs):
+        return (await self.execute(statement, params, **kwargs)).scalar()
+
+    async def connection(self):
+        return await run_in_threadpool(self.sync_session.connection)
+
+    async def get(self, entity, ident):
+        return await run_in_threadpool(self.sync_session.get, entity, ident)
+
+    async def flush(self):
+        await run_in_threadpool(self.sync_session.flush)
+
+    async def commit(self):
+        await run_in_threadpool(self.sync_session.commit)
+
+    async def rollback(self):
+        await run_in_threadpool(self.sync_session.rollback)
+
+    async def refresh(self, instance):
+        await run_in_threadpool(self.sync_session.refresh, instance)
+
+    async def close(self):
+        await run_in_threadpool(self.sync_session.close)
+
+    @asynccontextmanager
+    async def begin_nested(self):
+        nested = await run_in_threadpool(self.sync_session.begin_nested)
+        try:
+            yield nested
+        except BaseException:
+            await run_in_threadpool(nested.rollback)
+            raise
+        else:
+            await run_in_threadpool(nested.commit)
@@ -0,0 +1,198 @@
+"""
+Read-through cache for hot lookups
+
+The default backend is an in-process LRU with a TTL. CACHE_BACKEND=redis shares
+entries between replicas; CACHE_BACKEND=none disables caching. With the
+in-process backend a write only invalidates the replica that served it, so
+other replicas may serve a stale entry for up to CACHE_TTL_SECONDS.
+"""
+import asyncio
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+
+CACHE_BACKEND = os.getenv("CACHE_BACKEND", "memory")
+CACHE_MAX_ENTRIES = int(os.getenv("CACHE_MAX_ENTRIES", "10000"))
+CACHE_TTL_SECONDS = float(os.getenv("CACHE_TTL_SECONDS", "30"))
+REDIS_URL = os.getenv("REDIS_URL", "redis://redis:6379/0")
+
+MISSING = object()
+
+
+class CacheStats:
+    def __init__(self):
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def as_dict(self):
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_ratio": round(self.hits / lookups, 4) if lookups else 0.0,
+        }
+
+
+class LRUCache:
+    """Bounded in-process cache; expired entries count as misses and are dropped lazily."""
+
+    name = "memory"
+
+    def __init__(self, max_entries=CACHE_MAX_ENTRIES, ttl=CACHE_TTL_SECONDS):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.stats = CacheStats()
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    async def get(self, key):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None or entry[0] < time.monotonic():
+                if entry is not None:
+                    del self._data[key]
+                self.stats.misses += 1
+                return MISSING
+            self._data.move_to_end(key)
+            self.stats.hits += 1
+            return entry[1]
+
+    async def set(self, key, value):
+        with self._lock:
+            self._data[key] = (time.monotonic() + self.ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+                self.stats.evictions += 1
+
+    async def delete(self, *keys):
+        with self._lock:
+            for key in keys:
+                self._data.pop(key, None)
+
+    async def size(self):
+        return len(self._data)
+
+
+class RedisCache:
+    """Shared cache backed by Redis; values are stored as JSON with a TTL."""
+
+    name = "redis"
+
+    def __init__(self, url=REDIS_URL, ttl=CACHE_TTL_SECONDS, prefix=""):
+        try:
+            import redis.asyncio as redis
+        except ImportError as e:
+            raise RuntimeError("CACHE_BACKEND=redis requires the 'redis' package") from e
+        self.client = redis.from_url(url)
+        self.ttl = ttl
+        self.prefix = prefix
+        self.stats = CacheStats()
+
+    async def get(self, key):
+        raw = await self.client.get(self.prefix + key)
+        if raw is None:
+            self.stats.misses += 1
+            return MISSING
+        self.stats.hits += 1
+        return json.loads(raw)
+
+    async def set(self, key, value):
+        await self.client.set(self.prefix + key, json.dumps(value), px=int(self.ttl * 1000))
+
+    async def delete(self, *keys):
+        if keys:
+            await self.client.delete(*(self.prefix + key for key in keys))
+
+    async def size(self):
+        info = await self.client.info("stats")
+        # Redis evicts on its own under maxmemory; surface that as our eviction count
+        self.stats.evictions = info.get("evicted_keys", 0)
+        return await self.client.dbsize()
+
+
+class NullCache:
+    name = "none"
+
+    def __init__(self):
+        self.stats = CacheStats()
+
+    async def get(self, key):
+        self.stats.misses += 1
+        return MISSING
+
+    async def set(self, key, value):
+        pass
+
+    async def delete(self, *keys):
+        pass
+
+    async def size(self):
+        return 0
+
+
+class ReadThroughCache:
+    """Loads missing keys through a loader, with one in-flight load per key.
+
+    Concurrent misses on the same key wait for the first loader instead of all
+    hitting the database. A load that overlaps an invalidation is returned to
+    its callers but not stored, so it cannot resurrect data a write replaced.
+    """
+
+    def __init__(self, backend):
+        self.backend = backend
+        self._loading = {}
+        self._invalidations = 0
+
+    async def get_or_load(self, key, loader):
+        value = await self.backend.get(key)
+        if value is not MISSING:
+            return value
+
+        pending = self._loading.get(key)
+        if pending is not None:
+            return await asyncio.shield(pending)
+
+        future = asyncio.get_running_loop().create_future()
+        self._loading[key] = future
+        invalidations = self._invalidations
+        try:
+            value = await loader()
+            if value is not None and invalidations == self._invalidations:
+                await self.backend.set(key, value)
+            future.set_result(value)
+            return value
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except Exception as e:
+            future.set_exception(e)
+            # Waiters re-raise it; don't warn about it if there were none
+            future.exception()
+            raise
+        finally:
+            del self._loading[key]
+
+    async def invalidate(self, *keys):
+        self._invalidations += 1
+        await self.backend.delete(*keys)
+
+    async def stats(self):
+        return {
+            "backend": self.backend.name,
+            "size": await self.backend.size(),
+            **self.backend.stats.as_dict(),
+        }
+
+
+def build_cache(prefix=""):
+    """Build the cache configured by CACHE_BACKEND."""
+    if CACHE_BACKEND == "redis":
+        return ReadThroughCache(RedisCache(prefix=prefix))
+    if CACHE_BACKEND == "none":
+        return ReadThroughCache(NullCache())
+    return ReadThroughCache(LRUCache())
@@ -10,6 +10,10 @@ class UserCreate(UserBase):
 class UserRead(UserBase):
     id: int
 
+class UserLogin(BaseModel):
+    username: str
+    password: str
+
 class TaskBase(BaseModel):
     title: str
     description: str | None = None
@@ -19,4 +23,22 @@ class TaskCreate(TaskBase):
 
 class TaskRead(TaskBase):
     id: int
-    user_id: int
\ No newline at end of file
+    user_id: int
+
+class TaskUserStatsRead(BaseModel):
+    user_id: int
+    task_count: int
+    latest_task_id: int | None = None
+    latest_task_title: str | None = None
+
+class BulkItemError(BaseModel):
+    index: int
+    detail: str
+
+class UserBulkResult(BaseModel):
+    created: list[UserRead]
+    errors: list[BulkItemError] = []
+
+class TaskBulkResult(BaseModel):
+    created: list[TaskRead]
+    errors: list[BulkItemError] = []
@@ -1,40 +1,254 @@
 """
-Shared database initialization for all microservices
+Engine factory shared by the services
+
+Every engine gets the same pool policy: a bounded pool with overflow, a
+checkout timeout, periodic recycling and a pre-ping before each checkout. With
+DB_POOL_AUTOSIZE the pool is derived from a connection budget instead of
+DB_POOL_SIZE/DB_MAX_OVERFLOW: DB_MAX_CONNECTIONS (this service's share of the
+server's max_connections) minus DB_RESERVED_CONNECTIONS is split between
+SERVICE_REPLICAS x WEB_CONCURRENCY worker processes and the engines in each.
+
+Each engine's pool is monitored: checkout waits, timeouts and connections in
+use feed the Prometheus metrics, and setup_pool_debug() serves them with the
+pool's current saturation at /debug/pool. The engine is created with a
+subclass of its dialect's pool class that times the public Pool.connect(), so
+the timing survives dispose() and needs nothing private from SQLAlchemy.
 """
+import inspect
 import logging
-from sqlalchemy import create_engine
-from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker
 import os
+import threading
+import time
+from collections import deque
+from sqlalchemy import create_engine, event
+from sqlalchemy.engine import make_url
+from sqlalchemy.exc import TimeoutError as PoolTimeout
+from sqlalchemy.ext.asyncio import create_async_engine
+from starlette.responses import JSONResponse
+from shared.async_db import async_url
+from shared.metrics import DB_POOL_CHECKOUT_WAIT, DB_POOL_IN_USE, DB_POOL_SATURATION, DB_POOL_TIMEOUTS
 
-# Configure logging
-logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-DATABASE_URL = os.getenv("DATABASE_URL", "postgresql://user:password@db:5432/dbname")
-
-engine = create_engine(DATABASE_URL)
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
-Base = declarative_base()
-
-def get_db():
-    db = SessionLocal()
-    try:
-        yield db
-    finally:
-        db.close()
-
-def init_all_tables():
-    """Initialize all tables from all services"""
-    try:
-        # Import all models to register them with Base
-        from services.user_service.app.models import User  # noqa: F401
-        from services.task_service.app.models import Task  # noqa: F401
-        
-        logger.info("Creating all database tables...")
-        Base.metadata.create_all(bind=engine)
-        logger.info("All database tables created successfully")
-        
-    except Exception as e:
-        logger.error(f"Error creating database tables: {e}")
-        raise
\ No newline at end of file
+# Seconds to wait for a free connection before raising
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "30"))
+# Reconnect connections older than this many seconds (-1 disables)
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "1800"))
+DB_POOL_PRE_PING = os.getenv("DB_POOL_PRE_PING", "true").lower() == "true"
+
+# Size pools from the connection budget instead of DB_POOL_SIZE/DB_MAX_OVERFLOW
+DB_POOL_AUTOSIZE = os.getenv("DB_POOL_AUTOSIZE", "false").lower() == "true"
+DB_MAX_CONNECTIONS = int(os.getenv("DB_MAX_CONNECTIONS", "100"))
+# Kept free for migrations, admin sessions and the like
+DB_RESERVED_CONNECTIONS = int(os.getenv("DB_RESERVED_CONNECTIONS", "5"))
+SERVICE_REPLICAS = int(os.getenv("SERVICE_REPLICAS", "1"))
+# Same variable uvicorn and gunicorn read for the worker count
+WEB_CONCURRENCY = int(os.getenv("WEB_CONCURRENCY", "1"))
+
+# Checkout waits kept per pool for the /debug/pool percentiles
+POOL_WAIT_WINDOW = 1024
+
+_monitors = {}
+
+
+def autosize_pool(
+    max_connections=DB_MAX_CONNECTIONS,
+    replicas=SERVICE_REPLICAS,
+    workers=WEB_CONCURRENCY,
+    engines=1,
+    reserved=DB_RESERVED_CONNECTIONS,
+):
+    """(pool_size, max_overflow) so every engine in every process together stays within the budget."""
+    pools = replicas * workers * engines
+    if max_connections - reserved < pools:
+        # Every engine still gets one connection, so the fleet can open more than the budget
+        logger.warning(
+            f"DB_MAX_CONNECTIONS={max_connections} minus {reserved} reserved cannot give {pools} pools "
+            f"({replicas} replicas x {workers} workers x {engines} engines) a connection each; "
+            f"they may open up to {pools} connections"
+        )
+    per_engine = max(1, (max_connections - reserved) // pools)
+    # Two thirds stay open, the rest is overflow opened only under load
+    pool_size = max(1, per_engine * 2 // 3)
+    return pool_size, per_engine - pool_size
+
+
+def pool_settings(database_url, pool_size, max_overflow):
+    """Pool keyword arguments for create_engine; SQLite keeps SQLAlchemy's default pool."""
+    options = {"pool_pre_ping": DB_POOL_PRE_PING}
+    if make_url(database_url).get_backend_name() == "sqlite":
+        return options
+    options.update(
+        pool_size=pool_size,
+        max_overflow=max_overflow,
+        pool_timeout=DB_POOL_TIMEOUT,
+        pool_recycle=DB_POOL_RECYCLE,
+    )
+    return options
+
+
+class PoolMonitor:
+    """Records checkout waits, timeouts and connections in use for one engine's pool."""
+
+    def __init__(self, service, name):
+        self.service = service
+        self.name = name
+        self.engine = None
+        # Most connections the pool will open, from its constructor arguments; None without a limit
+        self.capacity = None
+        self.checkouts = 0
+        self.timeouts = 0
+        self.in_use = 0
+        self.waits = deque(maxlen=POOL_WAIT_WINDOW)
+        self._lock = threading.Lock()
+        self._wait_histogram = DB_POOL_CHECKOUT_WAIT.labels(service=service, engine=name)
+        self._timeouts = DB_POOL_TIMEOUTS.labels(service=service, engine=name)
+        self._in_use_gauge = DB_POOL_IN_USE.labels(service=service, engine=name)
+        self._saturation_gauge = DB_POOL_SATURATION.labels(service=service, engine=name)
+
+    def pool_class(self, base):
+        """A subclass of ``base`` timing every checkout; pass it to create_engine as poolclass."""
+        monitor = self
+        parameters = inspect.signature(base.__init__)
+
+        class MonitoredPool(base):
+            def __init__(self, *args, **kwargs):
+                super().__init__(*args, **kwargs)
+                bound = parameters.bind(self, *args, **kwargs)
+                bound.apply_defaults()
+                monitor._set_capacity(bound.arguments.get("pool_size"), bound.arguments.get("max_overflow"))
+
+            def connect(self):
+                start = time.perf_counter()
+                try:
+                    return super().connect()
+                except PoolTimeout:
+                    monitor._record_timeout()
+                    raise
+                finally:
+                    monitor._record_wait(time.perf_counter() - start)
+
+        MonitoredPool.__name__ = MonitoredPool.__qualname__ = f"Monitored{base.__name__}"
+        return MonitoredPool
+
+    def attach(self, engine):
+        self.engine = engine
+        # Pool events carry over to the pool that replaces this one on dispose()
+        event.listen(engine.pool, "checkout", self._on_checkout)
+        event.listen(engine.pool, "checkin", self._on_checkin)
+
+    @property
+    def pool(self):
+        return self.engine.pool
+
+    def _set_capacity(self, pool_size, max_overflow):
+        if pool_size is None or max_overflow is None or max_overflow < 0:
+            self.capacity = None
+        else:
+            self.capacity = pool_size + max_overflow
+
+    def saturation(self):
+        capacity = self.capacity
+        return self.in_use / capacity if capacity else None
+
+    def _record_wait(self, seconds):
+        self._wait_histogram.observe(seconds)
+        with self._lock:
+            self.waits.append(seconds)
+
+    def _record_timeout(self):
+        with self._lock:
+            self.timeouts += 1
+        self._timeouts.inc()
+
+    def _set_in_use(self, delta):
+        with self._lock:
+            if delta > 0:
+                self.checkouts += 1
+            self.in_use += delta
+        self._in_use_gauge.set(self.in_use)
+        saturation = self.saturation()
+        if saturation is not None:
+            self._saturation_gauge.set(saturation)
+
+    def _on_checkout(self, dbapi_connection, connection_record, connection_proxy):
+        self._set_in_use(1)
+
+    def _on_checkin(self, dbapi_connection, connection_record):
+        self._set_in_use(-1)
+
+    def _wait_percentiles(self):
+        with self._lock:
+            waits = sorted(self.waits)
+        if not waits:
+            return {"p50": 0.0, "p95": 0.0, "p99": 0.0, "max": 0.0}
+        percentile = lambda q: waits[min(len(waits) - 1, int(q * len(waits)))]  # noqa: E731
+        return {"p50": percentile(0.50), "p95": percentile(0.95), "p99": percentile(0.99), "max": waits[-1]}
+
+    def status(self):
+        saturation = self.saturation()
+        return {
+            "pool": type(self.pool).__name__,
+            "capacity": self.capacity,
+            "pool_size": self.pool.size() if callable(getattr(self.pool, "size", None)) else None,
+            "checked_out": self.in_use,
+            "idle": self.pool.checkedin() if hasattr(self.pool, "checkedin") else None,
+            "saturation": round(saturation, 3) if saturation is not None else None,
+            "checkouts": self.checkouts,
+            "timeouts": self.timeouts,
+            "checkout_wait_seconds": self._wait_percentiles(),
+        }
+
+
+def create_service_engine(
+    database_url,
+    service,
+    pool_size,
+    max_overflow,
+    use_async=False,
+    engines_per_process=1,
+    name=None,
+    **overrides,
+):
+    """Create a monitored sync or async engine with the shared pool policy.
+
+    ``engines_per_process`` is how many engines each worker opens against the
+    same server, so that DB_POOL_AUTOSIZE splits the budget between them.
+    ``name`` labels the engine in /debug/pool and the metrics (default: sync or async).
+    """
+    if DB_POOL_AUTOSIZE:
+        pool_size, max_overflow = autosize_pool(engines=engines_per_process)
+    url = async_url(database_url) if use_async else make_url(database_url)
+    name = name or ("async" if use_async else "sync")
+    monitor = PoolMonitor(service, name)
+    options = {**pool_settings(database_url, pool_size, max_overflow), **overrides}
+    options["poolclass"] = monitor.pool_class(options.get("poolclass") or url.get_dialect().get_pool_class(url))
+    if use_async:
+        engine = create_async_engine(url, **options)
+        sync_engine = engine.sync_engine
+    else:
+        engine = sync_engine = create_engine(url, **options)
+    monitor.attach(sync_engine)
+    _monitors[(service, name)] = monitor
+    return engine
+
+
+def pool_monitors(service):
+    """Monitors of the engines created for ``service``, keyed by engine name."""
+    return {name: monitor for (owner, name), monitor in _monitors.items() if owner == service}
+
+
+def setup_pool_debug(app, service):
+    """Serve pool status and checkout statistics for the service's engines at /debug/pool."""
+
+    async def pool_debug_endpoint(request):
+        return JSONResponse({
+            "service": service,
+            "autosize": DB_POOL_AUTOSIZE,
+            "timeout": DB_POOL_TIMEOUT,
+            "recycle": DB_POOL_RECYCLE,
+            "pre_ping": DB_POOL_PRE_PING,
+            "pools": {name: monitor.status() for name, monitor in pool_monitors(service).items()},
+        })
+
+    app.add_route("/debug/pool", pool_debug_endpoint, include_in_schema=False)
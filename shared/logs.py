@@ -0,0 +1,245 @@
+"""
+Logging setup shared by the services
+
+setup_logging() configures the root logger once per process: records go to
+stderr as one JSON object per line (LOG_FORMAT=json) or as plain text, and with
+LOG_QUEUE the caller only puts them on a bounded queue; a background listener
+thread formats and writes them, so a slow log pipe never stalls a request or a
+consumer worker. When the queue is full the record is dropped and counted
+rather than blocking.
+
+High-volume messages carry a category, logged as ``extra={"category": ...}``.
+LOG_SAMPLING keeps a fraction of the records in a category and LOG_RATE_LIMITS
+caps a category at N records per second; both are "category=value" lists.
+Sampled records carry their sample_rate, and the first record after a
+rate-limited second reports how many were suppressed. Records without a
+category are never dropped.
+
+Dropped records are counted in log_records_dropped_total by reason.
+"""
+import atexit
+import copy
+import json
+import logging
+import os
+import queue
+import sys
+import threading
+import time
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener
+from shared.metrics import LOG_RECORDS_DROPPED
+
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO")
+# json | text
+LOG_FORMAT = os.getenv("LOG_FORMAT", "json")
+# Hand records to a background thread instead of writing them in the caller
+LOG_QUEUE = os.getenv("LOG_QUEUE", "true").lower() == "true"
+LOG_QUEUE_SIZE = int(os.getenv("LOG_QUEUE_SIZE", "10000"))
+# Fraction of records kept per category, e.g. "event.received=0.01"
+LOG_SAMPLING = os.getenv("LOG_SAMPLING", "event.received=0.01,event.handled=0.01,event.queued=0.01")
+# Records per second per category
+LOG_RATE_LIMITS = os.getenv("LOG_RATE_LIMITS", "event.duplicate=10,event.failed=20,kafka.delivery_failed=10")
+
+# LogRecord attributes that are not extras
+_RECORD_ATTRIBUTES = set(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {"message", "asctime", "taskName"}
+
+_listener = None
+_lock = threading.Lock()
+
+
+def parse_categories(spec):
+    """{category: number} from a "category=value,..." setting."""
+    categories = {}
+    for item in spec.split(","):
+        name, sep, value = item.partition("=")
+        if sep and name.strip():
+            categories[name.strip()] = float(value)
+    return categories
+
+
+class CategoryFilter(logging.Filter):
+    """Samples or rate-limits records by their category; records without one always pass."""
+
+    def __init__(self, sample_rates=None, rate_limits=None):
+        super().__init__()
+        self.sample_rates = dict(sample_rates or {})
+        # Keep every n-th record: cheaper and steadier than a random draw
+        self._every = {category: round(1 / rate) if rate > 0 else 0 for category, rate in self.sample_rates.items()}
+        self._seen = dict.fromkeys(self._every, 0)
+        self.rate_limits = dict(rate_limits or {})
+        self._windows = {category: [0, 0, 0] for category in self.rate_limits}  # second, kept, suppressed
+        self._lock = threading.Lock()
+
+    def filter(self, record):
+        category = getattr(record, "category", None)
+        if category is None:
+            return True
+        every = self._every.get(category)
+        if every is not None:
+            with self._lock:
+                seen = self._seen[category]
+                self._seen[category] = seen + 1
+            if not every or seen % every:
+                LOG_RECORDS_DROPPED.labels(reason="sampled").inc()
+                return False
+            record.sample_rate = self.sample_rates[category]
+        window = self._windows.get(category)
+        if window is not None:
+            second = int(time.monotonic())
+            with self._lock:
+                if window[0] != second:
+                    if window[2]:
+                        record.suppressed = window[2]
+                    window[:] = [second, 0, 0]
+                if window[1] >= self.rate_limits[category]:
+                    window[2] += 1
+                    LOG_RECORDS_DROPPED.labels(reason="rate_limited").inc()
+                    return False
+                window[1] += 1
+        return True
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per record, with the record's extras as fields."""
+
+    def __init__(self, service=None):
+        super().__init__()
+        self.service = service
+
+    def format(self, record):
+        entry = {
+            "time": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        if self.service:
+            entry["service"] = self.service
+        for name, value in vars(record).items():
+            if name not in _RECORD_ATTRIBUTES and not name.startswith("_"):
+                entry[name] = value
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            entry["exception"] = record.exc_text
+        return json.dumps(entry, default=str, ensure_ascii=False)
+
+
+class _StderrHandler(logging.StreamHandler):
+    """Writes to whatever sys.stderr is at the time, as logging's last-resort handler does."""
+
+    def __init__(self):
+        super().__init__(sys.stderr)
+
+    @property
+    def stream(self):
+        return sys.stderr
+
+    @stream.setter
+    def stream(self, value):
+        pass
+
+
+class _QueueHandler(QueueHandler):
+    """Enqueues without blocking and leaves the formatting to the listener."""
+
+    def prepare(self, record):
+        # Render the message now, in case its arguments change later; the listener formats the rest
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            LOG_RECORDS_DROPPED.labels(reason="queue_full").inc()
+
+
+class _Tag(logging.Filter):
+    def __init__(self, category):
+        super().__init__()
+        self.category = category
+
+    def filter(self, record):
+        record.category = self.category
+        return True
+
+
+def _route_to_root(name, category=None):
+    """Send a library logger's records through the root handlers, optionally tagged with a category."""
+    logger = logging.getLogger(name)
+    logger.handlers.clear()
+    logger.propagate = True
+    if category is not None and not any(isinstance(f, _Tag) for f in logger.filters):
+        logger.addFilter(_Tag(category))
+
+
+def setup_logging(
+    service,
+    level=None,
+    fmt=None,
+    use_queue=None,
+    stream=None,
+    sample_rates=None,
+    rate_limits=None,
+    force=False,
+):
+    """Configure the root logger for ``service``; settings default to the LOG_* environment.
+
+    Like logging.basicConfig(), this does nothing when the root logger already
+    has handlers unless ``force`` is set.
+    """
+    global _listener
+    root = logging.getLogger()
+    with _lock:
+        if root.handlers and not force:
+            return
+        _stop_listener()
+        for handler in root.handlers[:]:
+            root.removeHandler(handler)
+            handler.close()
+
+        output = logging.StreamHandler(stream) if stream is not None else _StderrHandler()
+        if (fmt or LOG_FORMAT) == "json":
+            output.setFormatter(JsonFormatter(service))
+        else:
+            output.setFormatter(logging.Formatter("%(asctime)s %(levelname)s %(name)s: %(message)s"))
+
+        handler = output
+        if LOG_QUEUE if use_queue is None else use_queue:
+            handler = _QueueHandler(queue.Queue(LOG_QUEUE_SIZE))
+            _listener = QueueListener(handler.queue, output)
+            _listener.start()
+        handler.addFilter(CategoryFilter(
+            parse_categories(LOG_SAMPLING) if sample_rates is None else sample_rates,
+            parse_categories(LOG_RATE_LIMITS) if rate_limits is None else rate_limits,
+        ))
+        root.addHandler(handler)
+        root.setLevel(level or LOG_LEVEL)
+
+    # One line per request: sample it like the other high-volume categories
+    _route_to_root("uvicorn.access", "http.access")
+    _route_to_root("uvicorn.error")
+
+
+def _stop_listener():
+    global _listener
+    if _listener is not None:
+        # Writes out what is still queued
+        _listener.stop()
+        _listener = None
+
+
+def shutdown_logging():
+    """Flush queued records and stop the background writer."""
+    with _lock:
+        _stop_listener()
+
+
+atexit.register(shutdown_logging)
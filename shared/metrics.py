@@ -0,0 +1,205 @@
+"""
+Prometheus metrics shared by all microservices
+
+Every service calls setup_metrics() from its main.py, which serves the default
+registry at /metrics and times each request by its route template. Services
+that handle work in child processes call expose_worker_metrics() so /metrics
+also carries what those processes record.
+"""
+import time
+from prometheus_client import (
+    CONTENT_TYPE_LATEST,
+    REGISTRY,
+    CollectorRegistry,
+    Counter,
+    Gauge,
+    Histogram,
+    generate_latest,
+)
+from prometheus_client.multiprocess import MultiProcessCollector
+from starlette.responses import Response
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+# Write-to-handled latency of events, up to the retry tiers' minutes
+EVENT_LATENCY_BUCKETS = (0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 300.0)
+WAIT_BUCKETS = (0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0, 30.0)
+
+HTTP_REQUEST_DURATION = Histogram(
+    "http_request_duration_seconds",
+    "HTTP request latency by route template",
+    ["service", "method", "route", "status"],
+    buckets=LATENCY_BUCKETS,
+)
+HTTP_REQUESTS_IN_FLIGHT = Gauge(
+    "http_requests_in_flight",
+    "HTTP requests currently being served",
+    ["service"],
+)
+DB_POOL_CHECKOUT_WAIT = Histogram(
+    "db_pool_checkout_wait_seconds",
+    "Time spent waiting for a connection from the SQLAlchemy pool",
+    ["service", "engine"],
+    buckets=WAIT_BUCKETS,
+)
+DB_POOL_TIMEOUTS = Counter(
+    "db_pool_checkout_timeouts_total",
+    "Checkouts that gave up waiting for a free connection",
+    ["service", "engine"],
+)
+DB_POOL_IN_USE = Gauge(
+    "db_pool_connections_in_use",
+    "Connections currently checked out of the pool",
+    ["service", "engine"],
+)
+DB_POOL_SATURATION = Gauge(
+    "db_pool_saturation_ratio",
+    "Connections checked out divided by pool size plus overflow",
+    ["service", "engine"],
+)
+DB_READ_ROUTES = Counter(
+    "db_read_routes_total",
+    "Read-only sessions by target (replica, primary_fallback, primary_recent_write)",
+    ["service", "target"],
+)
+KAFKA_PRODUCE_LATENCY = Histogram(
+    "kafka_produce_latency_seconds",
+    "Time from produce() to broker acknowledgement",
+    ["client", "topic"],
+    buckets=LATENCY_BUCKETS,
+)
+KAFKA_DELIVERY_FAILURES = Counter(
+    "kafka_delivery_failures_total",
+    "Messages the broker did not acknowledge",
+    ["client", "topic"],
+)
+KAFKA_CONSUMER_LAG = Gauge(
+    "kafka_consumer_lag_messages",
+    "High watermark minus the next offset to consume",
+    ["group", "topic", "partition"],
+    # Across consumer processes: the latest value from a live one, i.e. the partition's current owner
+    multiprocess_mode="livemostrecent",
+)
+EVENT_PROCESSING_DURATION = Histogram(
+    "event_processing_duration_seconds",
+    "Time spent handling one consumed event",
+    ["topic"],
+    buckets=LATENCY_BUCKETS,
+)
+EVENTS_PROCESSED = Counter(
+    "events_processed_total",
+    "Consumed events by outcome",
+    ["topic", "outcome"],
+)
+EVENT_LATENCY = Histogram(
+    "event_latency_seconds",
+    "Time from the API write to each stage of an event (publish, consume, handled)",
+    ["topic", "stage"],
+    buckets=EVENT_LATENCY_BUCKETS,
+)
+EVENT_LATENCY_SLO_BREACHES = Counter(
+    "event_latency_slo_breaches_total",
+    "Events handled later than EVENT_LATENCY_SLO_SECONDS after their write",
+    ["topic"],
+)
+NOTIFICATIONS_DELIVERED = Counter(
+    "notifications_delivered_total",
+    "Notifications by channel and outcome (sent, retry, dead_letter)",
+    ["channel", "outcome"],
+)
+NOTIFICATION_BATCH_DURATION = Histogram(
+    "notification_batch_duration_seconds",
+    "Time spent sending one batch to a delivery provider",
+    ["channel"],
+    buckets=LATENCY_BUCKETS,
+)
+LOG_RECORDS_DROPPED = Counter(
+    "log_records_dropped_total",
+    "Log records not written: sampled, rate_limited or queue_full",
+    ["reason"],
+)
+
+
+class MetricsMiddleware:
+    """ASGI middleware recording in-flight requests and latency per route template."""
+
+    def __init__(self, app, service):
+        self.app = app
+        self.service = service
+        self.in_flight = HTTP_REQUESTS_IN_FLIGHT.labels(service=service)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        status = 500
+
+        async def send_wrapper(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        start = time.perf_counter()
+        self.in_flight.inc()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            self.in_flight.dec()
+            # The router stores the matched route in scope; label by its template, not the raw path
+            route = scope.get("route")
+            HTTP_REQUEST_DURATION.labels(
+                service=self.service,
+                method=scope["method"],
+                route=getattr(route, "path", "unmatched"),
+                status=status,
+            ).observe(time.perf_counter() - start)
+
+
+class _MergedRegistry:
+    """Several registries collected as one, with same-named metric families merged."""
+
+    def __init__(self, *registries):
+        self.registries = registries
+
+    def collect(self):
+        families = {}
+        for registry in self.registries:
+            for family in registry.collect():
+                if family.name in families:
+                    families[family.name].samples.extend(family.samples)
+                else:
+                    families[family.name] = family
+        return list(families.values())
+
+
+_exposed = REGISTRY
+
+
+def expose_worker_metrics(path):
+    """Serve the metrics that child processes write under ``path`` next to this process's own.
+
+    The children must be started with PROMETHEUS_MULTIPROC_DIR=path (prometheus_client's
+    multiprocess mode) and record what this process does not, so no series is reported twice.
+    ``None`` goes back to this process's registry alone.
+    """
+    global _exposed
+    if path is None:
+        _exposed = REGISTRY
+        return
+    workers = CollectorRegistry()
+    MultiProcessCollector(workers, path)
+    _exposed = _MergedRegistry(REGISTRY, workers)
+
+
+async def metrics_endpoint(request):
+    return Response(generate_latest(_exposed), media_type=CONTENT_TYPE_LATEST)
+
+
+def setup_metrics(app, service):
+    """Serve /metrics and instrument requests for one service.
+
+    Database pools are instrumented by shared.database.create_service_engine.
+    """
+    app.add_middleware(MetricsMiddleware, service=service)
+    app.add_route("/metrics", metrics_endpoint, include_in_schema=False)
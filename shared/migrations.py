@@ -0,0 +1,88 @@
+"""
+Schema migrations run as a deploy step instead of create_all at import
+
+On PostgreSQL indexes are built with CREATE INDEX CONCURRENTLY. A concurrent
+build that fails or is interrupted leaves an INVALID index behind, which the
+planner ignores; upgrade() drops and rebuilds those instead of taking the name
+as done.
+"""
+import logging
+from sqlalchemy import MetaData, inspect, text
+from sqlalchemy.schema import CreateColumn, CreateIndex
+
+logger = logging.getLogger(__name__)
+
+
+def concurrent_index(index):
+    """``index`` flagged CONCURRENTLY, on a scratch copy of its table so the shared metadata is left as is."""
+    table = index.table.to_metadata(MetaData())
+    copy = next(candidate for candidate in table.indexes if candidate.name == index.name)
+    copy.dialect_options["postgresql"]["concurrently"] = True
+    return copy
+
+
+def create_index(engine, index):
+    """Create one index; on PostgreSQL without blocking writes to the table."""
+    if engine.dialect.name != "postgresql":
+        with engine.begin() as conn:
+            index.create(conn)
+        return
+
+    # CONCURRENTLY cannot run inside a transaction block, hence AUTOCOMMIT
+    with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+        conn.execute(CreateIndex(concurrent_index(index)))
+
+
+def invalid_indexes(engine, table_name):
+    """Names of the table's indexes left INVALID by a failed concurrent build (always empty off PostgreSQL)."""
+    if engine.dialect.name != "postgresql":
+        return set()
+    with engine.connect() as conn:
+        return set(conn.execute(text(
+            "SELECT index_class.relname FROM pg_index"
+            " JOIN pg_class index_class ON index_class.oid = pg_index.indexrelid"
+            " JOIN pg_class table_class ON table_class.oid = pg_index.indrelid"
+            " WHERE table_class.relname = :table AND pg_table_is_visible(table_class.oid)"
+            " AND NOT pg_index.indisvalid"
+        ), {"table": table_name}).scalars())
+
+
+def drop_index(engine, index):
+    """Drop an index without blocking writes to the table (PostgreSQL only)."""
+    name = engine.dialect.identifier_preparer.quote(index.name)
+    with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+        conn.execute(text(f"DROP INDEX CONCURRENTLY IF EXISTS {name}"))
+
+
+def add_column(engine, table, column):
+    """Add a nullable column to an existing table; a metadata-only change on PostgreSQL and SQLite."""
+    if not column.nullable or column.server_default is not None:
+        raise ValueError(f"Cannot add {table.name}.{column.name} in place: only nullable columns without defaults")
+    definition = CreateColumn(column).compile(dialect=engine.dialect)
+    table_name = engine.dialect.identifier_preparer.format_table(table)
+    with engine.begin() as conn:
+        conn.execute(text(f"ALTER TABLE {table_name} ADD COLUMN {definition}"))
+
+
+def upgrade(engine, metadata):
+    """Create missing tables, then any columns and indexes missing from tables that already exist."""
+    metadata.create_all(bind=engine)
+
+    inspector = inspect(engine)
+    for table in metadata.sorted_tables:
+        columns = {column["name"] for column in inspector.get_columns(table.name)}
+        for column in table.columns:
+            if column.name not in columns:
+                logger.info(f"Adding column {column.name} to {table.name}")
+                add_column(engine, table, column)
+
+        existing = {index["name"] for index in inspector.get_indexes(table.name)}
+        invalid = invalid_indexes(engine, table.name)
+        for index in table.indexes:
+            if index.name in invalid:
+                logger.warning(f"Rebuilding index {index.name} on {table.name}, left invalid by a failed build")
+                drop_index(engine, index)
+                create_index(engine, index)
+            elif index.name not in existing:
+                logger.info(f"Creating index {index.name} on {table.name}")
+                create_index(engine, index)
@@ -0,0 +1,162 @@
+"""
+Transactional outbox shared by the services that publish events
+
+Events are inserted into an outbox table in the same transaction as the row
+they describe. OutboxRelay later publishes pending rows to Kafka in id order
+and marks the delivered prefix of each batch as published, so a slow broker never stalls a request and a
+crash between commit and publish cannot lose an event. Payloads are stored as
+JSON and re-encoded with EVENT_ENCODING when they are published. Each row also
+keeps the write time and trace context, sent as Kafka headers (see
+shared/tracing.py).
+"""
+import json
+import logging
+import os
+import threading
+from concurrent.futures import wait
+from sqlalchemy import BigInteger, Column, DateTime, Index, Integer, String, Text, func, select, update
+from .serialization import event_serializer
+from .tracing import event_headers, publish_headers
+
+logger = logging.getLogger(__name__)
+
+OUTBOX_BATCH_SIZE = int(os.getenv("OUTBOX_BATCH_SIZE", "1000"))
+OUTBOX_POLL_INTERVAL = float(os.getenv("OUTBOX_POLL_INTERVAL", "0.2"))
+OUTBOX_DELIVERY_TIMEOUT = float(os.getenv("OUTBOX_DELIVERY_TIMEOUT", "10"))
+
+
+def outbox_model(Base, tablename):
+    """Declare an outbox table on the given declarative base."""
+
+    class OutboxEvent(Base):
+        __tablename__ = tablename
+        id = Column(BigInteger().with_variant(Integer, "sqlite"), primary_key=True)
+        topic = Column(String, nullable=False)
+        key = Column(String, nullable=True)
+        payload = Column(Text, nullable=False)
+        # JSON object of the event's tracing headers
+        headers = Column(Text, nullable=True)
+        created_at = Column(DateTime(timezone=True), server_default=func.now(), nullable=False)
+        published_at = Column(DateTime(timezone=True), nullable=True)
+
+        # Keeps the relay's "oldest unpublished first" scan cheap as the table grows
+        __table_args__ = (
+            Index(
+                f"ix_{tablename}_pending",
+                "id",
+                postgresql_where=published_at.is_(None),
+                sqlite_where=published_at.is_(None),
+            ),
+        )
+
+    return OutboxEvent
+
+
+def outbox_row(topic, event_data):
+    """Column values for one outbox entry, usable with add() or a multi-row insert()."""
+    return {
+        "topic": topic,
+        "key": str(event_data.get("id", "")),
+        "payload": json.dumps(event_data),
+        "headers": json.dumps(event_headers()),
+    }
+
+
+class OutboxRelay:
+    """Publishes pending outbox rows in large ordered batches from a background thread."""
+
+    def __init__(
+        self,
+        session_factory,
+        model,
+        producer,
+        batch_size=OUTBOX_BATCH_SIZE,
+        poll_interval=OUTBOX_POLL_INTERVAL,
+        delivery_timeout=OUTBOX_DELIVERY_TIMEOUT,
+        serializer=event_serializer,
+    ):
+        self.session_factory = session_factory
+        self.model = model
+        self.producer = producer
+        self.batch_size = batch_size
+        self.poll_interval = poll_interval
+        self.delivery_timeout = delivery_timeout
+        self.serializer = serializer
+        self._stop = threading.Event()
+        self._thread = None
+
+    def run_once(self) -> int:
+        """Publish one batch of pending events; returns how many were delivered."""
+        model = self.model
+        with self.session_factory() as db:
+            rows = db.execute(
+                select(model.id, model.topic, model.key, model.payload, model.headers)
+                .where(model.published_at.is_(None))
+                .order_by(model.id)
+                .limit(self.batch_size)
+                .with_for_update(skip_locked=True)
+            ).all()
+            if not rows:
+                return 0
+
+            futures = {
+                self.producer.produce(
+                    row.topic,
+                    row.key,
+                    self._encode(row.topic, row.payload),
+                    headers=publish_headers(row.topic, json.loads(row.headers) if row.headers else None),
+                ): row.id
+                for row in rows
+            }
+            wait(futures, timeout=self.delivery_timeout)
+            # Stop at the first failure: later rows go out again after it, so events stay in id order
+            delivered = []
+            for future, row_id in futures.items():
+                if not future.done() or future.exception() is not None:
+                    break
+                delivered.append(row_id)
+            if len(delivered) < len(rows):
+                logger.warning(f"Outbox event {rows[len(delivered)].id} not delivered, will retry it and the {len(rows) - len(delivered) - 1} after it")
+
+            if delivered:
+                db.execute(
+                    update(model).where(model.id.in_(delivered)).values(published_at=func.now())
+                )
+            db.commit()
+            return len(delivered)
+
+    def _encode(self, topic, payload):
+        if self.serializer.encoding == "json":
+            return payload
+        return self.serializer.encode(topic, json.loads(payload))
+
+    def requeue(self, since):
+        """Mark events created at or after ``since`` as pending so the relay replays them."""
+        with self.session_factory() as db:
+            result = db.execute(
+                update(self.model).where(self.model.created_at >= since).values(published_at=None)
+            )
+            db.commit()
+            return result.rowcount
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                sent = self.run_once()
+            except Exception as e:
+                logger.error(f"Outbox relay failed: {e}")
+                sent = 0
+            # A full batch means there is probably more waiting, so go again right away
+            if sent < self.batch_size:
+                self._stop.wait(self.poll_interval)
+
+    def start(self):
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name=f"{self.model.__tablename__}-relay", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
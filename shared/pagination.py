@@ -0,0 +1,60 @@
+"""
+Keyset pagination and NDJSON streaming helpers for list endpoints
+"""
+from sqlalchemy import select
+from .fast_json import ndjson_lines
+
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 1000
+STREAM_BATCH_SIZE = 1000
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
+
+
+def keyset_select(model, after=None, limit=None, descending=False, filters=(), columns=None):
+    """Build a select ordered by primary key that starts after the given cursor.
+
+    Pass ``columns`` to select plain rows instead of ORM entities.
+    """
+    stmt = select(*columns) if columns else select(model)
+    if descending:
+        stmt = stmt.where(*filters).order_by(model.id.desc())
+        if after is not None:
+            stmt = stmt.where(model.id < after)
+    else:
+        stmt = stmt.where(*filters).order_by(model.id)
+        if after is not None:
+            stmt = stmt.where(model.id > after)
+    if limit is not None:
+        stmt = stmt.limit(limit)
+    return stmt
+
+
+def next_cursor(rows, limit):
+    """Return the cursor for the next page, or None when this was the last page."""
+    if len(rows) < limit:
+        return None
+    return rows[-1].id
+
+
+def iter_ndjson(session_factory, stmt, schema, batch_size=STREAM_BATCH_SIZE):
+    """Stream rows as NDJSON, one server-side cursor batch per chunk.
+
+    ``stmt`` selects the schema's columns in field order (see schema_columns).
+    The generator owns its session so the cursor stays open for as long as the
+    response is being written, independently of the request dependency.
+    """
+    db = session_factory()
+    try:
+        result = db.execute(stmt.execution_options(yield_per=batch_size))
+        for batch in result.partitions():
+            yield ndjson_lines(batch, schema)
+    finally:
+        db.close()
+
+
+async def aiter_ndjson(async_session_factory, stmt, schema, batch_size=STREAM_BATCH_SIZE):
+    """Async counterpart of iter_ndjson for the asyncpg/aiosqlite stack."""
+    async with async_session_factory() as db:
+        result = await db.stream(stmt.execution_options(yield_per=batch_size))
+        async for batch in result.partitions():
+            yield ndjson_lines(batch, schema)
@@ -0,0 +1,125 @@
+"""
+Read-replica routing
+
+Read-only endpoints take their session from a ReplicaSet, which hands out
+replicas in round-robin order. A replica that cannot be reached is skipped for
+REPLICA_RETRY_SECONDS and the read falls back to the next replica, then to the
+primary. Requests that commit a write get a short-lived cookie; while it is
+valid their reads go to the primary, so a client always sees its own writes
+even when the replicas lag behind. Requests that only read, or are rejected
+before committing, leave the client's reads on the replicas.
+"""
+import itertools
+import logging
+import time
+from sqlalchemy import event
+from sqlalchemy.exc import DBAPIError
+from sqlalchemy.orm import Session
+from shared.metrics import DB_READ_ROUTES
+
+logger = logging.getLogger(__name__)
+
+READ_PRIMARY_COOKIE = "read_primary_until"
+# Session.info keys: the pending cookie and whether the open transaction wrote anything
+_ON_WRITE_COMMIT = "replicas.on_write_commit"
+_WROTE = "replicas.wrote"
+
+
+def mark_write(response, window):
+    """Pin the client's reads to the primary for ``window`` seconds."""
+    if window > 0:
+        response.set_cookie(READ_PRIMARY_COOKIE, f"{time.time() + window:.3f}", max_age=int(window) + 1, httponly=True)
+
+
+def mark_write_on_commit(session, response, window):
+    """Pin the client's reads to the primary once ``session`` commits a write.
+
+    ``session`` is a sync Session; pass ``sync_session`` for an AsyncSession or ThreadedSession.
+    """
+    if window > 0:
+        session.info[_ON_WRITE_COMMIT] = lambda: mark_write(response, window)
+
+
+@event.listens_for(Session, "after_flush")
+def _flushed(session, flush_context):
+    if _ON_WRITE_COMMIT in session.info:
+        session.info[_WROTE] = True
+
+
+@event.listens_for(Session, "do_orm_execute")
+def _executed(state):
+    if _ON_WRITE_COMMIT in state.session.info and (state.is_insert or state.is_update or state.is_delete):
+        state.session.info[_WROTE] = True
+
+
+@event.listens_for(Session, "after_commit")
+def _committed(session):
+    # Releasing a savepoint is not the commit; the outer transaction can still roll back
+    if session.in_nested_transaction() or not session.info.pop(_WROTE, False):
+        return
+    callback = session.info.get(_ON_WRITE_COMMIT)
+    if callback is not None:
+        callback()
+
+
+@event.listens_for(Session, "after_soft_rollback")
+def _rolled_back(session, previous_transaction):
+    if previous_transaction.parent is None:
+        session.info.pop(_WROTE, None)
+
+
+def wrote_recently(request):
+    try:
+        return float(request.cookies.get(READ_PRIMARY_COOKIE, 0)) > time.time()
+    except ValueError:
+        return False
+
+
+class ReplicaSet:
+    """Round-robin over replica sessionmakers, skipping replicas that recently failed.
+
+    ``wrap`` turns a new session into an AsyncSession-compatible one
+    (ThreadedSession on the sync stack), so the same routing serves both stacks.
+    """
+
+    def __init__(self, service, session_factories, retry_after, wrap=None):
+        self.service = service
+        self.session_factories = list(session_factories)
+        self.retry_after = retry_after
+        self.wrap = wrap or (lambda session: session)
+        self.down_until = [0.0] * len(self.session_factories)
+        self._turn = itertools.count()
+
+    def __bool__(self):
+        return bool(self.session_factories)
+
+    def _rotation(self):
+        start = next(self._turn)
+        now = time.monotonic()
+        count = len(self.session_factories)
+        for offset in range(count):
+            index = (start + offset) % count
+            if self.down_until[index] <= now:
+                yield index
+
+    def mark_down(self, index, error):
+        self.down_until[index] = time.monotonic() + self.retry_after
+        logger.warning(f"Read replica {index + 1} of {self.service} unavailable, skipping for {self.retry_after}s: {error}")
+
+    async def open(self):
+        """(sessionmaker, session) for the next reachable replica, or None when every replica is down."""
+        for index in self._rotation():
+            session = self.wrap(self.session_factories[index]())
+            try:
+                # Check out a connection now so an unreachable replica fails here, not mid-query
+                await session.connection()
+            except (DBAPIError, OSError) as e:
+                await session.close()
+                self.mark_down(index, e)
+                continue
+            DB_READ_ROUTES.labels(service=self.service, target="replica").inc()
+            return self.session_factories[index], session
+        return None
+
+    def route(self, target):
+        DB_READ_ROUTES.labels(service=self.service, target=target).inc()
@@ -0,0 +1,116 @@
+"""
+Event payload encoding for Kafka
+
+EVENT_ENCODING=json keeps today's JSON payloads. EVENT_ENCODING=msgpack writes
+a 5-byte header (magic byte 0, 4-byte schema id) followed by the event's field
+values as a msgpack array in schema field order. Decoding accepts both formats,
+so consumers can be upgraded before producers switch encodings.
+"""
+import json
+import os
+import struct
+import zlib
+from .event_schemas import EVENT_SCHEMAS
+
+try:
+    import msgpack
+except ImportError:  # JSON-only deployments do not need it
+    msgpack = None
+
+EVENT_ENCODING = os.getenv("EVENT_ENCODING", "json")
+
+MAGIC_BYTE = 0
+HEADER = struct.Struct(">BI")
+
+
+class EventDecodeError(ValueError):
+    """Raised when a payload is neither valid JSON nor a known binary schema."""
+
+
+class EventSchema:
+    def __init__(self, subject, version, model):
+        self.subject = subject
+        self.version = version
+        self.model = model
+        self.fields = tuple(model.model_fields)
+        # Derived from the schema itself so every process agrees on ids without a registry server
+        fingerprint = f"{subject}/v{version}/{','.join(self.fields)}"
+        self.schema_id = zlib.crc32(fingerprint.encode("utf-8"))
+
+
+class SchemaRegistry:
+    """Local registry of event schemas, keyed by schema id and by subject."""
+
+    def __init__(self):
+        self._by_id = {}
+        self._latest = {}
+
+    def register(self, subject, version, model):
+        schema = EventSchema(subject, version, model)
+        existing = self._by_id.get(schema.schema_id)
+        if existing is not None and (existing.subject, existing.version) != (subject, version):
+            raise ValueError(f"Schema id collision between {existing.subject} v{existing.version} and {subject} v{version}")
+        self._by_id[schema.schema_id] = schema
+        latest = self._latest.get(subject)
+        if latest is None or latest.version < version:
+            self._latest[subject] = schema
+        return schema
+
+    def latest(self, subject):
+        return self._latest.get(subject)
+
+    def by_id(self, schema_id):
+        schema = self._by_id.get(schema_id)
+        if schema is None:
+            raise EventDecodeError(f"Unknown event schema id {schema_id}")
+        return schema
+
+
+def default_registry():
+    registry = SchemaRegistry()
+    for (subject, version), model in EVENT_SCHEMAS.items():
+        registry.register(subject, version, model)
+    return registry
+
+
+class EventSerializer:
+    def __init__(self, encoding=EVENT_ENCODING, registry=None):
+        if encoding not in ("json", "msgpack"):
+            raise ValueError(f"Unsupported EVENT_ENCODING {encoding!r}")
+        if encoding == "msgpack" and msgpack is None:
+            raise RuntimeError("EVENT_ENCODING=msgpack requires the 'msgpack' package")
+        self.encoding = encoding
+        self.registry = registry or default_registry()
+
+    def encode(self, topic, event):
+        """Encode an event dict for ``topic``; topics without a schema stay JSON."""
+        schema = self.registry.latest(topic) if self.encoding == "msgpack" else None
+        if schema is None:
+            return json.dumps(event)
+        return HEADER.pack(MAGIC_BYTE, schema.schema_id) + msgpack.packb(
+            [event.get(field) for field in schema.fields]
+        )
+
+    def decode(self, payload):
+        """Decode a binary or JSON payload back into an event dict."""
+        try:
+            if isinstance(payload, bytes) and payload[:1] == b"\x00":
+                if msgpack is None:
+                    raise EventDecodeError("Binary event received but 'msgpack' is not installed")
+                _, schema_id = HEADER.unpack_from(payload)
+                schema = self.registry.by_id(schema_id)
+                values = msgpack.unpackb(payload[HEADER.size:])
+                if not isinstance(values, (list, tuple)) or len(values) != len(schema.fields):
+                    raise EventDecodeError(f"Binary event body does not match schema {schema.subject} v{schema.version}")
+                return dict(zip(schema.fields, values))
+            event = json.loads(payload)
+        except EventDecodeError:
+            raise
+        except (ValueError, TypeError, struct.error) as e:
+            raise EventDecodeError(str(e)) from e
+        if not isinstance(event, dict):
+            raise EventDecodeError("JSON event is not an object")
+        return event
+
+
+event_serializer = EventSerializer()
@@ -0,0 +1,64 @@
+"""
+Startup helpers shared by the HTTP services
+
+Importing a service only builds objects; connections are opened by the
+lifespan handler. setup_readiness() serves /ready, which fails until the
+lifespan has warmed the database pools and flips app.state.ready.
+"""
+import asyncio
+import logging
+from sqlalchemy import text
+from starlette.concurrency import run_in_threadpool
+from starlette.responses import JSONResponse
+
+logger = logging.getLogger(__name__)
+
+
+def _warm_size(engine, size):
+    # Overflow connections are closed on checkin, so warming past the pool size is wasted
+    pool_size = getattr(engine.pool, "size", None)
+    return min(size, pool_size()) if callable(pool_size) else size
+
+
+def warm_pool(engine, size):
+    """Open ``size`` connections and return them to the pool, so first requests skip the connect."""
+    size = _warm_size(engine, size)
+    connections = []
+    try:
+        for _ in range(size):
+            connection = engine.connect()
+            connections.append(connection)
+            connection.execute(text("SELECT 1"))
+    finally:
+        for connection in connections:
+            connection.close()
+
+
+async def warm_async_pool(engine, size):
+    async def ping():
+        async with engine.connect() as connection:
+            await connection.execute(text("SELECT 1"))
+            # Hold it until every ping has its own connection
+            await barrier.wait()
+
+    size = _warm_size(engine, size)
+    barrier = asyncio.Barrier(size)
+    await asyncio.gather(*(ping() for _ in range(size)))
+
+
+async def warm_pools(size, engine, async_engine=None):
+    await run_in_threadpool(warm_pool, engine, size)
+    if async_engine is not None:
+        await warm_async_pool(async_engine, size)
+    logger.info(f"Warmed database pools with {size} connections")
+
+
+async def ready_endpoint(request):
+    if getattr(request.app.state, "ready", False):
+        return JSONResponse({"status": "ready"})
+    return JSONResponse({"status": "starting"}, status_code=503)
+
+
+def setup_readiness(app):
+    app.state.ready = False
+    app.add_route("/ready", ready_endpoint, include_in_schema=False)
@@ -0,0 +1,178 @@
+"""
+End-to-end event tracing from the API write to the consumer
+
+outbox_row() stamps every event with the time of the write and the trace
+context of the request that wrote it (W3C traceparent). The outbox relay adds
+the publish time and sends both as Kafka headers, and the notification service
+continues the trace in a consumer span and records how long the event took to
+get there in event_latency_seconds, by stage:
+
+    publish   write -> published by the outbox relay
+    consume   write -> picked up by a consumer worker
+    handled   write -> handler finished; the notification latency SLO applies here
+
+Events handled later than EVENT_LATENCY_SLO_SECONDS after their write are
+counted in event_latency_slo_breaches_total. Messages an event leads to, such
+as notification retries, carry its write stamp and trace context
+(current_event_headers()), so their consumers continue the trace and record
+latency from the original write. Stamps come from each host's
+clock, so stages that cross hosts include their clock skew.
+
+Spans go through the OpenTelemetry API, which only propagates context until
+an SDK is installed: setup_tracing() configures one exporting over OTLP when
+opentelemetry-sdk and opentelemetry-exporter-otlp are installed and
+OTEL_EXPORTER_OTLP_ENDPOINT is set.
+"""
+import contextvars
+import logging
+import os
+import time
+from contextlib import contextmanager
+from opentelemetry import propagate, trace
+from opentelemetry.trace import SpanKind, Status, StatusCode
+from shared.metrics import EVENT_LATENCY, EVENT_LATENCY_SLO_BREACHES
+
+logger = logging.getLogger(__name__)
+
+WRITTEN_AT_HEADER = "event-written-at"
+PUBLISHED_AT_HEADER = "event-published-at"
+EVENT_LATENCY_SLO_SECONDS = float(os.getenv("EVENT_LATENCY_SLO_SECONDS", "5"))
+OTEL_EXPORTER_OTLP_ENDPOINT = os.getenv("OTEL_EXPORTER_OTLP_ENDPOINT", "")
+
+tracer = trace.get_tracer("shared.tracing")
+
+# Write stamp and trace context of the event being processed (see consumer_span)
+_event_headers = contextvars.ContextVar("event_headers", default=None)
+
+
+def event_headers():
+    """Headers for an event written now: the write time plus the current trace context."""
+    headers = {WRITTEN_AT_HEADER: f"{time.time():.6f}"}
+    propagate.inject(headers)
+    return headers
+
+
+def kafka_headers(headers):
+    return [(name, value.encode()) for name, value in headers.items()]
+
+
+def decode_headers(raw):
+    """Kafka headers (a list of name/bytes pairs, or None) as a dict of strings."""
+    return {name: value.decode() if isinstance(value, bytes) else value for name, value in raw or ()}
+
+
+def publish_headers(topic, headers):
+    """Kafka headers for publishing a stored event: its stamps, the publish time and a producer span."""
+    headers = dict(headers or {})
+    headers[PUBLISHED_AT_HEADER] = f"{time.time():.6f}"
+    with tracer.start_as_current_span(f"{topic} publish", context=propagate.extract(headers), kind=SpanKind.PRODUCER):
+        propagate.inject(headers)
+    return kafka_headers(headers)
+
+
+@contextmanager
+def consumer_span(topic, headers):
+    """Continue the event's trace for the duration of its processing."""
+    with tracer.start_as_current_span(
+        f"{topic} process",
+        context=propagate.extract(headers),
+        kind=SpanKind.CONSUMER,
+        attributes={"messaging.system": "kafka", "messaging.destination.name": topic},
+    ) as span:
+        carried = {WRITTEN_AT_HEADER: headers[WRITTEN_AT_HEADER]} if WRITTEN_AT_HEADER in headers else {}
+        propagate.inject(carried)
+        token = _event_headers.set(carried)
+        try:
+            yield span
+        finally:
+            _event_headers.reset(token)
+
+
+def current_event_headers():
+    """Headers for a message caused by the event being processed: its write stamp and trace context."""
+    return dict(_event_headers.get() or {})
+
+
+def _stamp(headers, name):
+    try:
+        return float(headers[name])
+    except (KeyError, ValueError):
+        return None
+
+
+def record_event_latency(topic, headers, consumed_at, handled_at):
+    """Observe the event's latency per stage; events without a write stamp are skipped."""
+    written_at = _stamp(headers, WRITTEN_AT_HEADER)
+    if written_at is None:
+        return None
+    published_at = _stamp(headers, PUBLISHED_AT_HEADER)
+    if published_at is not None:
+        EVENT_LATENCY.labels(topic=topic, stage="publish").observe(max(published_at - written_at, 0))
+    EVENT_LATENCY.labels(topic=topic, stage="consume").observe(max(consumed_at - written_at, 0))
+    latency = max(handled_at - written_at, 0)
+    EVENT_LATENCY.labels(topic=topic, stage="handled").observe(latency)
+    if latency > EVENT_LATENCY_SLO_SECONDS:
+        EVENT_LATENCY_SLO_BREACHES.labels(topic=topic).inc()
+    trace.get_current_span().set_attribute("event.latency_seconds", latency)
+    return latency
+
+
+class TracingMiddleware:
+    """ASGI middleware running each HTTP request in a server span continued from its traceparent."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        headers = {name.decode("latin-1"): value.decode("latin-1") for name, value in scope["headers"]}
+        status = 500
+
+        async def send_wrapper(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        with tracer.start_as_current_span(
+            f"{scope['method']} {scope['path']}", context=propagate.extract(headers), kind=SpanKind.SERVER
+        ) as span:
+            try:
+                await self.app(scope, receive, send_wrapper)
+            finally:
+                route = scope.get("route")
+                if route is not None:
+                    span.update_name(f"{scope['method']} {route.path}")
+                span.set_attribute("http.response.status_code", status)
+                if status >= 500:
+                    span.set_status(Status(StatusCode.ERROR))
+
+
+_provider_configured = False
+
+
+def _configure_provider(service):
+    global _provider_configured
+    if _provider_configured or not OTEL_EXPORTER_OTLP_ENDPOINT:
+        return
+    try:
+        from opentelemetry.exporter.otlp.proto.http.trace_exporter import OTLPSpanExporter
+        from opentelemetry.sdk.resources import Resource
+        from opentelemetry.sdk.trace import TracerProvider
+        from opentelemetry.sdk.trace.export import BatchSpanProcessor
+    except ImportError:
+        logger.warning("OTEL_EXPORTER_OTLP_ENDPOINT is set but opentelemetry-sdk is not installed; spans are not exported")
+        return
+    provider = TracerProvider(resource=Resource.create({"service.name": service}))
+    provider.add_span_processor(BatchSpanProcessor(OTLPSpanExporter()))
+    trace.set_tracer_provider(provider)
+    _provider_configured = True
+
+
+def setup_tracing(app, service):
+    """Trace HTTP requests for one service and export spans when an OTLP endpoint is configured."""
+    _configure_provider(service)
+    app.add_middleware(TracingMiddleware)
@@ -0,0 +1,79 @@
+"""
+Version counters behind the HTTP validators of read endpoints
+
+A versions table keeps a counter and a last-modified time per scope. Writes
+bump the scopes they change in their own transaction, so a version never moves
+before the data it describes is visible, and read endpoints derive their ETag
+and Last-Modified from one primary-key lookup instead of from the rows.
+
+A table-wide version is split into VERSION_SHARDS rows ("tasks#0" ...) and a
+write bumps only the shard of the key it wrote, so writes by different users do
+not all queue on one row; the table's version is the sum of its shards, which
+grows with every committed write. Per-key scopes ("tasks:user:42") are single
+rows. Scopes that were never written read as version 0.
+"""
+import os
+from datetime import datetime, timezone
+from sqlalchemy import BigInteger, Column, DateTime, String, func, select
+from sqlalchemy.dialects import postgresql, sqlite
+
+VERSION_SHARDS = int(os.getenv("VERSION_SHARDS", "16"))
+
+_INSERTS = {"postgresql": postgresql.insert, "sqlite": sqlite.insert}
+
+
+def version_model(Base, tablename="versions"):
+    """Declare the versions table on a service's declarative Base."""
+
+    class Version(Base):
+        __tablename__ = tablename
+        scope = Column(String, primary_key=True)
+        version = Column(BigInteger, nullable=False, default=0)
+        updated_at = Column(DateTime(timezone=True), nullable=False)
+
+    return Version
+
+
+def table_scopes(table, keys):
+    """The shard scopes of ``table`` touched by writes to ``keys``."""
+    return {f"{table}#{key % VERSION_SHARDS}" for key in keys}
+
+
+async def bump_versions(db, model, dialect_name, scopes):
+    """Increment ``scopes`` inside the caller's transaction."""
+    if not scopes:
+        return
+    now = datetime.now(timezone.utc)
+    # Sorted, so concurrent writers lock shared scopes in the same order
+    stmt = _INSERTS[dialect_name](model).values([
+        {"scope": scope, "version": 1, "updated_at": now} for scope in sorted(scopes)
+    ])
+    await db.execute(stmt.on_conflict_do_update(
+        index_elements=[model.scope],
+        set_={"version": model.version + 1, "updated_at": stmt.excluded.updated_at},
+    ))
+
+
+def _aware(moment):
+    # SQLite hands back naive datetimes; they were written in UTC
+    if moment is not None and moment.tzinfo is None:
+        return moment.replace(tzinfo=timezone.utc)
+    return moment
+
+
+async def read_version(db, model, scope):
+    """(version, last modified or None) of one scope."""
+    row = (await db.execute(select(model.version, model.updated_at).where(model.scope == scope))).first()
+    return (row.version, _aware(row.updated_at)) if row is not None else (0, None)
+
+
+async def read_table_version(db, model, table):
+    """(version, last modified or None) of a table: the sum and latest of its shards."""
+    scopes = [f"{table}#{shard}" for shard in range(VERSION_SHARDS)]
+    version, updated_at = (await db.execute(
+        select(func.coalesce(func.sum(model.version), 0), func.max(model.updated_at)).where(model.scope.in_(scopes))
+    )).one()
+    if isinstance(updated_at, str):
+        # SQLite's max() returns the stored text rather than a datetime
+        updated_at = datetime.fromisoformat(updated_at)
+    return int(version), _aware(updated_at)
@@ -0,0 +1,18 @@
+import os
+import pytest
+
+# Anything a test publishes goes to the in-process bus instead of kafka:9092
+os.environ.setdefault("EVENT_TRANSPORT", "memory")
+
+from shared.migrations import upgrade  # noqa: E402
+
+@pytest.fixture(scope="session", autouse=True)
+def migrated_database():
+    """Apply both services' migrations once, as the deploy step does; the apps no longer create tables on import."""
+    from services.task_service.app import db as task_db
+    from services.user_service.app import db as user_db
+    from services.task_service.app import models as task_models  # noqa: F401
+    from services.user_service.app import models as user_models  # noqa: F401
+
+    upgrade(user_db.engine, user_db.Base.metadata)
+    upgrade(task_db.engine, task_db.Base.metadata)
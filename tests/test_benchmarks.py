@@ -0,0 +1,62 @@
+import asyncio
+import logging
+from benchmarks.consumer_bench import run_consumer_bench
+from benchmarks.hashing_bench import run_hashing_bench
+from benchmarks.http_bench import run_http_suite
+from benchmarks.logging_bench import run_logging_bench
+from benchmarks.pipeline_bench import run_pipeline_bench
+from benchmarks.response_bench import run_response_bench
+from benchmarks.report import compare, summarize
+
+def test_summarize_reports_percentiles():
+    """Test throughput and nearest-rank percentiles."""
+    result = summarize("x", [i / 1000 for i in range(1, 101)], elapsed=2.0)
+    assert result["throughput_per_second"] == 50.0
+    assert result["latency_ms"]["p50"] == 50.0
+    assert result["latency_ms"]["p99"] == 99.0
+
+def test_compare_flags_regressions():
+    """Test throughput drops and p99 growth beyond the threshold are reported."""
+    baseline = {"results": [summarize("tasks.list", [0.010] * 10, elapsed=1.0)]}
+    current = {"results": [summarize("tasks.list", [0.020] * 10, elapsed=2.0)]}
+    assert len(compare(current, baseline, max_regression=0.1)) == 2
+    assert compare(baseline, baseline) == []
+
+def test_http_and_consumer_benchmarks_smoke():
+    """Test a tiny in-process run of every workload."""
+    results = asyncio.run(run_http_suite(requests=10, concurrency=2, users=3))
+    assert [result["name"] for result in results] == [
+        "users.create", "users.list", "users.get", "tasks.create", "tasks.list", "tasks.by_user"
+    ]
+    assert all(result["errors"] == 0 for result in results)
+
+    consumed = asyncio.run(run_consumer_bench(events=200, batch_size=50, workers=2))
+    assert consumed["throughput_per_second"] > 0
+
+def test_logging_benchmark_smoke():
+    """Test the logging benchmark compares synchronous and queued logging and restores the root logger."""
+    handlers = logging.getLogger().handlers[:]
+    results = asyncio.run(run_logging_bench(events=200, batch_size=50, workers=2))
+    assert [result["name"] for result in results] == ["logging.consume.sync", "logging.consume.queued"]
+    assert all(result["throughput_per_second"] > 0 for result in results)
+    assert logging.getLogger().handlers == handlers
+
+
+def test_hashing_benchmark_smoke():
+    """Test the hashing benchmark reports per-core throughput."""
+    [result] = asyncio.run(run_hashing_bench(hashes=2, workers=1))
+    assert result["name"] == "passwords.hash.thread.1"
+    assert result["hashes_per_second_per_core"] > 0
+
+def test_response_benchmark_smoke():
+    """Test the response benchmark checks both paths produce the same JSON."""
+    model_path, fast_path = run_response_bench(rows=50, repeat=1)
+    assert fast_path["name"] == "responses.tasks.orjson_columns"
+    assert "speedup" in fast_path
+
+def test_pipeline_benchmark_smoke():
+    """Test created tasks travel through the outbox and the in-process bus to the notification handler."""
+    [result] = asyncio.run(asyncio.wait_for(run_pipeline_bench(requests=20, concurrency=4, users=3), 30))
+    assert result["name"] == "pipeline.task_created_to_notified"
+    assert result["requests"] == 20
+    assert result["errors"] == 0
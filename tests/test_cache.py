@@ -0,0 +1,60 @@
+import asyncio
+import time
+from shared.cache import MISSING, LRUCache, ReadThroughCache
+
+def test_lru_cache_evicts_least_recently_used():
+    """Test LRU ordering and eviction counts."""
+    async def scenario():
+        cache = LRUCache(max_entries=2, ttl=60)
+        await cache.set("a", 1)
+        await cache.set("b", 2)
+        await cache.get("a")
+        await cache.set("c", 3)
+        return cache, [await cache.get(key) for key in ("a", "b", "c")]
+
+    cache, values = asyncio.run(scenario())
+    assert values == [1, MISSING, 3]
+    assert cache.stats.evictions == 1
+    assert cache.stats.as_dict()["hits"] == 3
+
+def test_lru_cache_expires_entries():
+    """Test entries past their TTL are misses."""
+    async def scenario():
+        cache = LRUCache(max_entries=10, ttl=0.01)
+        await cache.set("a", 1)
+        time.sleep(0.02)
+        return await cache.get("a")
+
+    assert asyncio.run(scenario()) is MISSING
+
+def test_read_through_cache_loads_once_under_concurrent_misses():
+    """Test stampede protection: concurrent misses share one load."""
+    calls = []
+
+    async def load():
+        calls.append(1)
+        await asyncio.sleep(0.01)
+        return {"id": 1}
+
+    async def scenario():
+        cache = ReadThroughCache(LRUCache())
+        results = await asyncio.gather(*(cache.get_or_load("user:1", load) for _ in range(20)))
+        return cache, results
+
+    cache, results = asyncio.run(scenario())
+    assert len(calls) == 1
+    assert all(result == {"id": 1} for result in results)
+
+def test_read_through_cache_skips_store_when_invalidated_during_load():
+    """Test a load racing a write does not cache stale data."""
+    async def scenario():
+        cache = ReadThroughCache(LRUCache())
+
+        async def load():
+            await cache.invalidate("user:1")
+            return {"id": 1, "stale": True}
+
+        await cache.get_or_load("user:1", load)
+        return await cache.backend.get("user:1")
+
+    assert asyncio.run(scenario()) is MISSING
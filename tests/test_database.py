@@ -0,0 +1,63 @@
+import threading
+import pytest
+from sqlalchemy import text
+from sqlalchemy.exc import TimeoutError as PoolTimeout
+from sqlalchemy.pool import QueuePool
+from shared.database import autosize_pool, create_service_engine, pool_monitors, pool_settings
+
+def test_autosize_splits_budget_across_replicas_workers_and_engines():
+    """Test derived pools keep every process within the connection budget."""
+    pool_size, max_overflow = autosize_pool(max_connections=100, replicas=2, workers=4, engines=1, reserved=4)
+    assert (pool_size, max_overflow) == (8, 4)
+    assert 2 * 4 * (pool_size + max_overflow) <= 100 - 4
+
+    pool_size, max_overflow = autosize_pool(max_connections=100, replicas=2, workers=4, engines=2, reserved=4)
+    assert (pool_size, max_overflow) == (4, 2)
+
+def test_autosize_warns_when_the_fleet_outgrows_the_budget(caplog):
+    """Test a budget too small for the fleet still leaves one connection per engine, and says so."""
+    assert autosize_pool(max_connections=10, replicas=8, workers=4, engines=1, reserved=5) == (1, 0)
+    assert "may open up to 32 connections" in caplog.text
+
+def test_pool_settings_apply_limits_except_on_sqlite():
+    """Test server databases get the full pool policy while SQLite keeps its default pool."""
+    options = pool_settings("postgresql://user:password@db:5432/dbname", 7, 3)
+    assert options["pool_size"] == 7
+    assert options["max_overflow"] == 3
+    assert options["pool_pre_ping"] is True
+    assert {"pool_timeout", "pool_recycle"} <= options.keys()
+    assert pool_settings("sqlite:///./test.db", 7, 3) == {"pool_pre_ping": True}
+
+def test_monitor_records_checkouts_saturation_and_timeouts(tmp_path):
+    """Test the pool monitor tracks connections in use and counts checkout timeouts."""
+    # File-backed SQLite uses a QueuePool of 5 plus 10 overflow
+    engine = create_service_engine(f"sqlite:///{tmp_path}/pool.db", "pool-test", 5, 10, pool_timeout=0.05)
+    monitor = pool_monitors("pool-test")["sync"]
+    assert isinstance(engine.pool, QueuePool)
+
+    connections = [engine.connect() for _ in range(15)]
+    connections[0].execute(text("SELECT 1"))
+    status = monitor.status()
+    assert (status["checked_out"], status["capacity"], status["saturation"]) == (15, 15, 1.0)
+
+    with pytest.raises(PoolTimeout):
+        engine.connect()
+    assert monitor.status()["timeouts"] == 1
+    assert monitor.status()["checkout_wait_seconds"]["max"] >= 0.05
+
+    # A waiting checkout is served as soon as a connection comes back
+    threading.Timer(0.01, connections.pop().close).start()
+    with engine.connect():
+        pass
+    for connection in connections:
+        connection.close()
+    status = monitor.status()
+    assert (status["checked_out"], status["saturation"], status["checkouts"]) == (0, 0.0, 16)
+
+    # dispose() swaps in a new pool of the same monitored class, so checkouts are still timed
+    engine.dispose()
+    with engine.connect():
+        assert monitor.status()["checked_out"] == 1
+    assert monitor.status()["checkouts"] == 17
+    assert len(monitor.waits) == 18
+    engine.dispose()
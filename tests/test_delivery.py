@@ -0,0 +1,334 @@
+import asyncio
+import json
+import time
+import pytest
+from concurrent.futures import Future
+from email import message_from_bytes
+from services.notification_service.app.channels import EmailChannel, Notification, PushChannel
+from services.notification_service.app.delivery import DeliveryEngine, NotDue, TokenBucket
+from services.notification_service.app.dedup import EventDeduplicator, NullDedup
+from services.notification_service.app.main import NotificationService, consumer_workers, retry_service
+from prometheus_client import REGISTRY
+from shared.event_bus import EventBus, LocalConsumer, LocalProducer
+from shared.tracing import consumer_span, kafka_headers
+
+TRACEPARENT = "00-4bf92f3577b34da6a3ce929d0e0e4736-00f067aa0ba902b7-01"
+
+class SMTPSink:
+    """Minimal local SMTP server recording sessions and messages."""
+
+    def __init__(self, refuse=()):
+        self.refuse = set(refuse)
+        self.sessions = 0
+        self.messages = []
+
+    async def start(self):
+        self.server = await asyncio.start_server(self.handle, "127.0.0.1", 0)
+        self.port = self.server.sockets[0].getsockname()[1]
+        return self
+
+    async def handle(self, reader, writer):
+        self.sessions += 1
+        writer.write(b"220 sink ESMTP\r\n")
+        while line := await reader.readline():
+            command = line.decode().strip()
+            verb = command.split(" ", 1)[0].split(":", 1)[0].upper()
+            if verb == "EHLO":
+                writer.write(b"250 sink\r\n")
+            elif verb == "RCPT" and any(address in command for address in self.refuse):
+                writer.write(b"550 no such user\r\n")
+            elif verb == "DATA":
+                writer.write(b"354 go ahead\r\n")
+                data = b""
+                while (chunk := await reader.readline()) != b".\r\n":
+                    data += chunk
+                self.messages.append(message_from_bytes(data))
+                writer.write(b"250 queued\r\n")
+            elif verb == "QUIT":
+                writer.write(b"221 bye\r\n")
+                await writer.drain()
+                break
+            else:
+                writer.write(b"250 ok\r\n")
+            await writer.drain()
+        writer.close()
+
+    async def stop(self):
+        self.server.close()
+        await self.server.wait_closed()
+
+class HTTPSink:
+    """Minimal local HTTP server answering with the given status codes in turn."""
+
+    def __init__(self, statuses=(200,)):
+        self.statuses = list(statuses)
+        self.requests = []
+
+    async def start(self):
+        self.server = await asyncio.start_server(self.handle, "127.0.0.1", 0)
+        self.url = f"http://127.0.0.1:{self.server.sockets[0].getsockname()[1]}/push"
+        return self
+
+    async def handle(self, reader, writer):
+        headers = (await reader.readuntil(b"\r\n\r\n")).decode().lower()
+        length = int(headers.split("content-length:")[1].split("\r\n")[0])
+        self.requests.append(json.loads(await reader.readexactly(length)))
+        status = self.statuses.pop(0) if len(self.statuses) > 1 else self.statuses[0]
+        writer.write(f"HTTP/1.1 {status} X\r\ncontent-length: 0\r\nconnection: close\r\n\r\n".encode())
+        await writer.drain()
+        writer.close()
+
+    async def stop(self):
+        self.server.close()
+        await self.server.wait_closed()
+
+class RecordingProducer:
+    def __init__(self):
+        self.published = []
+        self.headers = []
+
+    def produce(self, topic, key, value, headers=None):
+        self.published.append((topic, json.loads(value)))
+        self.headers.append(dict(headers or ()))
+        future = Future()
+        future.set_result(None)
+        return future
+
+class NullConsumer:
+    def subscribe(self, topics, on_assign=None, on_revoke=None):
+        pass
+
+def email(recipient, **kwargs):
+    return Notification(channel="email", recipient=recipient, subject="Hi", body="Hello", **kwargs)
+
+def test_email_batches_share_one_smtp_session():
+    """Test concurrent notifications are batched over a single SMTP connection."""
+    async def run():
+        sink = await SMTPSink().start()
+        engine = DeliveryEngine([EmailChannel("127.0.0.1", sink.port, rate_limit=0)], RecordingProducer(), batch_size=10)
+        await engine.start()
+        results = await asyncio.gather(*(engine.deliver(email(f"user{i}@example.com")) for i in range(5)))
+        await engine.stop()
+        await sink.stop()
+        return sink, results
+
+    sink, results = asyncio.run(run())
+    assert results == [True] * 5
+    assert sink.sessions == 1
+    assert sorted(message["To"] for message in sink.messages) == [f"user{i}@example.com" for i in range(5)]
+
+def test_refused_recipients_are_dead_lettered():
+    """Test permanent SMTP failures skip the retry topics."""
+    async def run():
+        sink = await SMTPSink(refuse={"gone@example.com"}).start()
+        producer = RecordingProducer()
+        engine = DeliveryEngine([EmailChannel("127.0.0.1", sink.port, rate_limit=0)], producer)
+        await engine.start()
+        results = await asyncio.gather(engine.deliver(email("gone@example.com")), engine.deliver(email("ok@example.com")))
+        await engine.stop()
+        await sink.stop()
+        return producer, results
+
+    producer, results = asyncio.run(run())
+    assert results == [False, True]
+    assert [(topic, payload["recipient"]) for topic, payload in producer.published] == [
+        ("notifications.dlq", "gone@example.com")
+    ]
+    assert "Recipient refused" in producer.published[0][1]["last_error"]
+
+def test_push_failures_go_through_retry_tiers_then_dlq():
+    """Test retryable failures back off through each retry topic before dead-lettering."""
+    async def run():
+        sink = await HTTPSink(statuses=[503]).start()
+        producer = RecordingProducer()
+        engine = DeliveryEngine(
+            [PushChannel(sink.url, rate_limit=0)], producer, batch_wait=0, retry_delays=[0.01, 0.02]
+        )
+        await engine.start()
+        notification = Notification(channel="push", recipient="7", subject="New task", body="t")
+        with consumer_span("task.created", {"event-written-at": "1700000000.0", "traceparent": TRACEPARENT}):
+            assert await engine.deliver(notification) is False
+        # Replay what landed on each retry topic once it is due, as the retry consumer would
+        for _ in engine.retry_topics:
+            retry = producer.published[-1][1]
+            await asyncio.sleep(max(retry["not_before"] - time.time(), 0))
+            assert await engine.redeliver(retry) is False
+        await engine.stop()
+        await sink.stop()
+        return engine, producer, sink
+
+    engine, producer, sink = asyncio.run(run())
+    assert [topic for topic, _ in producer.published] == engine.retry_topics + ["notifications.dlq"]
+    assert [payload["attempt"] for _, payload in producer.published] == [1, 2, 2]
+    assert producer.published[0][1]["not_before"] > 0
+    # Retries and the dead letter keep the event's write stamp and trace
+    for headers in producer.headers:
+        assert headers["event-written-at"] == b"1700000000.0"
+        assert headers["traceparent"].split(b"-")[1] == TRACEPARENT.split("-")[1].encode()
+    assert len(sink.requests) == 3
+    assert sink.requests[0] == {"notifications": [{"recipient": "7", "subject": "New task", "body": "t"}]}
+
+def test_retries_wait_on_their_partition_not_in_a_worker():
+    """Test a retry that is not due pauses its partition while due retries on other tiers go out."""
+    bus = EventBus(partitions=1)
+    engine = DeliveryEngine([], RecordingProducer(), retry_delays=[300, 5])
+    delivered = []
+
+    async def deliver(notification):
+        delivered.append((notification.recipient, time.time()))
+        return True
+
+    engine.deliver = deliver
+    due_at = time.time() + 0.3
+    producer = LocalProducer(bus)
+    producer.produce(
+        engine.retry_topics[0],
+        value=email("late@example.com", attempt=1, not_before=due_at).model_dump_json(),
+        headers=kafka_headers({"event-written-at": f"{time.time():.6f}"}),
+    )
+    handled = lambda: REGISTRY.get_sample_value(  # noqa: E731
+        "event_latency_seconds_count", {"stage": "handled", "topic": engine.retry_topics[0]}
+    ) or 0
+    before = handled()
+    producer.produce(engine.retry_topics[1], value=email("due@example.com", attempt=2).model_dump_json())
+
+    service = retry_service(engine, consumer=LocalConsumer(bus, "retry"), poll_timeout=0.01, workers=1)
+
+    async def run():
+        consuming = asyncio.create_task(service.consume_events())
+        while len(delivered) < 2:
+            await asyncio.sleep(0.01)
+        service.stop()
+        await consuming
+
+    asyncio.run(asyncio.wait_for(run(), 10))
+    assert [recipient for recipient, _ in delivered] == ["due@example.com", "late@example.com"]
+    assert delivered[0][1] < due_at <= delivered[1][1]
+    # The redelivery counts towards the event's write-to-handled latency
+    assert handled() == before + 1
+    assert bus.lag("retry", engine.retry_topics) == 0
+
+    with pytest.raises(NotDue):
+        asyncio.run(engine.redeliver(email("early@example.com", not_before=time.time() + 60).model_dump()))
+
+def test_push_client_errors_are_not_retried():
+    """Test a 4xx response other than 429 is dead-lettered immediately."""
+    async def run():
+        sink = await HTTPSink(statuses=[400]).start()
+        producer = RecordingProducer()
+        engine = DeliveryEngine([PushChannel(sink.url, rate_limit=0)], producer, batch_wait=0)
+        await engine.start()
+        await engine.deliver(Notification(channel="push", recipient="1", subject="s", body="b"))
+        await engine.stop()
+        await sink.stop()
+        return producer
+
+    assert [topic for topic, _ in asyncio.run(run()).published] == ["notifications.dlq"]
+
+def test_token_bucket_paces_after_burst():
+    """Test tokens beyond the burst are released at the configured rate."""
+    async def run():
+        bucket = TokenBucket(rate=100, burst=10)
+        start = time.monotonic()
+        await bucket.acquire(10)
+        burst = time.monotonic() - start
+        await bucket.acquire(20)
+        return burst, time.monotonic() - start
+
+    burst, total = asyncio.run(run())
+    assert burst < 0.05
+    assert total >= 0.18
+
+def test_concurrent_batches_are_limited_per_channel():
+    """Test no more than `concurrency` batches are sent at once."""
+    class SlowChannel:
+        name = "slow"
+        rate_limit = 0
+
+        def __init__(self):
+            self.active = 0
+            self.peak = 0
+
+        async def send_batch(self, notifications):
+            self.active += 1
+            self.peak = max(self.peak, self.active)
+            await asyncio.sleep(0.02)
+            self.active -= 1
+            return [None] * len(notifications)
+
+        async def close(self):
+            pass
+
+    async def run():
+        channel = SlowChannel()
+        engine = DeliveryEngine([channel], RecordingProducer(), batch_size=1, batch_wait=0, concurrency=2)
+        await engine.start()
+        await asyncio.gather(*(
+            engine.deliver(Notification(channel="slow", recipient=str(i), subject="s", body="b")) for i in range(8)
+        ))
+        await engine.stop()
+        return channel
+
+    assert asyncio.run(run()).peak == 2
+
+def test_consumer_workers_fill_whole_delivery_batches():
+    """Test a backlog of events reaches the provider in full DELIVERY_BATCH_SIZE batches."""
+    class RecordingChannel:
+        name = "push"
+        rate_limit = 0
+
+        def __init__(self):
+            self.batches = []
+
+        async def send_batch(self, notifications):
+            self.batches.append(len(notifications))
+            await asyncio.sleep(0.01)
+            return [None] * len(notifications)
+
+        async def close(self):
+            pass
+
+    def run(workers=None):
+        bus = EventBus(partitions=1)
+        producer = LocalProducer(bus)
+        for i in range(60):
+            producer.produce("task.created", value=json.dumps({"id": i, "title": "t", "user_id": i}).encode())
+        channel = RecordingChannel()
+        engine = DeliveryEngine([channel], RecordingProducer(), batch_size=20, batch_wait=0.05, concurrency=1)
+        service = NotificationService(
+            consumer=LocalConsumer(bus, "batching"), topics=("task.created",), poll_timeout=0.01,
+            dedup=EventDeduplicator(NullDedup()), delivery=engine, workers=workers or consumer_workers(engine),
+        )
+
+        async def consume():
+            await engine.start()
+            consuming = asyncio.create_task(service.consume_events())
+            while sum(channel.batches) < 60:
+                await asyncio.sleep(0.01)
+            service.stop()
+            await consuming
+            await engine.stop()
+
+        asyncio.run(asyncio.wait_for(consume(), 10))
+        return channel.batches
+
+    assert run() == [20, 20, 20]
+    # Eight workers block on their sends, so no batch ever holds more than eight
+    assert max(run(workers=8)) == 8
+
+def test_user_created_events_send_a_welcome_email():
+    """Test the notification service hands user events to the email channel."""
+    async def run():
+        sink = await SMTPSink().start()
+        engine = DeliveryEngine([EmailChannel("127.0.0.1", sink.port, rate_limit=0)], RecordingProducer())
+        await engine.start()
+        service = NotificationService(consumer=NullConsumer(), delivery=engine)
+        await service.process_user_created({"id": 1, "username": "ann", "email": "ann@example.com"})
+        # No push channel configured: task events are only logged
+        await service.process_task_created({"id": 1, "title": "t", "user_id": 1})
+        await engine.stop()
+        await sink.stop()
+        return sink
+
+    sink = asyncio.run(run())
+    assert [(message["To"], message["Subject"]) for message in sink.messages] == [("ann@example.com", "Welcome!")]
@@ -0,0 +1,209 @@
+import asyncio
+import threading
+import pytest
+from datetime import datetime, timezone
+from confluent_kafka import TopicPartition
+from shared.event_bus import EventBus, LocalConsumer, LocalProducer
+from shared.kafka_producer import KafkaProducer
+from shared.serialization import event_serializer
+from services.notification_service.app.dedup import EventDeduplicator, LRUDedup
+from services.notification_service.app.main import NotificationService
+from services.notification_service.app.replay import Replayer, parse_args, plan_ranges
+
+def consume_all(consumer, expected, timeout=5):
+    messages = []
+    while len(messages) < expected:
+        batch = consumer.consume(100, timeout)
+        assert batch, "timed out waiting for messages"
+        messages.extend(batch)
+    return messages
+
+def test_keys_keep_per_partition_order():
+    """Test messages with the same key land in one partition, in produce order."""
+    bus = EventBus(partitions=4)
+    producer = LocalProducer(bus)
+    for i in range(20):
+        producer.produce("task.created", key=str(i % 3), value=str(i).encode())
+
+    consumer = LocalConsumer(bus, "group")
+    consumer.subscribe(["task.created"])
+    messages = consume_all(consumer, 20)
+    for key in ("0", "1", "2"):
+        keyed = [message for message in messages if message.key() == key]
+        assert len({message.partition() for message in keyed}) == 1
+        assert [int(message.value()) for message in keyed] == list(range(int(key), 20, 3))
+        offsets = [message.offset() for message in keyed]
+        assert offsets == sorted(offsets)
+
+def test_groups_get_every_message_and_members_split_partitions():
+    """Test each group sees every message while members of one group share the partitions."""
+    bus = EventBus(partitions=4)
+    producer = LocalProducer(bus)
+    for i in range(40):
+        producer.produce("user.created", value=str(i).encode())
+
+    first, second, other = LocalConsumer(bus, "a"), LocalConsumer(bus, "a"), LocalConsumer(bus, "b")
+    for consumer in (first, second, other):
+        consumer.subscribe(["user.created"])
+    from_first = consume_all(first, 20)
+    from_second = consume_all(second, 20)
+
+    assert {message.partition() for message in from_first}.isdisjoint(message.partition() for message in from_second)
+    assert sorted(int(message.value()) for message in from_first + from_second) == list(range(40))
+    assert len(consume_all(other, 40)) == 40
+
+def test_rebalance_resumes_from_committed_offsets():
+    """Test a member leaving hands its partitions over, starting after the last commit."""
+    bus = EventBus(partitions=2)
+    producer = LocalProducer(bus)
+    for i in range(10):
+        producer.produce("task.created", value=str(i).encode())
+
+    revoked = []
+    first = LocalConsumer(bus, "group")
+    first.subscribe(["task.created"], on_revoke=lambda consumer, partitions: revoked.extend(partitions))
+    messages = consume_all(first, 10)
+    assert len(messages) == 10
+    # Only the first three messages of each partition were committed
+    first.commit(offsets=[TopicPartition("task.created", partition, 3) for partition in (0, 1)])
+    second = LocalConsumer(bus, "group")
+    assigned = []
+    second.subscribe(["task.created"], on_assign=lambda consumer, partitions: assigned.extend(partitions))
+    first.close()
+
+    redelivered = consume_all(second, 4)
+    assert sorted((tp.topic, tp.partition) for tp in revoked) == [("task.created", 0), ("task.created", 1)]
+    assert sorted(tp.partition for tp in assigned) == [0, 1]
+    assert sorted(message.offset() for message in redelivered) == [3, 3, 4, 4]
+    assert bus.lag("group", ["task.created"]) == 4
+
+def test_consume_waits_for_new_messages():
+    """Test a blocked consume() wakes up as soon as something is produced."""
+    bus = EventBus(partitions=1)
+    consumer = LocalConsumer(bus, "group")
+    consumer.subscribe(["user.created"])
+    threading.Timer(0.05, LocalProducer(bus).produce, ("user.created",), {"value": b"1"}).start()
+    assert [message.value() for message in consumer.consume(10, 5)] == [b"1"]
+    assert consumer.consume(10, 0) == []
+
+def test_notification_service_consumes_from_the_bus():
+    """Test events produced through KafkaProducer reach NotificationService over the in-process bus."""
+    bus = EventBus(partitions=3)
+    producer = KafkaProducer("unused", "test-service", producer=LocalProducer(bus))
+    futures = producer.produce_events("user.created", [{"id": i, "username": f"bus{i}"} for i in range(30)])
+    assert all(future.result(timeout=5).topic() == "user.created" for future in futures)
+    producer.close()
+
+    service = NotificationService(consumer=LocalConsumer(bus, NotificationService.group_id), poll_timeout=0.01)
+    seen = []
+    service.handlers["user.created"] = lambda event: seen.append(event["id"])
+
+    async def run():
+        consuming = asyncio.create_task(service.consume_events())
+        while bus.lag(NotificationService.group_id, ["user.created"]):
+            await asyncio.sleep(0.01)
+        service.stop()
+        await consuming
+
+    asyncio.run(asyncio.wait_for(run(), 10))
+    assert sorted(seen) == list(range(30))
+    assert service.assigned == set()
+
+def test_replay_handles_a_range_without_moving_the_live_group():
+    """Test a replay from an offset runs the handlers for that range only and leaves live offsets alone."""
+    bus = EventBus(partitions=3)
+    producer = KafkaProducer("unused", "test-service", producer=LocalProducer(bus))
+    futures = producer.produce_events("user.created", [{"id": i, "username": f"replay{i}"} for i in range(30)])
+    assert all(future.result(timeout=5) for future in futures)
+    producer.close()
+
+    live = LocalConsumer(bus, NotificationService.group_id)
+    live.subscribe(["user.created"])
+    consume_all(live, 30)
+    live.commit()
+    committed = {partition: bus.committed(NotificationService.group_id, "user.created", partition) for partition in range(3)}
+
+    ranges = plan_ranges(LocalConsumer(bus, "replay"), ["user.created"], from_offset=5)
+    assert [(r.partition, r.start, r.end) for r in ranges] == [
+        (partition, 5, len(log)) for partition, log in enumerate(bus.topics["user.created"]) if len(log) > 5
+    ]
+    expected = [message.offset() for log in bus.topics["user.created"] for message in log[5:]]
+
+    dedup = EventDeduplicator(LRUDedup())
+    service = NotificationService(consumer=LocalConsumer(bus, "replay"), topics=(), dedup=dedup)
+    seen = []
+    service.handlers["user.created"] = lambda event: seen.append(event["id"])
+    # One event in the range was already handled by this dedup store
+    first = bus.topics["user.created"][ranges[0].partition][5]
+    asyncio.run(dedup.backend.complete(dedup.key("user.created", event_serializer.decode(first.value()))))
+
+    replayer = Replayer(service, ranges, lambda: LocalConsumer(bus, "replay"), partitions=2, concurrency=4, poll_timeout=0.01)
+    summary = asyncio.run(asyncio.wait_for(replayer.run(), 10))
+
+    assert summary["events"] == len(expected) and summary["remaining"] == 0
+    assert summary["outcomes"] == {"ok": len(expected) - 1, "duplicate": 1}
+    assert summary["throughput_per_second"] > 0
+    assert len(seen) == len(expected) - 1
+    assert {partition: bus.committed(NotificationService.group_id, "user.created", partition) for partition in range(3)} == committed
+    assert bus.lag(NotificationService.group_id, ["user.created"]) == 0
+    assert "replay" not in bus.groups or not bus.groups["replay"].committed
+
+def test_replay_plans_ranges_from_timestamps():
+    """Test --since/--until map to the first offsets at or after each time, per partition."""
+    bus = EventBus(partitions=2)
+    for i in range(12):
+        # No key: messages alternate between the two partitions
+        bus.append("task.created", None, b"{}")._timestamp = 1000 + i
+
+    consumer = LocalConsumer(bus, "replay")
+    moment = lambda seconds: datetime.fromtimestamp(seconds, timezone.utc)
+    ranges = plan_ranges(consumer, ["task.created"], since=moment(1005), until=moment(1010))
+    assert [(r.partition, r.start, r.end) for r in ranges] == [(0, 3, 5), (1, 2, 5)]
+
+    # Past the last event the range ends at the high watermark; an empty range is dropped
+    ranges = plan_ranges(consumer, ["task.created"], since=moment(1011))
+    assert [(r.partition, r.start, r.end) for r in ranges] == [(1, 5, 6)]
+
+def test_replay_requires_a_shared_dedup_store(monkeypatch):
+    """Test replay refuses an in-process dedup store, which would resend everything, unless told to."""
+    monkeypatch.setattr("services.notification_service.app.replay.DEDUP_BACKEND", "memory")
+    with pytest.raises(SystemExit):
+        parse_args(["--since", "2024-05-01T10:00"])
+    assert parse_args(["--since", "2024-05-01T10:00", "--no-dedup"]).no_dedup
+    assert parse_args(["--dry-run"]).dry_run
+
+    monkeypatch.setattr("services.notification_service.app.replay.DEDUP_BACKEND", "redis")
+    assert not parse_args(["--from-offset", "5"]).no_dedup
+
+def test_replay_retries_failed_events_and_reports_the_rest(monkeypatch):
+    """Test replay retries events that did not settle and lists those it gave up on, exiting non-zero."""
+    from services.notification_service.app import replay
+
+    bus = EventBus(partitions=1)
+    for i in range(4):
+        bus.append("user.created", None, event_serializer.encode("user.created", {"id": i, "event_type": "user.created"}).encode())
+    service = NotificationService(consumer=LocalConsumer(bus, "replay"), topics=(), dedup=EventDeduplicator(LRUDedup()))
+    attempts = []
+
+    def handle(event):
+        attempts.append(event["id"])
+        # Event 1 fails once, event 2 every time
+        if event["id"] == 2 or (event["id"] == 1 and attempts.count(1) == 1):
+            raise RuntimeError("provider down")
+
+    service.handlers["user.created"] = handle
+    ranges = plan_ranges(LocalConsumer(bus, "replay"), ["user.created"])
+    replayer = Replayer(service, ranges, lambda: LocalConsumer(bus, "replay"), poll_timeout=0.01, retries=2, retry_backoff=0.01)
+    summary = asyncio.run(asyncio.wait_for(replayer.run(), 10))
+
+    assert summary["outcomes"] == {"ok": 3, "error": 1}
+    assert attempts.count(1) == 2 and attempts.count(2) == 3
+    assert summary["failed"] == [{"topic": "user.created", "partition": 0, "offset": 2, "outcome": "error"}]
+
+    async def finished(args):
+        return summary
+
+    monkeypatch.setattr(replay, "DEDUP_BACKEND", "redis")
+    monkeypatch.setattr(replay, "setup_logging", lambda name: None)
+    monkeypatch.setattr(replay, "replay", finished)
+    assert replay.main(["--from-offset", "0"]) == 1
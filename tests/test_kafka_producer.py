@@ -0,0 +1,77 @@
+import asyncio
+import json
+import threading
+import pytest
+from confluent_kafka import KafkaException
+from shared.kafka_producer import KafkaProducer, producer_config
+
+class FakeMessage:
+    def __init__(self, topic, key, value):
+        self._topic = topic
+        self._key = key
+        self._value = value
+
+    def topic(self):
+        return self._topic
+
+    def partition(self):
+        return 0
+
+class FakeProducer:
+    """Mimics librdkafka: produce() queues, poll()/flush() fire delivery callbacks."""
+
+    def __init__(self, error=None):
+        self.error = error
+        self.queued = []
+        self.delivered = []
+        self.lock = threading.Lock()
+
+    def produce(self, topic, key=None, value=None, headers=None, on_delivery=None):
+        with self.lock:
+            self.queued.append((FakeMessage(topic, key, value), on_delivery))
+
+    def poll(self, timeout):
+        with self.lock:
+            queued, self.queued = self.queued, []
+        for msg, callback in queued:
+            self.delivered.append(msg)
+            callback(self.error, msg)
+        return len(queued)
+
+    def flush(self, timeout):
+        self.poll(0)
+        return len(self.queued)
+
+def test_producer_config_enables_batching():
+    """Test the tuned librdkafka settings and overrides."""
+    config = producer_config("kafka:9092", "test-service", **{"linger.ms": 5})
+    assert config["linger.ms"] == 5
+    assert config["enable.idempotence"] is True
+    assert "compression.type" in config and "batch.size" in config
+
+def test_produce_event_resolves_on_delivery():
+    """Test produce returns a future resolved by the background poll thread."""
+    fake = FakeProducer()
+    producer = KafkaProducer("kafka:9092", "test-service", producer=fake)
+
+    futures = producer.produce_events("task.created", [{"id": 1}, {"id": 2}])
+    results = [future.result(timeout=5) for future in futures]
+    producer.close()
+
+    assert [json.loads(msg._value)["id"] for msg in results] == [1, 2]
+    assert [msg._key for msg in fake.delivered] == ["1", "2"]
+
+def test_produce_event_and_wait_raises_on_delivery_failure():
+    """Test awaiting delivery surfaces broker errors."""
+    producer = KafkaProducer("kafka:9092", "test-service", producer=FakeProducer(error="broker down"))
+
+    with pytest.raises(KafkaException):
+        asyncio.run(producer.produce_event_and_wait("user.created", {"id": 1}, timeout=5))
+    producer.close()
+
+def test_producer_connects_lazily():
+    """Test constructing the producer does not create the librdkafka client."""
+    producer = KafkaProducer("127.0.0.1:1", "test-service")
+    assert not producer.started
+    assert producer.flush(0) == 0
+    producer.close()
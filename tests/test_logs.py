@@ -0,0 +1,67 @@
+import io
+import json
+import logging
+import pytest
+from shared.logs import CategoryFilter, parse_categories, setup_logging, shutdown_logging
+
+@pytest.fixture
+def root_logger():
+    """Hand the root logger to setup_logging() for one test, then restore pytest's handlers."""
+    root = logging.getLogger()
+    saved_handlers, saved_level = root.handlers[:], root.level
+    for handler in saved_handlers:
+        root.removeHandler(handler)
+    yield root
+    shutdown_logging()
+    for handler in root.handlers[:]:
+        root.removeHandler(handler)
+    for handler in saved_handlers:
+        root.addHandler(handler)
+    root.setLevel(saved_level)
+
+def record(category=None):
+    entry = logging.LogRecord("test", logging.INFO, __file__, 1, "message", (), None)
+    if category is not None:
+        entry.category = category
+    return entry
+
+def test_queued_json_logging_writes_records_in_the_background(root_logger):
+    """Test records are written as JSON lines with their extras once the queue is flushed."""
+    stream = io.StringIO()
+    # force: pytest attaches its capture handlers to the root logger while the test runs
+    setup_logging("test-service", stream=stream, use_queue=True, fmt="json", sample_rates={}, rate_limits={}, force=True)
+    # A second call keeps the existing setup, as basicConfig() does
+    setup_logging("other-service", stream=io.StringIO())
+
+    logger = logging.getLogger("tests.logs")
+    logger.info("Queued %s event", "task.created", extra={"task_id": 7})
+    try:
+        raise ValueError("boom")
+    except ValueError:
+        logger.exception("Handler failed")
+    shutdown_logging()
+
+    first, second = [json.loads(line) for line in stream.getvalue().splitlines()]
+    assert first["message"] == "Queued task.created event"
+    assert (first["service"], first["level"], first["task_id"]) == ("test-service", "INFO", 7)
+    assert second["level"] == "ERROR"
+    assert "ValueError: boom" in second["exception"]
+
+def test_category_filter_samples_and_rate_limits(monkeypatch):
+    """Test sampled categories keep every n-th record and limited ones cap records per second."""
+    now = [100.0]
+    monkeypatch.setattr("shared.logs.time.monotonic", lambda: now[0])
+    sampling = CategoryFilter(sample_rates=parse_categories("event.received=0.25"), rate_limits={"event.failed": 2})
+
+    kept = [entry for entry in (record("event.received") for _ in range(8)) if sampling.filter(entry)]
+    assert len(kept) == 2
+    assert all(entry.sample_rate == 0.25 for entry in kept)
+
+    assert [sampling.filter(record("event.failed")) for _ in range(5)] == [True, True, False, False, False]
+    now[0] += 1
+    resumed = record("event.failed")
+    assert sampling.filter(resumed)
+    assert resumed.suppressed == 3
+
+    # Records without a category are never dropped
+    assert all(sampling.filter(record()) for _ in range(10))
@@ -1,5 +1,8 @@
+import asyncio
+import json
+import os
 from fastapi.testclient import TestClient
-from services.notification_service.app.main import app
+from services.notification_service.app.main import NotificationService, app
 
 client = TestClient(app)
 
@@ -26,4 +29,369 @@ def test_notification_service_stats():
     data = response.json()
     assert data["service"] == "notification-service"
     assert "status" in data
-    assert "processed_events" in data
\ No newline at end of file
+    assert "processed_events" in data
+
+class FakeMessage:
+    def __init__(self, topic, value, partition=0, offset=0, headers=None):
+        self._topic = topic
+        self._value = json.dumps(value).encode("utf-8")
+        self._partition = partition
+        self._offset = offset
+        self._headers = headers
+
+    def error(self):
+        return None
+
+    def topic(self):
+        return self._topic
+
+    def partition(self):
+        return self._partition
+
+    def offset(self):
+        return self._offset
+
+    def headers(self):
+        return self._headers
+
+    def value(self):
+        return self._value
+
+class FakeConsumer:
+    """Stand-in for confluent_kafka.Consumer that stops the service once drained."""
+
+    def __init__(self, messages):
+        self.log = list(messages)
+        self.messages = list(messages)
+        self.service = None
+        self.commits = []
+        self.seeks = []
+        self.pauses = 0
+        self.resumes = 0
+        self.paused = False
+        self.closed = False
+
+    def subscribe(self, topics, on_assign=None, on_revoke=None):
+        self.topics = topics
+        self.on_revoke = on_revoke
+
+    def assignment(self):
+        return []
+
+    def get_watermark_offsets(self, partition, cached=False):
+        return 0, 10
+
+    def consume(self, num_messages, timeout):
+        if self.paused:
+            return []
+        if not self.messages:
+            # Drained once nothing is in flight or waiting to commit, which may still rewind a partition
+            if not self.service.in_flight and not self.service._batches:
+                self.service.stop()
+            return []
+        batch, self.messages = self.messages[:num_messages], self.messages[num_messages:]
+        return batch
+
+    def seek(self, partition):
+        """Read the partition again from the offset, as librdkafka does after dropping what it fetched."""
+        key = (partition.topic, partition.partition)
+        self.seeks.append((*key, partition.offset))
+        self.messages = [
+            msg for msg in self.log if (msg.topic(), msg.partition()) == key and msg.offset() >= partition.offset
+        ] + [msg for msg in self.messages if (msg.topic(), msg.partition()) != key]
+
+    def pause(self, partitions):
+        self.paused = True
+        self.pauses += 1
+
+    def resume(self, partitions):
+        self.paused = False
+        self.resumes += 1
+
+    def commit(self, offsets, asynchronous):
+        self.commits.append({(tp.topic, tp.partition): tp.offset for tp in offsets})
+
+    def close(self):
+        self.closed = True
+
+def make_service(messages, **kwargs):
+    consumer = FakeConsumer(messages)
+    service = NotificationService(consumer=consumer, poll_timeout=0, **kwargs)
+    consumer.service = service
+    return service, consumer
+
+def test_consume_events_in_batches_and_commits_offsets():
+    """Test batched consumption with a manual commit after each batch."""
+    messages = [
+        FakeMessage("user.created", {"id": i, "username": f"user{i}"}, partition=i % 2, offset=i // 2)
+        for i in range(10)
+    ]
+    service, consumer = make_service(messages, batch_size=4, workers=3)
+    seen = []
+    service.handlers["user.created"] = lambda event: seen.append(event["id"])
+
+    asyncio.run(service.consume_events())
+
+    assert sorted(seen) == list(range(10))
+    committed = {}
+    for commit in consumer.commits:
+        committed.update(commit)
+    assert committed == {("user.created", 0): 5, ("user.created", 1): 5}
+    assert consumer.closed
+
+def test_consume_events_pauses_when_in_flight_queue_is_full():
+    """Test backpressure pauses and resumes partitions."""
+    messages = [FakeMessage("task.created", {"id": i}, offset=i) for i in range(6)]
+    service, consumer = make_service(messages, batch_size=6, workers=1, max_in_flight=2)
+
+    async def slow_handler(event):
+        await asyncio.sleep(0)
+
+    service.handlers["task.created"] = slow_handler
+
+    asyncio.run(service.consume_events())
+
+    assert consumer.pauses >= 1
+    assert consumer.resumes >= 1
+    assert consumer.commits[-1] == {("task.created", 0): 6}
+
+def test_metrics_endpoint_reports_event_processing():
+    """Test /metrics exposes per-topic processing time and consumer lag."""
+    messages = [FakeMessage("task.created", {"id": 1, "title": "t", "user_id": 1}, offset=3)]
+    service, _ = make_service(messages)
+    asyncio.run(service.consume_events())
+
+    response = client.get("/metrics")
+    assert response.status_code == 200
+    assert 'event_processing_duration_seconds_count{topic="task.created"}' in response.text
+    assert 'kafka_consumer_lag_messages{group="notification-service",partition="0",topic="task.created"} 6.0' in response.text
+
+    client.get("/stats")
+    assert 'route="/stats"' in client.get("/metrics").text
+
+def test_handle_message_decodes_binary_events():
+    """Test msgpack-encoded events are dispatched and bad payloads are counted."""
+    from shared.serialization import EventSerializer
+
+    event = {"id": 5, "username": "bin", "email": "bin@example.com", "event_type": "user.created"}
+    binary = FakeMessage("user.created", None)
+    binary._value = EventSerializer("msgpack").encode("user.created", event)
+    garbage = FakeMessage("user.created", None)
+    garbage._value = b"\x00garbage"
+    service, _ = make_service([binary, garbage])
+    seen = []
+    service.handlers["user.created"] = seen.append
+
+    asyncio.run(service.consume_events())
+
+    assert seen == [event]
+    assert 'events_processed_total{outcome="decode_error",topic="user.created"}' in client.get("/metrics").text
+
+def test_rebalance_drains_and_commits_before_revoking():
+    """Test in-flight messages finish and are committed when partitions are revoked."""
+    from confluent_kafka import TopicPartition
+
+    class RebalancingConsumer(FakeConsumer):
+        calls = 0
+
+        def consume(self, num_messages, timeout):
+            self.calls += 1
+            if self.calls == 2:
+                self.on_revoke(self, [TopicPartition("task.created", 0)])
+                self.revoked_with = list(self.commits)
+            return super().consume(num_messages, timeout)
+
+    consumer = RebalancingConsumer([FakeMessage("task.created", {"id": i}, offset=i) for i in range(8)])
+    service = NotificationService(consumer=consumer, poll_timeout=0, batch_size=4, workers=2)
+    consumer.service = service
+    service.assigned = {("task.created", 0)}
+    handled = []
+
+    async def handler(event):
+        await asyncio.sleep(0.01)
+        handled.append(event["id"])
+
+    service.handlers["task.created"] = handler
+    asyncio.run(service.consume_events())
+
+    assert consumer.revoked_with[-1] == {("task.created", 0): 4}
+    assert service.assigned == set()
+    assert sorted(handled) == list(range(8))
+    assert service.snapshot()["status"] == "stopped"
+
+def test_consumer_process_pool_rolls_up_worker_stats(monkeypatch):
+    """Test worker processes report to /stats and /health and shut down cleanly."""
+    import time
+    from services.notification_service.app import main
+    from services.notification_service.app.workers import ConsumerProcessPool
+
+    # Nothing listens here, so the workers just poll empty until they are stopped
+    monkeypatch.setenv("KAFKA_BROKER", "127.0.0.1:1")
+    pool = ConsumerProcessPool(2, report_interval=0.1, shutdown_timeout=20)
+    monkeypatch.setattr(main, "consumer_pool", pool)
+    pool.start()
+    try:
+        deadline = time.monotonic() + 60
+        while client.get("/health").json()["status"] != "running" and time.monotonic() < deadline:
+            time.sleep(0.1)
+        health = client.get("/health").json()
+        assert health["status"] == "running"
+        assert health["workers_alive"] == 2
+
+        stats = client.get("/stats").json()
+        assert stats["service"] == "notification-service"
+        assert len({worker["pid"] for worker in stats["workers"]}) == 2
+    finally:
+        pool.stop()
+
+    stats = pool.stats()
+    assert stats["status"] == "stopped"
+    assert all(worker["status"] == "stopped" and not worker["alive"] for worker in stats["workers"])
+    assert pool.restarts == 0
+
+def seeded_worker(index, status_queue, report_interval):
+    """Pool worker that first puts three user.created events on its own in-memory bus."""
+    from services.notification_service.app.workers import _worker_main
+    from shared.event_bus import default_bus
+
+    for i in range(3):
+        default_bus().append("user.created", None, json.dumps({"id": i, "event_type": "user.created"}).encode())
+    _worker_main(index, status_queue, report_interval)
+
+def events_processed(text):
+    from prometheus_client.parser import text_string_to_metric_families
+
+    return sum(
+        sample.value
+        for family in text_string_to_metric_families(text) if family.name == "events_processed"
+        for sample in family.samples if sample.name == "events_processed_total" and sample.labels["topic"] == "user.created"
+    )
+
+def test_consumer_process_pool_metrics_reach_the_api_process():
+    """Test /metrics in the API process counts the events its worker processes handle."""
+    import time
+    from services.notification_service.app.workers import ConsumerProcessPool
+
+    before = events_processed(client.get("/metrics").text)
+    pool = ConsumerProcessPool(2, report_interval=0.1, shutdown_timeout=20, target=seeded_worker)
+    pool.start()
+    try:
+        deadline = time.monotonic() + 60
+        while events_processed(client.get("/metrics").text) < before + 6 and time.monotonic() < deadline:
+            time.sleep(0.1)
+        text = client.get("/metrics").text
+        assert events_processed(text) == before + 6
+        assert 'event_processing_duration_seconds_count{topic="user.created"}' in text
+    finally:
+        pool.stop()
+    assert "PROMETHEUS_MULTIPROC_DIR" not in os.environ
+
+def test_redelivered_events_are_handled_once():
+    """Test duplicate events are skipped and counted in /stats."""
+    from services.notification_service.app import main
+
+    messages = [FakeMessage("user.created", {"id": i % 3, "event_type": "user.created"}, offset=i) for i in range(6)]
+    service, _ = make_service(messages, workers=1)
+    seen = []
+    service.handlers["user.created"] = lambda event: seen.append(event["id"])
+    asyncio.run(service.consume_events())
+
+    assert sorted(seen) == [0, 1, 2]
+    assert service.dedup.stats()["duplicates"] == 3
+    assert service.dedup.stats()["duplicate_ratio"] == 0.5
+
+    main.consumer_service = service
+    try:
+        assert client.get("/stats").json()["dedup"]["duplicates"] == 3
+    finally:
+        main.consumer_service = None
+    assert 'events_processed_total{outcome="duplicate",topic="user.created"}' in client.get("/metrics").text
+
+def test_failed_events_are_retried_before_their_offset_is_committed():
+    """Test a failed event is read again from its offset, and later events are committed only after it."""
+    from services.notification_service.app.dedup import EventDeduplicator, LRUDedup
+
+    messages = [FakeMessage("task.created", {"id": i}, offset=i) for i in range(3)]
+    service, consumer = make_service(messages, workers=1, retry_backoff=0, dedup=EventDeduplicator(LRUDedup()))
+    service.assigned = {("task.created", 0)}
+    attempts = []
+
+    def flaky(event):
+        attempts.append(event["id"])
+        if attempts == [0]:
+            raise RuntimeError("smtp down")
+
+    service.handlers["task.created"] = flaky
+    asyncio.run(service.consume_events())
+
+    # Events after the failed one were handled once; their redelivery is skipped as a duplicate
+    assert attempts == [0, 1, 2, 0]
+    assert consumer.seeks == [("task.created", 0, 0)]
+    assert consumer.commits[0] == {("task.created", 0): 0}
+    assert consumer.commits[-1] == {("task.created", 0): 3}
+    assert service.dedup.stats()["duplicates"] == 2
+
+def test_events_claimed_elsewhere_are_not_committed_past():
+    """Test an event whose claim is still live elsewhere is read again rather than skipped."""
+    from services.notification_service.app.dedup import EventDeduplicator, LRUDedup
+
+    dedup = EventDeduplicator(LRUDedup(lease=60))
+    # A consumer that crashed mid-handler left its lease behind
+    asyncio.run(dedup.claim("task.created", {"id": 9}))
+    service, consumer = make_service([FakeMessage("task.created", {"id": 9})], workers=1, retry_backoff=0, dedup=dedup)
+    service.assigned = {("task.created", 0)}
+    seen = []
+    service.handlers["task.created"] = lambda event: seen.append(event["id"])
+
+    def expire_lease(partition):
+        dedup.backend._claimed.clear()
+        FakeConsumer.seek(consumer, partition)
+
+    consumer.seek = expire_lease
+    asyncio.run(service.consume_events())
+
+    assert seen == [9]
+    assert consumer.commits[0] == {("task.created", 0): 0}
+    assert consumer.commits[-1] == {("task.created", 0): 1}
+
+def test_lru_dedup_is_bounded():
+    """Test the in-memory backend forgets the oldest claims first."""
+    from services.notification_service.app.dedup import CLAIMED, DUPLICATE, IN_PROGRESS, LRUDedup
+
+    async def run():
+        backend = LRUDedup(max_entries=2)
+        assert [await backend.claim(key) for key in "abc"] == [CLAIMED] * 3
+        assert backend.size() == 2
+        assert await backend.claim("c") == IN_PROGRESS
+        await backend.complete("c")
+        assert await backend.claim("c") == DUPLICATE
+        assert await backend.claim("a") == CLAIMED
+
+        # A claim whose handler never finished lapses with its lease
+        leased = LRUDedup(lease=0)
+        await leased.claim("a")
+        assert await leased.claim("a") == CLAIMED
+
+    asyncio.run(run())
+
+def test_handled_events_record_end_to_end_latency_and_slo_breaches():
+    """Test write-stamped events record latency per stage and count handling later than the SLO."""
+    import time
+    from shared.tracing import EVENT_LATENCY_SLO_SECONDS
+
+    now = time.time()
+    late = now - EVENT_LATENCY_SLO_SECONDS - 1
+    stamped = lambda written_at, offset: FakeMessage(  # noqa: E731
+        "task.created",
+        {"id": 700 + offset, "title": "Traced", "user_id": 1, "event_type": "task.created"},
+        offset=offset,
+        headers=[("event-written-at", f"{written_at:.6f}".encode()), ("event-published-at", f"{written_at:.6f}".encode())],
+    )
+    service, _ = make_service([stamped(now, 0), stamped(late, 1)])
+
+    asyncio.run(service.consume_events())
+
+    metrics = client.get("/metrics").text
+    for stage in ("publish", "consume", "handled"):
+        assert f'event_latency_seconds_count{{stage="{stage}",topic="task.created"}}' in metrics
+    assert 'event_latency_slo_breaches_total{topic="task.created"}' in metrics
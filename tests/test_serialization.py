@@ -0,0 +1,68 @@
+import json
+import pytest
+from shared.event_schemas import TaskCreatedEvent
+from shared.serialization import EventDecodeError, EventSerializer, SchemaRegistry, default_registry
+
+USER_EVENT = {"id": 7, "username": "ann", "email": "ann@example.com", "event_type": "user.created"}
+TASK_EVENT = {"id": 3, "title": "t", "description": None, "user_id": 7, "event_type": "task.created"}
+
+def test_msgpack_round_trip_is_smaller_than_json():
+    """Test binary events decode to the original dict and take fewer bytes."""
+    serializer = EventSerializer("msgpack")
+    for topic, event in (("user.created", USER_EVENT), ("task.created", TASK_EVENT)):
+        payload = serializer.encode(topic, event)
+        assert payload[:1] == b"\x00"
+        assert serializer.decode(payload) == event
+        assert len(payload) < len(json.dumps(event))
+
+def test_decode_accepts_json_from_old_producers():
+    """Test a msgpack-configured consumer still reads JSON payloads."""
+    serializer = EventSerializer("msgpack")
+    assert serializer.decode(json.dumps(USER_EVENT).encode("utf-8")) == USER_EVENT
+    assert EventSerializer("json").encode("user.created", USER_EVENT) == json.dumps(USER_EVENT)
+
+def test_unknown_topics_stay_json():
+    """Test topics without a registered schema are encoded as JSON."""
+    assert EventSerializer("msgpack").encode("other", {"id": 1}) == json.dumps({"id": 1})
+
+def test_schema_ids_are_deterministic_and_versioned():
+    """Test ids derive from the schema so independent registries agree."""
+    first, second = default_registry(), default_registry()
+    assert first.latest("task.created").schema_id == second.latest("task.created").schema_id
+
+    class TaskCreatedV2(TaskCreatedEvent):
+        priority: int = 0
+
+    registry = default_registry()
+    v1 = registry.latest("task.created")
+    v2 = registry.register("task.created", 2, TaskCreatedV2)
+    assert registry.latest("task.created") is v2
+    assert v1.schema_id != v2.schema_id
+
+    # Events written with v1 remain readable after v2 is registered
+    old_payload = EventSerializer("msgpack", registry=first).encode("task.created", TASK_EVENT)
+    assert EventSerializer("msgpack", registry=registry).decode(old_payload) == TASK_EVENT
+
+def test_decode_errors():
+    """Test unknown schema ids and garbage payloads raise EventDecodeError."""
+    serializer = EventSerializer("msgpack", registry=SchemaRegistry())
+    payload = EventSerializer("msgpack").encode("user.created", USER_EVENT)
+    with pytest.raises(EventDecodeError):
+        serializer.decode(payload)
+    with pytest.raises(EventDecodeError):
+        serializer.decode(b"not json")
+    with pytest.raises(EventDecodeError):
+        serializer.decode(b"\x00\x01")
+
+def test_decode_rejects_bodies_that_do_not_fit_the_schema():
+    """Test a valid header followed by a scalar or short body, or a non-object JSON event, raises EventDecodeError."""
+    import msgpack
+    from shared.serialization import HEADER, MAGIC_BYTE
+
+    serializer = EventSerializer("msgpack")
+    schema = serializer.registry.latest("user.created")
+    for body in (7, "x", [1]):
+        with pytest.raises(EventDecodeError):
+            serializer.decode(HEADER.pack(MAGIC_BYTE, schema.schema_id) + msgpack.packb(body))
+    with pytest.raises(EventDecodeError):
+        serializer.decode(b"42")
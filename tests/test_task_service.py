@@ -1,8 +1,46 @@
+import json
+from concurrent.futures import Future
 from fastapi.testclient import TestClient
+from sqlalchemy import create_engine, func, insert, inspect, select, text
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import NullPool
+from services.task_service.app import db
 from services.task_service.app.main import app
+from services.task_service.app.models import OutboxEvent, Task
+from shared.migrations import upgrade
+from shared.outbox import OutboxRelay
+from shared.replicas import ReplicaSet
+from shared.async_db import async_url
+from shared.common_schemas import TaskRead
 
 client = TestClient(app)
 
+class FakeBroker:
+    """In-process stand-in for the Kafka producer used by the outbox relay."""
+
+    def __init__(self, fail=False, fail_keys=()):
+        self.fail = fail
+        self.fail_keys = set(fail_keys)
+        self.messages = []
+        self.headers = []
+
+    def produce(self, topic, key, value, headers=None):
+        future = Future()
+        if self.fail or key in self.fail_keys:
+            future.set_exception(RuntimeError("broker unavailable"))
+        else:
+            self.messages.append((topic, key, json.loads(value)))
+            self.headers.append(dict(headers or ()))
+            future.set_result(None)
+        return future
+
+def drain_outbox(broker):
+    relay = OutboxRelay(db.SessionLocal, OutboxEvent, broker)
+    while relay.run_once():
+        pass
+    return relay
+
 def test_create_task():
     """Test task creation."""
     response = client.post(
@@ -45,4 +83,399 @@ def test_get_tasks_by_user():
     assert isinstance(tasks, list)
     # Check if any task belongs to user 123
     user_tasks = [task for task in tasks if task["user_id"] == 123]
-    assert len(user_tasks) > 0
\ No newline at end of file
+    assert len(user_tasks) > 0
+
+def test_list_tasks_keyset_pagination():
+    """Test paging through tasks with limit and after."""
+    for i in range(3):
+        client.post("/tasks/", json={"title": f"Page Task {i}", "user_id": 7})
+
+    first = client.get("/tasks/", params={"limit": 2})
+    assert first.status_code == 200
+    assert len(first.json()) == 2
+    cursor = first.headers["X-Next-Cursor"]
+    assert cursor == str(first.json()[-1]["id"])
+
+    second = client.get("/tasks/", params={"limit": 2, "after": cursor})
+    assert second.status_code == 200
+    assert all(task["id"] > int(cursor) for task in second.json())
+
+def test_list_tasks_stream():
+    """Test streaming tasks as NDJSON."""
+    client.post("/tasks/", json={"title": "Streamed Task", "user_id": 8})
+
+    response = client.get("/tasks/", params={"stream": True})
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("application/x-ndjson")
+    lines = [json.loads(line) for line in response.text.splitlines()]
+    ids = [task["id"] for task in lines]
+    assert ids == sorted(ids)
+    assert any(task["title"] == "Streamed Task" for task in lines)
+
+def test_create_tasks_bulk():
+    """Test bulk task creation."""
+    response = client.post(
+        "/tasks/bulk",
+        json=[
+            {"title": "Bulk Task 1", "user_id": 42},
+            {"title": "Bulk Task 2", "description": "Second", "user_id": 42}
+        ]
+    )
+    assert response.status_code == 200
+    data = response.json()
+    assert data["errors"] == []
+    assert [task["title"] for task in data["created"]] == ["Bulk Task 1", "Bulk Task 2"]
+    assert data["created"][0]["id"] < data["created"][1]["id"]
+
+def test_async_db_stack(monkeypatch):
+    """Test the opt-in async SQLAlchemy stack against the same database."""
+    async_engine = create_async_engine(async_url(db.engine.url), poolclass=NullPool)
+    monkeypatch.setattr(db, "AsyncSessionLocal", async_sessionmaker(async_engine, expire_on_commit=False))
+
+    response = client.post("/tasks/", json={"title": "Async Task", "user_id": 99})
+    assert response.status_code == 200
+    task_id = response.json()["id"]
+
+    response = client.get("/tasks/user/99")
+    assert response.status_code == 200
+    assert task_id in [task["id"] for task in response.json()]
+
+    response = client.get("/tasks/", params={"stream": True, "after": task_id - 1})
+    assert json.loads(response.text.splitlines()[0])["id"] == task_id
+
+def test_outbox_relay_publishes_created_tasks_in_order():
+    """Test task.created events go through the outbox and are published once, in order."""
+    drain_outbox(FakeBroker())
+
+    task_id = client.post("/tasks/", json={"title": "Outbox Task", "user_id": 5}).json()["id"]
+    bulk = client.post("/tasks/bulk", json=[{"title": "Outbox Bulk", "user_id": 5}] * 3).json()
+
+    broker = FakeBroker()
+    relay = drain_outbox(broker)
+    published = [event["id"] for topic, key, event in broker.messages if topic == "task.created"]
+    assert published == [task_id] + [task["id"] for task in bulk["created"]]
+    assert broker.messages[0][1] == str(task_id)
+    assert relay.run_once() == 0
+
+def test_outbox_relay_retries_undelivered_events():
+    """Test events stay pending when the broker rejects them."""
+    drain_outbox(FakeBroker())
+    task_id = client.post("/tasks/", json={"title": "Retry Task", "user_id": 6}).json()["id"]
+
+    assert OutboxRelay(db.SessionLocal, OutboxEvent, FakeBroker(fail=True)).run_once() == 0
+
+    broker = FakeBroker()
+    drain_outbox(broker)
+    assert [event["id"] for _, _, event in broker.messages] == [task_id]
+
+def test_outbox_relay_keeps_order_when_an_event_fails_mid_batch():
+    """Test events after an undelivered one stay pending and are published again after it."""
+    drain_outbox(FakeBroker())
+    ids = [client.post("/tasks/", json={"title": f"Ordered Task {i}", "user_id": 6}).json()["id"] for i in range(3)]
+
+    assert OutboxRelay(db.SessionLocal, OutboxEvent, FakeBroker(fail_keys={str(ids[1])})).run_once() == 1
+
+    broker = FakeBroker()
+    drain_outbox(broker)
+    assert [event["id"] for topic, _, event in broker.messages if topic == "task.created"] == ids[1:]
+
+def test_outbox_relay_propagates_trace_context_and_write_time():
+    """Test the request's traceparent and the write time travel with the event as Kafka headers."""
+    drain_outbox(FakeBroker())
+    trace_id = "4bf92f3577b34da6a3ce929d0e0e4736"
+    response = client.post(
+        "/tasks/",
+        json={"title": "Traced Task", "user_id": 6},
+        headers={"traceparent": f"00-{trace_id}-00f067aa0ba902b7-01"},
+    )
+    assert response.status_code == 200
+
+    broker = FakeBroker()
+    drain_outbox(broker)
+    [headers] = broker.headers
+    assert headers["traceparent"].decode().split("-")[1] == trace_id
+    written_at = float(headers["event-written-at"])
+    assert written_at <= float(headers["event-published-at"])
+
+def test_get_tasks_by_user_cache_invalidated_on_create():
+    """Test the per-user task cache is refreshed after a write."""
+    client.post("/tasks/", json={"title": "Cached Task 1", "user_id": 321})
+    assert len(client.get("/tasks/user/321").json()) == 1
+    hits = client.get("/cache/stats").json()["hits"]
+    assert len(client.get("/tasks/user/321").json()) == 1
+    assert client.get("/cache/stats").json()["hits"] == hits + 1
+
+    client.post("/tasks/", json={"title": "Cached Task 2", "user_id": 321})
+    assert len(client.get("/tasks/user/321").json()) == 2
+
+def test_list_tasks_filters_and_sort_order():
+    """Test server-side filtering by user and title prefix, newest first."""
+    client.post(
+        "/tasks/bulk",
+        json=[
+            {"title": "report: q1", "user_id": 555},
+            {"title": "report: q2", "user_id": 555},
+            {"title": "review", "user_id": 555},
+            {"title": "report: other user", "user_id": 556}
+        ]
+    )
+
+    response = client.get("/tasks/", params={"user_id": 555, "title_prefix": "report", "order": "desc"})
+    assert response.status_code == 200
+    assert [task["title"] for task in response.json()] == ["report: q2", "report: q1"]
+
+    first = client.get("/tasks/", params={"user_id": 555, "order": "desc", "limit": 1})
+    second = client.get("/tasks/", params={"user_id": 555, "order": "desc", "limit": 1, "after": first.headers["X-Next-Cursor"]})
+    assert [task["title"] for task in first.json() + second.json()] == ["review", "report: q2"]
+
+def test_task_stats_follow_creates():
+    """Test per-user stats are updated with single and bulk creates and served per user and in pages."""
+    first = client.post("/tasks/", json={"title": "Stats 1", "user_id": 901}).json()
+    bulk = client.post("/tasks/bulk", json=[{"title": "Stats 2", "user_id": 901}, {"title": "Stats 3", "user_id": 902}]).json()
+
+    response = client.get("/tasks/stats/901")
+    assert response.status_code == 200
+    assert response.json() == {
+        "user_id": 901, "task_count": 2, "latest_task_id": bulk["created"][0]["id"], "latest_task_title": "Stats 2"
+    }
+    assert first["id"] < bulk["created"][0]["id"]
+    assert client.get("/tasks/stats/902").json()["task_count"] == 1
+    assert client.get("/tasks/stats/903").json() == {
+        "user_id": 903, "task_count": 0, "latest_task_id": None, "latest_task_title": None
+    }
+
+    page = client.get("/tasks/stats", params={"after": 900, "limit": 1})
+    assert [stats["user_id"] for stats in page.json()] == [901]
+    assert page.headers["X-Next-Cursor"] == "901"
+    rest = client.get("/tasks/stats", params={"after": 901, "limit": 1000}).json()
+    assert rest[0]["user_id"] == 902
+
+def test_rebuild_stats_recomputes_from_tasks():
+    """Test the rebuild replaces drifted stats with counts from the tasks table."""
+    from services.task_service.app.models import TaskUserStats
+    from services.task_service.app.stats import rebuild_stats
+
+    client.post("/tasks/", json={"title": "Rebuilt 1", "user_id": 911})
+    with db.engine.begin() as conn:
+        # Written around the API, so the stats do not know about it
+        conn.execute(insert(Task), [{"title": "Rebuilt 2", "user_id": 911}, {"title": "Rebuilt 3", "user_id": 912}])
+
+    users, tasks = rebuild_stats(db.engine, batch_size=2)
+
+    with db.engine.connect() as conn:
+        assert tasks == conn.execute(select(func.count()).select_from(Task)).scalar()
+        assert users == conn.execute(select(func.count(Task.user_id.distinct()))).scalar()
+        assert users == conn.execute(select(func.count()).select_from(TaskUserStats)).scalar()
+    stats = client.get("/tasks/stats/911").json()
+    assert (stats["task_count"], stats["latest_task_title"]) == (2, "Rebuilt 2")
+    assert client.get("/tasks/stats/912").json()["task_count"] == 1
+
+def test_read_endpoints_answer_304_until_a_write_bumps_the_version():
+    """Test ETag and Last-Modified validators hold until the user's or the table's version changes."""
+    client.post("/tasks/", json={"title": "Versioned 1", "user_id": 921})
+    first = client.get("/tasks/user/921")
+    etag = first.headers["ETag"]
+    assert etag.startswith('W/"')
+    assert first.headers["Cache-Control"] == "no-cache"
+
+    unchanged = client.get("/tasks/user/921", headers={"If-None-Match": etag})
+    assert unchanged.status_code == 304
+    assert unchanged.content == b""
+    assert client.get("/tasks/user/921", headers={"If-Modified-Since": first.headers["Last-Modified"]}).status_code == 304
+
+    listed = client.get("/tasks/", params={"limit": 5})
+    stats = client.get("/tasks/stats/921")
+    # A write for another user leaves this user's validators alone but changes the table's
+    client.post("/tasks/", json={"title": "Versioned other", "user_id": 922})
+    assert client.get("/tasks/user/921", headers={"If-None-Match": etag}).status_code == 304
+    assert client.get("/tasks/", params={"limit": 5}, headers={"If-None-Match": listed.headers["ETag"]}).status_code == 200
+
+    client.post("/tasks/bulk", json=[{"title": "Versioned 2", "user_id": 921}])
+    changed = client.get("/tasks/user/921", headers={"If-None-Match": etag})
+    assert changed.status_code == 200
+    assert changed.headers["ETag"] != etag
+    assert [task["title"] for task in changed.json()] == ["Versioned 1", "Versioned 2"]
+    assert client.get("/tasks/stats/921", headers={"If-None-Match": stats.headers["ETag"]}).json()["task_count"] == 2
+
+def test_large_responses_are_gzipped():
+    """Test list responses above GZIP_MIN_SIZE are compressed for clients that accept gzip."""
+    client.post("/tasks/bulk", json=[{"title": f"Compressed {i}", "description": "x" * 40, "user_id": 931} for i in range(40)])
+
+    response = client.get("/tasks/user/931", headers={"Accept-Encoding": "gzip"})
+    assert response.headers["Content-Encoding"] == "gzip"
+    assert len(response.json()) == 40
+    assert "Content-Encoding" not in client.get("/health", headers={"Accept-Encoding": "gzip"}).headers
+
+def test_migrate_creates_missing_indexes():
+    """Test migrations add indexes to an existing tasks table."""
+    with db.engine.begin() as conn:
+        conn.execute(text("DROP INDEX IF EXISTS ix_tasks_user_id_id"))
+    # Migrations run from a fresh process; pooled SQLite connections may still cache the old schema
+    db.engine.dispose()
+
+    upgrade(db.engine, db.Base.metadata)
+
+    assert "ix_tasks_user_id_id" in {index["name"] for index in inspect(db.engine).get_indexes("tasks")}
+
+def test_concurrent_index_leaves_the_shared_metadata_alone():
+    """Test CREATE INDEX CONCURRENTLY is compiled from a copy, not by flagging the models' index."""
+    from sqlalchemy.dialects import postgresql
+    from sqlalchemy.schema import CreateIndex
+    from shared.migrations import concurrent_index
+
+    [index] = [index for index in Task.__table__.indexes if index.name == "ix_tasks_user_id_id"]
+    ddl = str(CreateIndex(concurrent_index(index)).compile(dialect=postgresql.dialect()))
+
+    assert ddl.startswith("CREATE INDEX CONCURRENTLY ix_tasks_user_id_id ON tasks")
+    assert index.dialect_options["postgresql"]["concurrently"] is False
+    assert "CONCURRENTLY" not in str(CreateIndex(index).compile(dialect=postgresql.dialect()))
+
+def test_migrate_adds_missing_nullable_columns(tmp_path):
+    """Test migrations add new nullable columns to a table created before them."""
+    engine = create_engine(f"sqlite:///{tmp_path}/old.db")
+    with engine.begin() as conn:
+        conn.execute(text(
+            "CREATE TABLE task_outbox (id INTEGER PRIMARY KEY, topic VARCHAR NOT NULL, key VARCHAR, "
+            "payload TEXT NOT NULL, created_at DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP, published_at DATETIME)"
+        ))
+
+    upgrade(engine, db.Base.metadata)
+
+    assert "headers" in {column["name"] for column in inspect(engine).get_columns("task_outbox")}
+    engine.dispose()
+
+def test_metrics_endpoint_reports_route_latency_and_pool_wait():
+    """Test /metrics exposes per-route latency histograms and pool checkout wait."""
+    client.get("/tasks/user/1")
+
+    response = client.get("/metrics")
+    assert response.status_code == 200
+    assert 'route="/tasks/user/{user_id}"' in response.text
+    assert 'http_requests_in_flight{service="task-service"}' in response.text
+    assert 'db_pool_checkout_wait_seconds_count{engine="sync",service="task-service"}' in response.text
+
+def test_debug_pool_reports_pool_status():
+    """Test /debug/pool serves saturation and checkout wait statistics for the service's engines."""
+    client.get("/tasks/")
+
+    response = client.get("/debug/pool")
+    assert response.status_code == 200
+    data = response.json()
+    assert data["service"] == "task-service"
+    pool = data["pools"]["sync"]
+    assert pool["checkouts"] > 0
+    assert pool["checked_out"] == 0
+    assert {"p50", "p95", "p99", "max"} <= pool["checkout_wait_seconds"].keys()
+
+def replica_sessionmaker(path, *titles):
+    """A second SQLite file standing in for a read replica, holding only the given tasks for user 4242."""
+    replica = create_engine(f"sqlite:///{path}")
+    upgrade(replica, db.Base.metadata)
+    with replica.begin() as connection:
+        connection.execute(insert(Task), [{"title": title, "user_id": 4242} for title in titles])
+    return sessionmaker(bind=replica)
+
+def replica_titles(http):
+    return [task["title"] for task in http.get("/tasks/", params={"user_id": 4242}).json()]
+
+def test_reads_use_replicas_round_robin_until_the_client_writes(tmp_path, monkeypatch):
+    """Test reads alternate between replicas and a writer reads from the primary right after writing."""
+    replicas = ReplicaSet(
+        "task-service",
+        [replica_sessionmaker(tmp_path / "a.db", "On A"), replica_sessionmaker(tmp_path / "b.db", "On B")],
+        retry_after=10,
+        wrap=db._as_async,
+    )
+    monkeypatch.setattr(db, "replicas", replicas)
+    http = TestClient(app)
+
+    assert [replica_titles(http) for _ in range(3)] == [["On A"], ["On B"], ["On A"]]
+    response = http.get("/tasks/", params={"user_id": 4242, "stream": True})
+    assert [json.loads(line)["title"] for line in response.text.splitlines()] == ["On B"]
+
+    # The replicas never see this write; the writer still reads it back
+    assert http.post("/tasks/", json={"title": "On primary", "user_id": 4242}).status_code == 200
+    assert replica_titles(http) == ["On primary"]
+
+    http.cookies.clear()
+    assert replica_titles(http) == ["On A"]
+
+def test_reads_fall_back_to_primary_when_replica_is_down(tmp_path, monkeypatch):
+    """Test an unreachable replica is skipped and reads are served by the primary."""
+    client.post("/tasks/", json={"title": "Fallback", "user_id": 4243})
+    broken = sessionmaker(bind=create_engine(f"sqlite:///{tmp_path}/missing/replica.db"))
+    replicas = ReplicaSet("task-service", [broken], retry_after=10, wrap=db._as_async)
+    monkeypatch.setattr(db, "replicas", replicas)
+
+    response = TestClient(app).get("/tasks/", params={"user_id": 4243})
+    assert response.status_code == 200
+    assert [task["title"] for task in response.json()] == ["Fallback"]
+    assert replicas.down_until[0] > 0
+
+COLD_START = """
+import time
+start = time.perf_counter()
+from fastapi.testclient import TestClient
+from services.task_service.app.main import app, kafka_producer, outbox_relay
+imported = time.perf_counter() - start
+client = TestClient(app)
+assert client.get("/ready").status_code == 503
+with client:
+    assert client.get("/ready").json() == {"status": "ready"}
+    ready = time.perf_counter() - start
+    # The relay has polled the empty outbox; stopped, it cannot publish the task created below
+    outbox_relay.stop()
+    assert not kafka_producer.started
+    assert client.post("/tasks/", json={"title": "t", "user_id": 1}).status_code == 200
+    assert not kafka_producer.started
+print(imported, ready)
+"""
+
+def test_cold_start_migrates_and_warms_pool_without_touching_kafka(tmp_path):
+    """Test a fresh process imports quickly, becomes ready after the lifespan, and connects to Kafka lazily."""
+    import os
+    import subprocess
+    import sys
+
+    # The real Kafka client, pointed at nothing: with conftest's in-memory bus the check would prove nothing
+    env = {
+        **os.environ,
+        "DATABASE_URL": f"sqlite:///{tmp_path}/cold.db",
+        "EVENT_TRANSPORT": "kafka",
+        "KAFKA_BROKER": "127.0.0.1:1",
+    }
+    result = subprocess.run(
+        [sys.executable, "-c", COLD_START], capture_output=True, text=True, env=env, timeout=120,
+        cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+    )
+    assert result.returncode == 0, result.stderr
+    imported, ready = map(float, result.stdout.split())
+    print(f"cold start: import {imported:.3f}s, ready {ready:.3f}s")
+    assert ready < 10
+
+def test_ready_fails_until_startup_completes():
+    """Test /ready reports 503 while the lifespan has not run and /health stays live."""
+    assert client.get("/ready").status_code == 503
+    assert client.get("/health").status_code == 200
+
+def test_list_fast_path_matches_response_model_json():
+    """Test the orjson column path returns the exact bytes the response_model path produced."""
+    from fastapi.encoders import jsonable_encoder
+    from fastapi.responses import JSONResponse
+    from pydantic import TypeAdapter
+    from services.task_service.app.models import Task
+
+    for title, description in (("plain", None), ("ünïcode – “quotes”", "line\nbreak \\ slash")):
+        client.post("/tasks/", json={"title": title, "description": description, "user_id": 4242})
+
+    response = client.get("/tasks/", params={"user_id": 4242})
+    with db.SessionLocal() as session:
+        tasks = session.scalars(select(Task).where(Task.user_id == 4242).order_by(Task.id)).all()
+        adapter = TypeAdapter(list[TaskRead])
+        expected = JSONResponse(jsonable_encoder(adapter.dump_python(adapter.validate_python(tasks, from_attributes=True)))).body
+        expected_lines = "".join(TaskRead.model_validate(task, from_attributes=True).model_dump_json() + "\n" for task in tasks)
+
+    assert response.headers["content-type"] == "application/json"
+    assert response.content == expected
+    assert client.get("/tasks/user/4242").content == expected
+    assert client.get("/tasks/", params={"user_id": 4242, "stream": True}).text == expected_lines
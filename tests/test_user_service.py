@@ -48,4 +48,126 @@ def test_get_user():
 def test_get_nonexistent_user():
     """Test getting a non-existent user."""
     response = client.get("/users/99999")
-    assert response.status_code == 404
\ No newline at end of file
+    assert response.status_code == 404
+
+def test_list_users_keyset_pagination():
+    """Test paging through users with limit and after."""
+    for i in range(3):
+        client.post(
+            "/users/",
+            json={"username": f"pageuser{i}", "email": f"pageuser{i}@example.com", "password": "testpass123"}
+        )
+
+    first = client.get("/users/", params={"limit": 2})
+    assert first.status_code == 200
+    assert len(first.json()) == 2
+    cursor = first.headers["X-Next-Cursor"]
+
+    second = client.get("/users/", params={"limit": 2, "after": cursor})
+    assert second.status_code == 200
+    assert all(user["id"] > int(cursor) for user in second.json())
+
+def test_create_users_bulk_reports_duplicates():
+    """Test bulk user creation with per-item errors."""
+    client.post(
+        "/users/",
+        json={"username": "bulkexisting", "email": "bulkexisting@example.com", "password": "testpass123"}
+    )
+
+    response = client.post(
+        "/users/bulk",
+        json=[
+            {"username": "bulknew1", "email": "bulknew1@example.com", "password": "testpass123"},
+            {"username": "bulkexisting", "email": "other@example.com", "password": "testpass123"},
+            {"username": "bulknew1", "email": "bulknew1b@example.com", "password": "testpass123"},
+            {"username": "bulknew2", "email": "bulknew2@example.com", "password": "testpass123"}
+        ]
+    )
+    assert response.status_code == 200
+    data = response.json()
+    assert [user["username"] for user in data["created"]] == ["bulknew1", "bulknew2"]
+    assert [error["index"] for error in data["errors"]] == [1, 2]
+
+def test_get_user_is_cached():
+    """Test repeated lookups are served from the cache."""
+    user_id = client.post(
+        "/users/",
+        json={"username": "cacheduser", "email": "cacheduser@example.com", "password": "testpass123"}
+    ).json()["id"]
+
+    client.get(f"/users/{user_id}")
+    before = client.get("/cache/stats").json()
+    response = client.get(f"/users/{user_id}")
+    after = client.get("/cache/stats").json()
+
+    assert response.json()["username"] == "cacheduser"
+    assert after["hits"] == before["hits"] + 1
+    assert after["backend"] == "memory"
+
+def test_passwords_are_hashed_and_login_verifies_them():
+    """Test passwords are stored as argon2 hashes and checked by /users/login."""
+    from services.user_service.app.db import SessionLocal
+    from services.user_service.app.models import User
+
+    created = client.post(
+        "/users/",
+        json={"username": "loginuser", "email": "loginuser@example.com", "password": "s3cret-pass"}
+    ).json()
+    with SessionLocal() as db:
+        stored = db.get(User, created["id"]).password
+    assert stored.startswith("$argon2id$")
+
+    response = client.post("/users/login", json={"username": "loginuser", "password": "s3cret-pass"})
+    assert response.status_code == 200
+    assert response.json() == created
+    assert client.post("/users/login", json={"username": "loginuser", "password": "wrong"}).status_code == 401
+    assert client.post("/users/login", json={"username": "nobody", "password": "wrong"}).status_code == 401
+
+def test_login_upgrades_legacy_plaintext_passwords():
+    """Test rows written before hashing still log in and are rehashed on success."""
+    from services.user_service.app.db import SessionLocal
+    from services.user_service.app.models import User
+
+    with SessionLocal() as db:
+        user = User(username="legacyuser", email="legacyuser@example.com", password="plain-old")
+        db.add(user)
+        db.commit()
+        user_id = user.id
+
+    assert client.post("/users/login", json={"username": "legacyuser", "password": "nope"}).status_code == 401
+    assert client.post("/users/login", json={"username": "legacyuser", "password": "plain-old"}).status_code == 200
+    with SessionLocal() as db:
+        assert db.get(User, user_id).password.startswith("$argon2id$")
+    assert client.post("/users/login", json={"username": "legacyuser", "password": "plain-old"}).status_code == 200
+
+def test_only_committed_writes_pin_reads_to_the_primary():
+    """Test the read_primary_until cookie is set by committed writes, not by plain logins or rejected requests."""
+    from services.user_service.app.db import SessionLocal
+    from services.user_service.app.models import User
+    from shared.replicas import READ_PRIMARY_COOKIE
+
+    user = {"username": "pinuser", "email": "pinuser@example.com", "password": "s3cret-pass"}
+    assert READ_PRIMARY_COOKIE in client.post("/users/", json=user).cookies
+
+    login = {"username": "pinuser", "password": "s3cret-pass"}
+    assert READ_PRIMARY_COOKIE not in client.post("/users/login", json=login).cookies
+    assert READ_PRIMARY_COOKIE not in client.post("/users/login", json={**login, "password": "wrong"}).cookies
+
+    with SessionLocal() as db:
+        db.add(User(username="pinlegacy", email="pinlegacy@example.com", password="plain-old"))
+        db.commit()
+    # Rehashing a legacy password is a write
+    assert READ_PRIMARY_COOKIE in client.post("/users/login", json={"username": "pinlegacy", "password": "plain-old"}).cookies
+
+def test_get_user_and_list_users_support_conditional_requests():
+    """Test unchanged users answer 304 and a new user changes the list's validator."""
+    user_id = client.post(
+        "/users/", json={"username": "etag_user", "email": "etag@example.com", "password": "secret"}
+    ).json()["id"]
+    etag = client.get(f"/users/{user_id}").headers["ETag"]
+    assert client.get(f"/users/{user_id}", headers={"If-None-Match": etag}).status_code == 304
+
+    listed = client.get("/users/")
+    assert client.get("/users/", headers={"If-None-Match": listed.headers["ETag"]}).status_code == 304
+    client.post("/users/", json={"username": "etag_user2", "email": "etag2@example.com", "password": "secret"})
+    assert client.get("/users/", headers={"If-None-Match": listed.headers["ETag"]}).status_code == 200